@@ -0,0 +1,85 @@
+"""
+Check that mini_smsc keeps delivering when a UE registers a Contact its
+IPv4 socket cannot send to (IPv6, broadcast): the binding must fall back to
+the REGISTER's source address, and A2P MESSAGEs must still arrive there.
+
+    python bench/check_contacts.py
+
+Exits non-zero on failure; the SMSC log is kept in bench/logs/check_contacts_smsc.log.
+"""
+import os
+import socket
+import sys
+import time
+import uuid
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+from run_bench import REPO_DIR, SIP_DOMAIN, await_response, free_port, sip_request, start_process, wait_http  # noqa: E402
+
+CONTACT_HOSTS = ["[::1]:5070", "255.255.255.255", "224.0.0.1:5060"]
+
+
+def check(smsc_url, smsc_addr, host):
+    user = f"contact{uuid.uuid4().hex[:8]}"
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(5)
+    try:
+        call_id = f"reg-{uuid.uuid4().hex}"
+        sock.sendto(sip_request("REGISTER", user, user, sock.getsockname()[1], call_id,
+                                contact=f"sip:{user}@{host}"), smsc_addr)
+        if not await_response(sock, call_id):
+            return "REGISTER rejected"
+        resp = requests.post(f"{smsc_url}/sms/send", json={"to": f"sip:{user}@{SIP_DOMAIN}", "body": "contact check"},
+                             timeout=5)
+        target = resp.json().get("target")
+        expected = str(sock.getsockname())
+        if target != expected:
+            return f"bound to {target}, expected the source address {expected}"
+        try:
+            data, addr = sock.recvfrom(65535)
+        except socket.timeout:
+            return "MESSAGE never arrived"
+        if not data.startswith(b"MESSAGE "):
+            return f"expected a MESSAGE, got {data[:40]!r}"
+        head = data.split(b"\r\n\r\n", 1)[0].split(b"\r\n")
+        keep = [line for line in head[1:] if line.split(b":", 1)[0].lower() in (b"via", b"from", b"to", b"call-id", b"cseq")]
+        sock.sendto(b"\r\n".join([b"SIP/2.0 200 OK"] + keep + [b"Content-Length: 0", b"", b""]), addr)
+        delivery_id = resp.json()["id"]
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            state = requests.get(f"{smsc_url}/sms/deliveries/{delivery_id}", timeout=5).json().get("state")
+            if state == "delivered":
+                return None
+            time.sleep(0.1)
+        return f"delivery {delivery_id} still {state}"
+    finally:
+        sock.close()
+
+
+def main():
+    log_dir = os.path.join(BENCH_DIR, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    api_port, sip_port = free_port(), free_port(socket.SOCK_DGRAM)
+    smsc_url = f"http://127.0.0.1:{api_port}"
+    proc = start_process([sys.executable, "smsc.py"],
+                         {"SIP_IP": "127.0.0.1", "SIP_PORT": str(sip_port), "API_PORT": str(api_port)},
+                         os.path.join(log_dir, "check_contacts_smsc.log"), cwd=os.path.join(REPO_DIR, "mini_smsc"))
+    failures = 0
+    try:
+        wait_http(f"{smsc_url}/metrics")
+        for host in CONTACT_HOSTS:
+            error = check(smsc_url, ("127.0.0.1", sip_port), host)
+            print(f"Contact {host:20s} {'ok' if error is None else 'FAILED: ' + error}")
+            failures += error is not None
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Stand-in AMF for exercising /location without a 5G core.
+
+Implements just what the NEF uses:
+  - Namf_EventExposure: POST/DELETE /namf-evts/v1/subscriptions (anyUE or per
+    SUPI LOCATION_REPORT, with immediate reports), notifications on moves
+  - Namf_Location: POST /namf-loc/v1/{supi}/provide-loc-info
+and a test interface to move UEs and see how often the NEF asked:
+  - POST /test/ues/{supi}/location {"ncgi": "20893000000020"}
+  - GET  /test/stats
+
+    python bench/fake_amf.py --ue imsi-208930000000003=20893000000010
+    AMF_URL=http://localhost:8000 NEF_CALLBACK_URL=http://localhost:9090 python mini_nef/app.py
+
+--move-every N moves every UE to a random cell of --cells every N seconds.
+"""
+import argparse
+import csv
+import datetime
+import itertools
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, request, jsonify
+
+app = Flask(__name__)
+
+SUBSCRIPTION_LIFETIME = 3600
+
+ues = {}            # supi -> (ncgi, tac, observed_at)
+subscriptions = {}  # id -> AmfEventSubscription
+stats = Counter()
+lock = threading.Lock()
+subscription_ids = itertools.count(1)
+notifier = ThreadPoolExecutor(max_workers=8, thread_name_prefix="notify")
+http = requests.Session()
+
+
+def iso(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).isoformat(timespec="milliseconds") \
+        .replace("+00:00", "Z")
+
+
+def user_location(ncgi, tac, observed_at):
+    plmn = {"mcc": ncgi[:3], "mnc": ncgi[3:-9]}
+    return {
+        "nrLocation": {
+            "tai": {"plmnId": plmn, "tac": f"{tac:06x}"},
+            "ncgi": {"plmnId": plmn, "nrCellId": ncgi[-9:]},
+            "ueLocationTimestamp": iso(observed_at),
+        }
+    }
+
+
+def location_report(supi, ue):
+    return {
+        "type": "LOCATION_REPORT",
+        "state": {"active": True},
+        "timeStamp": iso(time.time()),
+        "supi": supi,
+        "location": user_location(*ue),
+    }
+
+
+def wants(subscription, supi):
+    events = subscription.get("eventList") or []
+    return any(e.get("type") == "LOCATION_REPORT" for e in events) and \
+        (subscription.get("anyUE") or subscription.get("supi") == supi)
+
+
+def notify(subscription, reports):
+    body = {"notifyCorrelationId": subscription.get("notifyCorrelationId"), "reportList": reports}
+    try:
+        resp = http.post(subscription["eventNotifyUri"], json=body, timeout=5)
+        stats["notifications"] += 1
+        if resp.status_code >= 300:
+            print(f"[AMF] Notification to {subscription['eventNotifyUri']} returned {resp.status_code}")
+    except requests.RequestException as e:
+        stats["notification_failures"] += 1
+        print(f"[AMF] Notification to {subscription['eventNotifyUri']} failed: {e}")
+
+
+def move(supi, ncgi, tac=1):
+    """Put the UE in a cell now and report it to every matching subscription."""
+    with lock:
+        ues[supi] = ue = (ncgi, tac, time.time())
+        targets = [s for s in subscriptions.values() if wants(s, supi)]
+    stats["moves"] += 1
+    for subscription in targets:
+        notifier.submit(notify, subscription, [location_report(supi, ue)])
+
+
+@app.route('/namf-evts/v1/subscriptions', methods=['POST'])
+def create_subscription():
+    subscription = (request.get_json(silent=True) or {}).get("subscription")
+    if not subscription or not subscription.get("eventNotifyUri"):
+        return jsonify({"status": 400, "cause": "MANDATORY_IE_MISSING"}), 400
+    subscription_id = str(next(subscription_ids))
+    subscription = dict(subscription, expiry=iso(time.time() + SUBSCRIPTION_LIFETIME))
+    with lock:
+        subscriptions[subscription_id] = subscription
+        immediate = any(e.get("immediateFlag") for e in subscription.get("eventList") or [])
+        reports = [location_report(supi, ue) for supi, ue in ues.items() if wants(subscription, supi)] \
+            if immediate else []
+    stats["subscriptions"] += 1
+    print(f"[AMF] Subscription {subscription_id} -> {subscription['eventNotifyUri']}")
+    body = {"subscription": subscription, "subscriptionId": subscription_id}
+    if reports:
+        body["reportList"] = reports
+    response = jsonify(body)
+    response.headers["Location"] = f"{request.host_url.rstrip('/')}/namf-evts/v1/subscriptions/{subscription_id}"
+    return response, 201
+
+
+@app.route('/namf-evts/v1/subscriptions/<subscription_id>', methods=['DELETE'])
+def delete_subscription(subscription_id):
+    with lock:
+        removed = subscriptions.pop(subscription_id, None)
+    if removed is None:
+        return jsonify({"status": 404, "cause": "SUBSCRIPTION_NOT_FOUND"}), 404
+    return '', 204
+
+
+@app.route('/namf-loc/v1/<ue_context_id>/provide-loc-info', methods=['POST'])
+def provide_location_info(ue_context_id):
+    stats["provide_loc_info"] += 1
+    with lock:
+        ue = ues.get(ue_context_id)
+        if ue is None:
+            return jsonify({"status": 404, "cause": "CONTEXT_NOT_FOUND"}), 404
+        # Positioning on demand: the UE is where it was, observed now
+        ues[ue_context_id] = ue = (ue[0], ue[1], time.time())
+    return jsonify({"currentLoc": True, "location": user_location(*ue)})
+
+
+@app.route('/test/ues/<supi>/location', methods=['POST'])
+def test_move(supi):
+    body = request.get_json(silent=True) or {}
+    ncgi = str(body.get("ncgi", ""))
+    if len(ncgi) not in (14, 15):
+        return jsonify({"error": "ncgi must be MCC + MNC + 9 hex digit NCI"}), 400
+    move(supi, ncgi, int(body.get("tac", 1)))
+    return '', 204
+
+
+@app.route('/test/stats', methods=['GET'])
+def test_stats():
+    with lock:
+        return jsonify(dict(stats, ues=len(ues), active_subscriptions=len(subscriptions)))
+
+
+def read_cells(path):
+    with open(path, newline="") as f:
+        rows = csv.DictReader(line for line in f if not line.lstrip().startswith("#"))
+        return [(f"{r['mcc']}{r['mnc']}{r['nci'].lower().replace('0x', '').zfill(9)}", int(r.get("tac") or 1))
+                for r in rows]
+
+
+def wander(cells, interval):
+    while True:
+        time.sleep(interval)
+        for supi in list(ues):
+            move(supi, *random.choice(cells))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stand-in AMF (event exposure + location) for mini-nef tests")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ue", action="append", default=[], metavar="SUPI=NCGI",
+                        help="UE known to the AMF and its serving cell (repeatable)")
+    parser.add_argument("--cells", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "cells.csv"),
+                        help="Cell catalogue --move-every picks from")
+    parser.add_argument("--move-every", type=float, default=0, help="Move every UE to a random cell every N seconds")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for spec in args.ue:
+        supi, _, ncgi = spec.partition("=")
+        ues[supi] = (ncgi or "20893000000010", 1, time.time())
+    if args.move_every > 0:
+        threading.Thread(target=wander, args=(read_cells(args.cells), args.move_every), daemon=True).start()
+    app.run(host=args.host, port=args.port, threaded=True)
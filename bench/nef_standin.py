@@ -0,0 +1,49 @@
+"""
+Run mini_nef against an in-memory Mongo stand-in (mongomock) seeded with
+synthetic PDU sessions. Everything else (UDM, SMSC) is reached over HTTP as
+configured through the usual environment variables.
+
+    python bench/nef_standin.py --port 19090 --sessions 10000
+"""
+import argparse
+import os
+import sys
+
+import mongomock
+import pymongo
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from standins import supi_for, ue_ip_for  # noqa: E402
+
+NEF_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mini_nef")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mini_nef with a mongomock session store")
+    parser.add_argument("--port", type=int, default=19090)
+    parser.add_argument("--sessions", type=int, default=10000, help="Synthetic PDU sessions to seed")
+    parser.add_argument("--no-index", action="store_true",
+                        help="Skip the in-memory session index and query the DB on every miss")
+    args = parser.parse_args()
+
+    # One shared in-memory server for every MongoClient the NEF creates
+    store = mongomock.MongoClient()
+    pymongo.MongoClient = lambda *a, **kw: store
+
+    db = store[os.environ.get("DB_NAME", "free5gc")]
+    db["smf_context"].insert_many(
+        {"supi": supi_for(i), "pduSessions": [{"ipv4Addr": ue_ip_for(i)}]} for i in range(args.sessions)
+    )
+
+    # The change stream follower needs a replica set; load the index directly instead
+    os.environ["SESSION_INDEX"] = "0"
+    sys.path.insert(0, NEF_DIR)
+    import app as nef
+
+    if not args.no_index:
+        nef.load_sessions(nef.upstream.db)
+    nef.app.run(host="127.0.0.1", port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Load test for mini_nef and mini_smsc on loopback, no free5GC stack needed.
+
+Starts a fake UDM (in-process), mini_nef on a mongomock session store and
+mini_smsc on loopback UDP, then drives each scenario at the requested
+concurrency and reports throughput and p50/p95/p99 latency.
+
+    pip install -r bench/requirements.txt
+    python bench/run_bench.py --requests 5000 --concurrency 32 --output bench_results.json
+
+Scenarios: identity, identity_batch, sms_send, sip_register, sip_message.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+from standins import FakeUDM, ue_ip_for  # noqa: E402
+
+SCENARIOS = ["identity", "identity_batch", "sms_send", "sip_register", "sip_message"]
+SIP_DOMAIN = "free5gc.org"
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    s = socket.socket(socket.AF_INET, kind)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def wait_http(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def run_scenario(name, op, total, concurrency):
+    """Run op(worker_state, i) total times over 'concurrency' threads; op returns True on success."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker(worker_id):
+        state = {"id": worker_id}
+        local = []
+        failed = 0
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            try:
+                ok = op(state, i)
+            except Exception:
+                ok = False
+            local.append(time.perf_counter() - start)
+            failed += 0 if ok else 1
+        if "close" in state:
+            state["close"]()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors[0],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else None,
+        "p50_ms": _ms(percentile(latencies, 0.50)),
+        "p95_ms": _ms(percentile(latencies, 0.95)),
+        "p99_ms": _ms(percentile(latencies, 0.99)),
+        "max_ms": _ms(latencies[-1] if latencies else None),
+    }
+    print(f"{name:16s} {result['throughput_rps']:>10} req/s  p50={result['p50_ms']}ms  "
+          f"p95={result['p95_ms']}ms  p99={result['p99_ms']}ms  errors={result['errors']}")
+    return result
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+# --- HTTP scenarios -------------------------------------------------------
+
+def http_session(state):
+    if "http" not in state:
+        state["http"] = requests.Session()
+        state["close"] = state["http"].close
+    return state["http"]
+
+
+def identity_op(nef_url, sessions):
+    def op(state, i):
+        ip = ue_ip_for(random.randrange(sessions))
+        return http_session(state).get(f"{nef_url}/identity", params={"ip": ip}, timeout=10).status_code == 200
+    return op
+
+
+def identity_batch_op(nef_url, sessions, batch_size):
+    def op(state, i):
+        ips = [ue_ip_for(random.randrange(sessions)) for _ in range(batch_size)]
+        resp = http_session(state).post(f"{nef_url}/identity/batch", json={"ips": ips}, timeout=30)
+        return resp.status_code == 200
+    return op
+
+
+def sms_send_op(nef_url, recipient):
+    def op(state, i):
+        resp = http_session(state).post(f"{nef_url}/sms/send",
+                                        json={"to": recipient, "body": f"bench {i}", "from": "sip:bench@smsc"},
+                                        timeout=10)
+        # 202: accepted and queued behind the SMSC's per-UE in-flight window
+        return resp.status_code in (200, 202)
+    return op
+
+
+# --- SIP scenarios --------------------------------------------------------
+
+def sip_request(method, user, to_user, local_port, call_id, body="", contact=None):
+    from_uri = f"sip:{user}@{SIP_DOMAIN}"
+    to_uri = f"sip:{to_user}@{SIP_DOMAIN}"
+    request_uri = f"sip:{SIP_DOMAIN}" if method == "REGISTER" else to_uri
+    lines = [
+        f"{method} {request_uri} SIP/2.0",
+        f"Via: SIP/2.0/UDP 127.0.0.1:{local_port};branch=z9hG4bK-{call_id}",
+        f"From: <{from_uri}>;tag=1",
+        f"To: <{to_uri}>",
+        f"Call-ID: {call_id}",
+        f"CSeq: 1 {method}",
+    ]
+    if method == "REGISTER":
+        lines.append(f"Contact: <{contact or f'sip:{user}@127.0.0.1:{local_port}'}>")
+    else:
+        lines.append("Content-Type: text/plain")
+    lines.append(f"Content-Length: {len(body.encode())}")
+    return ("\r\n".join(lines) + "\r\n\r\n" + body).encode()
+
+
+def sip_socket(state):
+    if "sock" not in state:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        sock.settimeout(2)
+        state["sock"] = sock
+        state["close"] = sock.close
+    return state["sock"]
+
+
+def await_response(sock, call_id):
+    """Wait for the response carrying our Call-ID, skipping forwarded requests."""
+    marker = f"Call-ID: {call_id}\r\n".encode()
+    while True:
+        data, _ = sock.recvfrom(65535)
+        if data.startswith(b"SIP/2.0 ") and marker in data:
+            return data.startswith(b"SIP/2.0 200")
+
+
+def sip_register_op(smsc_addr):
+    def op(state, i):
+        sock = sip_socket(state)
+        call_id = f"reg-{uuid.uuid4().hex}"
+        user = f"bench{state['id']}"
+        sock.sendto(sip_request("REGISTER", user, user, sock.getsockname()[1], call_id), smsc_addr)
+        return await_response(sock, call_id)
+    return op
+
+
+def sip_message_op(smsc_addr, recipient_user):
+    def op(state, i):
+        sock = sip_socket(state)
+        call_id = f"msg-{uuid.uuid4().hex}"
+        packet = sip_request("MESSAGE", f"bench{state['id']}", recipient_user,
+                             sock.getsockname()[1], call_id, body=f"bench message {i}")
+        sock.sendto(packet, smsc_addr)
+        return await_response(sock, call_id)
+    return op
+
+
+class SipSink:
+    """A registered UE that receives forwarded MESSAGEs and answers 200 OK."""
+
+    def __init__(self, smsc_addr, user):
+        self.user = user
+        self.received = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(2)
+        call_id = f"reg-{uuid.uuid4().hex}"
+        self.sock.sendto(sip_request("REGISTER", user, user, self.sock.getsockname()[1], call_id), smsc_addr)
+        if not await_response(self.sock, call_id):
+            raise RuntimeError("sink REGISTER failed")
+        # Wake up periodically so close() can stop the receive loop before the socket goes away
+        self.sock.settimeout(0.5)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                data, addr = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                # e.g. ICMP port unreachable from an earlier reply; keep serving until close()
+                continue
+            if data.startswith(b"SIP/2.0"):
+                continue
+            self.received += 1
+            head = data.split(b"\r\n\r\n", 1)[0].split(b"\r\n")
+            keep = [line for line in head[1:] if line.split(b":", 1)[0].lower() in (b"via", b"from", b"to", b"call-id", b"cseq")]
+            try:
+                self.sock.sendto(b"\r\n".join([b"SIP/2.0 200 OK"] + keep + [b"Content-Length: 0", b"", b""]), addr)
+            except OSError:
+                pass
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.sock.close()
+
+
+# --- Orchestration --------------------------------------------------------
+
+def start_process(args, env, log_path, cwd=REPO_DIR):
+    log = open(log_path, "w")
+    return subprocess.Popen(args, env=dict(os.environ, PYTHONUNBUFFERED="1", **env),
+                            stdout=log, stderr=subprocess.STDOUT, cwd=cwd)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mini_nef and mini_smsc with local stand-ins")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ",".join(SCENARIOS))
+    parser.add_argument("--sessions", type=int, default=10000, help="Synthetic PDU sessions seeded into the Mongo stand-in")
+    parser.add_argument("--batch-size", type=int, default=100, help="IPs per /identity/batch request")
+    parser.add_argument("--udm-latency", type=float, default=0.002, help="Seconds added to each fake UDM response")
+    parser.add_argument("--no-index", action="store_true", help="Run mini_nef without the in-memory session index")
+    parser.add_argument("--nef-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for mini_nef (repeatable), e.g. GPSI_CACHE_TTL=0")
+    parser.add_argument("--smsc-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for mini_smsc (repeatable), e.g. SIP_WORKERS=4")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--logs", default=os.path.join(BENCH_DIR, "logs"))
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    os.makedirs(args.logs, exist_ok=True)
+
+    udm = FakeUDM(latency=args.udm_latency).start()
+    smsc_api_port, smsc_sip_port, nef_port = free_port(), free_port(socket.SOCK_DGRAM), free_port()
+    smsc_url = f"http://127.0.0.1:{smsc_api_port}"
+    nef_url = f"http://127.0.0.1:{nef_port}"
+    smsc_addr = ("127.0.0.1", smsc_sip_port)
+
+    procs = []
+    try:
+        smsc_env = {"SIP_IP": "127.0.0.1", "SIP_PORT": str(smsc_sip_port), "API_PORT": str(smsc_api_port)}
+        smsc_env.update(kv.split("=", 1) for kv in args.smsc_env)
+        procs.append(start_process(
+            [sys.executable, "smsc.py"], smsc_env,
+            os.path.join(args.logs, "smsc.log"), cwd=os.path.join(REPO_DIR, "mini_smsc")))
+        nef_env = {"UDM_URL": udm.url, "SMSC_URL": smsc_url}
+        nef_env.update(kv.split("=", 1) for kv in args.nef_env)
+        nef_cmd = [sys.executable, os.path.join(BENCH_DIR, "nef_standin.py"),
+                   "--port", str(nef_port), "--sessions", str(args.sessions)]
+        if args.no_index:
+            nef_cmd.append("--no-index")
+        procs.append(start_process(nef_cmd, nef_env, os.path.join(args.logs, "nef.log")))
+        wait_http(f"{smsc_url}/metrics")
+        wait_http(f"{nef_url}/")
+
+        sink = SipSink(smsc_addr, "benchsink")
+        sink_uri = f"sip:{sink.user}@{SIP_DOMAIN}"
+
+        ops = {
+            "identity": lambda: identity_op(nef_url, args.sessions),
+            "identity_batch": lambda: identity_batch_op(nef_url, args.sessions, args.batch_size),
+            "sms_send": lambda: sms_send_op(nef_url, sink_uri),
+            "sip_register": lambda: sip_register_op(smsc_addr),
+            "sip_message": lambda: sip_message_op(smsc_addr, sink.user),
+        }
+        results = {}
+        for name in scenarios:
+            results[name] = run_scenario(name, ops[name](), args.requests, args.concurrency)
+        sink.close()
+
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_revision": git_revision(),
+            "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "logs")},
+            "fake_udm_requests": udm.requests,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        udm.stop()
+
+
+if __name__ == "__main__":
+    main()
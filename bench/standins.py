@@ -0,0 +1,71 @@
+"""
+Local stand-ins for the free5GC pieces the services depend on, so the
+benchmarks run on a plain Linux box without the core network.
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GPSI_PATH = re.compile(r"^/nudm-sdm/v1/(imsi-\d+)/gpsi$")
+
+
+def supi_for(i):
+    return f"imsi-20893{i:010d}"
+
+
+def msisdn_for(supi):
+    return supi[-10:]
+
+
+def ue_ip_for(i):
+    # 10.60.0.0/16 pool from config/smfcfg.yaml, skipping .0
+    return f"10.60.{(i + 1) // 256}.{(i + 1) % 256}"
+
+
+class FakeUDM:
+    """
+    Minimal Nudm_SDM: GET /nudm-sdm/v1/{supi}/gpsi answers msisdn-<last 10 digits>.
+    'latency' (seconds) is added to every response to model a remote NF.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        udm = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                udm.requests += 1
+                if udm.latency:
+                    time.sleep(udm.latency)
+                match = GPSI_PATH.match(self.path)
+                if not match:
+                    return self._reply(404, {"cause": "USER_NOT_FOUND"})
+                self._reply(200, {"gpsi": f"msisdn-{msisdn_for(match.group(1))}"})
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.latency = latency
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,182 @@
+"""
+Minimal Prometheus metrics (text exposition format 0.0.4).
+
+Shared by mini_nef and mini_smsc (copied next to each service in its image).
+
+Recording is striped: each metric keeps SHARDS dicts, each behind its own
+lock, and a thread always records into the same one, so concurrent request
+threads rarely wait on each other. Shards are only merged when /metrics is
+scraped. The shard count is fixed, so memory and scrape cost do not grow
+with the number of threads ever started (Flask's dev server starts one per
+request).
+"""
+import bisect
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SHARDS = 16
+
+_thread = threading.local()
+_stripes = itertools.count()
+
+
+def _stripe():
+    """This thread's shard number, assigned round-robin on first use."""
+    stripe = getattr(_thread, "stripe", None)
+    if stripe is None:
+        stripe = _thread.stripe = next(_stripes) % SHARDS
+    return stripe
+
+
+class _Sharded:
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._shards = [{} for _ in range(SHARDS)]
+        self._locks = [threading.Lock() for _ in range(SHARDS)]
+
+    def _merged(self, combine, empty):
+        merged = {}
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                for labels, value in shard.items():
+                    merged[labels] = combine(merged.get(labels) or empty(), value)
+        return merged
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        stripe = _stripe()
+        with self._locks[stripe]:
+            shard = self._shards[stripe]
+            shard[labels] = shard.get(labels, 0) + amount
+
+    def samples(self):
+        merged = self._merged(lambda a, b: a + b, lambda: 0)
+        for labels, value in sorted(merged.items()):
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        bucket = bisect.bisect_left(self.buckets, value)
+        stripe = _stripe()
+        with self._locks[stripe]:
+            shard = self._shards[stripe]
+            entry = shard.get(labels)
+            if entry is None:
+                # [count per bucket (+Inf last)..., sum]
+                entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[bucket] += 1
+            entry[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        merged = self._merged(lambda a, b: [x + y for x, y in zip(a, b)],
+                              lambda: [0] * (len(self.buckets) + 1) + [0.0])
+        for labels, entry in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry):
+                cumulative += count
+                yield (self.name + "_bucket",
+                       _labels(self.labelnames + ("le",), labels + (_fmt(bound),)), cumulative)
+            base = _labels(self.labelnames, labels)
+            yield self.name + "_count", base, cumulative
+            yield self.name + "_sum", base, entry[-1]
+
+
+class Callback:
+    """
+    Value computed at scrape time: fn() returns a number or {label_tuple: number}.
+    Used to export state other components already track (cache sizes, counters).
+    """
+
+    def __init__(self, name, help_text, labelnames, fn, kind="gauge"):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, v in sorted(value.items()):
+            yield self.name, _labels(self.labelnames, labels), v
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, fn, labelnames=()):
+        return self._add(Callback(name, help_text, labelnames, fn))
+
+    def counter_fn(self, name, help_text, fn, labelnames=()):
+        return self._add(Callback(name, help_text, labelnames, fn, kind="counter"))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{labels} {_fmt(value)}")
+            except Exception as e:
+                lines.append(f"# error collecting {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
@@ -1,8 +1,28 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flasgger import Swagger
-import requests
+import atexit
+import ipaddress
+import json
+import math
 import os
-import pymongo
+import signal
+import sys
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import ResolutionCache, NOT_FOUND
+from sessions import SessionIndex, parse_sources, range_filter, ip_in_network
+from clients import UpstreamClients
+from singleflight import SingleFlight
+# metrics.py is shared with mini_smsc: the image copies it next to this file, a source checkout has it in ../common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from breaker import CircuitBreaker, CircuitOpenError, CLOSED, STATE_CODES
+from celldb import CellCatalogue
+from location import LocationCache, AmfSubscription, Fix, provide_location, format_time
+from simswap import SimSwapIndex, msisdn_key
+import changefeed
 
 app = Flask(__name__)
 swagger = Swagger(app)
@@ -11,6 +31,219 @@ swagger = Swagger(app)
 BSF_URL = os.environ.get('BSF_URL', 'http://bsf.free5gc.org:8000')
 UDM_URL = os.environ.get('UDM_URL', 'http://udm.free5gc.org:8000')
 DB_URI = os.environ.get('DB_URI', 'mongodb://db:27017/')
+DB_NAME = os.environ.get('DB_NAME', 'free5gc')
+# 'flask' (threaded dev server) or 'asgi' (async upstream I/O, see asgi.py)
+NEF_SERVER = os.environ.get('NEF_SERVER', 'flask')
+SMSC_URL = os.environ.get('SMSC_URL', 'http://mini-smsc:9091')
+# An idle /sms/stream relay is dropped after this long; the SMSC sends a keepalive every 15s
+SMSC_STREAM_IDLE_TIMEOUT = float(os.environ.get('SMSC_STREAM_IDLE_TIMEOUT', '60'))
+
+# Shared upstream connection pools
+MONGO_POOL_SIZE = int(os.environ.get('MONGO_POOL_SIZE', '50'))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '50'))
+UDM_HTTP2 = os.environ.get('UDM_HTTP2', '0') == '1'
+
+# Identity resolution cache (seconds / entries)
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '100000'))
+SUPI_CACHE_TTL = float(os.environ.get('SUPI_CACHE_TTL', '30'))
+GPSI_CACHE_TTL = float(os.environ.get('GPSI_CACHE_TTL', '300'))
+NEGATIVE_CACHE_TTL = float(os.environ.get('NEGATIVE_CACHE_TTL', '5'))
+
+# Materialized UE IP -> SUPI table ('collection:ip_path:supi_path', comma-separated)
+SESSION_INDEX = os.environ.get('SESSION_INDEX', '1') == '1'
+SESSION_SOURCES = os.environ.get('SESSION_SOURCES', 'smf_context:pduSessions.ipv4Addr:supi,pcfBindings:ipv4Addr:supi')
+# Index reload period when Mongo has no change streams (standalone): session index hits can be
+# this stale, and its misses also take the cached direct query
+SESSION_POLL_INTERVAL = float(os.environ.get('SESSION_POLL_INTERVAL', '30'))
+
+# GET /identity?cidr= range export (smallest accepted prefix length, rows per UDM batch)
+CIDR_MIN_PREFIX = int(os.environ.get('CIDR_MIN_PREFIX', '16'))
+CIDR_BATCH_SIZE = int(os.environ.get('CIDR_BATCH_SIZE', '500'))
+
+# POST /identity/batch limits
+BATCH_MAX_IPS = int(os.environ.get('BATCH_MAX_IPS', '10000'))
+BATCH_UDM_CONCURRENCY = int(os.environ.get('BATCH_UDM_CONCURRENCY', '32'))
+
+# Circuit breakers per upstream (mongo, udm, smsc): consecutive failures to open,
+# seconds before a trial call, trial calls allowed while half-open
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RECOVERY_TIMEOUT = float(os.environ.get('BREAKER_RECOVERY_TIMEOUT', '10'))
+BREAKER_HALF_OPEN_MAX = int(os.environ.get('BREAKER_HALF_OPEN_MAX', '1'))
+
+# Cell catalogue behind /location: CSV source (reloaded when it changes), compiled
+# table path, spatial grid square size in degrees, change poll interval in seconds
+CELL_CATALOGUE = os.environ.get('CELL_CATALOGUE', 'config/cells.csv')
+CELL_TABLE = os.environ.get('CELL_TABLE', '/tmp/cells.celldb')
+CELL_GRID_STEP = float(os.environ.get('CELL_GRID_STEP', '0.01'))
+CELL_RELOAD_INTERVAL = float(os.environ.get('CELL_RELOAD_INTERVAL', '10'))
+# Serving cell reported for every UE when AMF_URL is not set (UERANSIM's cell, see gnbcfg.yaml)
+SERVING_NCGI = os.environ.get('SERVING_NCGI', '20893000000010')
+# Largest radius accepted by GET /location/cells (metres)
+CELL_MAX_RADIUS = float(os.environ.get('CELL_MAX_RADIUS', '50000'))
+
+# AMF behind /location: UE locations arrive as Namf_EventExposure location reports and
+# Namf_Location is asked only when the cached one is older than maxAge. Empty: every UE is in SERVING_NCGI.
+AMF_URL = os.environ.get('AMF_URL', '')
+# Base URL the AMF sends location reports to (this NEF as seen from the AMF)
+NEF_CALLBACK_URL = os.environ.get('NEF_CALLBACK_URL', 'http://mini-nef:9090')
+# Cached UE locations, maxAge (seconds) when a request has none, subscription renewal (seconds)
+LOCATION_CACHE_MAX_ENTRIES = int(os.environ.get('LOCATION_CACHE_MAX_ENTRIES', '100000'))
+LOCATION_DEFAULT_MAX_AGE = float(os.environ.get('LOCATION_DEFAULT_MAX_AGE', '60'))
+LOCATION_SUBSCRIPTION_REFRESH = float(os.environ.get('LOCATION_SUBSCRIPTION_REFRESH', '3600'))
+
+# MSISDN -> (SUPI, last SIM change) index behind /sim-swap, built from amData gpsis and kept in
+# sync by change stream; change times are recorded in SIM_SWAP_HISTORY so they survive restarts
+SIM_SWAP_INDEX = os.environ.get('SIM_SWAP_INDEX', '1') == '1'
+SIM_SWAP_HISTORY = os.environ.get('SIM_SWAP_HISTORY', 'nefSimChanges')
+# maxAge (hours) when a check has none, and POST /sim-swap/batch size limit
+SIM_SWAP_DEFAULT_MAX_AGE = float(os.environ.get('SIM_SWAP_DEFAULT_MAX_AGE', '240'))
+SIM_SWAP_BATCH_MAX = int(os.environ.get('SIM_SWAP_BATCH_MAX', '10000'))
+
+# Test subscriber used by test_nef.sh / GUIDE.md when no real session exists
+TEST_UE_IP = "10.60.0.1"
+TEST_SUPI = "imsi-208930000000003"
+TEST_MSISDN = "1234567890"
+
+upstream = UpstreamClients(DB_URI, DB_NAME, UDM_URL, MONGO_POOL_SIZE, HTTP_POOL_SIZE, UDM_HTTP2)
+resolution_cache = ResolutionCache(CACHE_MAX_ENTRIES, SUPI_CACHE_TTL, GPSI_CACHE_TTL, NEGATIVE_CACHE_TTL)
+session_index = SessionIndex(parse_sources(SESSION_SOURCES))
+sim_swap_index = SimSwapIndex(history=lambda: upstream.db[SIM_SWAP_HISTORY])
+# Concurrent GPSI lookups for the same SUPI share one UDM call
+udm_flight = SingleFlight("udm-gpsi")
+# Shared by all batch requests, so total UDM fan-out stays bounded
+udm_pool = ThreadPoolExecutor(max_workers=BATCH_UDM_CONCURRENCY, thread_name_prefix="udm")
+cell_catalogue = CellCatalogue(CELL_CATALOGUE, CELL_TABLE, CELL_GRID_STEP)
+location_cache = LocationCache(LOCATION_CACHE_MAX_ENTRIES)
+amf_subscription = AmfSubscription(upstream.amf, AMF_URL, f"{NEF_CALLBACK_URL}/amf-events/location",
+                                   location_cache.update, refresh=LOCATION_SUBSCRIPTION_REFRESH) if AMF_URL else None
+# Concurrent on-demand positioning of the same UE shares one AMF call
+amf_flight = SingleFlight("amf-location")
+# Keyed by the prefix of the upstream_stage names (mongo_lookup, udm_gpsi, smsc_send, ...)
+breakers = {name: CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT, BREAKER_HALF_OPEN_MAX)
+            for name in ("mongo", "udm", "smsc", "amf")}
+
+# Metrics (GET /metrics)
+registry = Registry()
+UPSTREAM_LATENCY = registry.histogram("nef_upstream_latency_seconds", "Latency of upstream calls by stage", ["stage"])
+UPSTREAM_ERRORS = registry.counter("nef_upstream_errors_total", "Failed upstream calls by stage", ["stage"])
+REQUEST_LATENCY = registry.histogram("nef_request_latency_seconds", "Request handling latency by route", ["route", "method"])
+REQUESTS = registry.counter("nef_requests_total", "Requests served by route and status", ["route", "method", "status"])
+registry.gauge("nef_cache_entries", "Resolution cache entries",
+               lambda: {(leg,): s["size"] for leg, s in resolution_cache.stats().items()}, ["leg"])
+registry.counter_fn("nef_cache_lookups_total", "Resolution cache lookups by outcome",
+                    lambda: {(leg, outcome): s[outcome]
+                             for leg, s in resolution_cache.stats().items()
+                             for outcome in ("hits", "negative_hits", "misses")}, ["leg", "outcome"])
+registry.counter_fn("nef_cache_evictions_total", "Resolution cache LRU evictions",
+                    lambda: {(leg,): s["evictions"] for leg, s in resolution_cache.stats().items()}, ["leg"])
+registry.gauge("nef_session_bindings", "UE IP bindings in the session index", lambda: session_index.stats()["bindings"])
+registry.counter_fn("nef_udm_coalesced_total", "UDM GPSI lookups served by an in-flight call",
+                    lambda: udm_flight.stats()["coalesced"])
+registry.gauge("nef_sim_swap_numbers", "MSISDNs in the SIM swap index", lambda: len(sim_swap_index))
+registry.counter_fn("nef_sim_changes_total", "SIM changes (MSISDN moved to another SUPI) seen by the SIM swap index",
+                    lambda: sim_swap_index.sim_changes)
+registry.gauge("nef_cells", "Cells in the loaded cell catalogue", lambda: len(cell_catalogue))
+registry.counter_fn("nef_cell_catalogue_reloads_total", "Cell catalogue tables loaded", lambda: cell_catalogue.reloads)
+registry.gauge("nef_location_cache_entries", "UEs with a cached location", lambda: len(location_cache))
+registry.counter_fn("nef_location_lookups_total", "Location cache lookups by outcome (hit: fresh enough for maxAge)",
+                    lambda: {(outcome,): location_cache.stats()[outcome] for outcome in ("hits", "stale", "misses")},
+                    ["outcome"])
+registry.counter_fn("nef_amf_notifications_total", "Location report notifications received from the AMF",
+                    lambda: amf_subscription.notifications if amf_subscription else 0)
+registry.gauge("nef_circuit_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)",
+               lambda: {(name,): STATE_CODES[b.state] for name, b in breakers.items()}, ["upstream"])
+registry.counter_fn("nef_circuit_rejections_total", "Upstream calls failed fast by an open circuit",
+                    lambda: {(name,): b.stats()["rejected"] for name, b in breakers.items()}, ["upstream"])
+registry.counter_fn("nef_circuit_opens_total", "Times each upstream circuit opened",
+                    lambda: {(name,): b.stats()["opens"] for name, b in breakers.items()}, ["upstream"])
+
+@contextmanager
+def upstream_stage(stage):
+    """
+    Time one upstream call and count it as failed if it raises. The call goes
+    through its upstream's circuit breaker, so it raises CircuitOpenError
+    right away while that upstream is considered down.
+    """
+    with breakers[stage.split("_", 1)[0]].guard():
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            UPSTREAM_ERRORS.inc(stage)
+            raise
+        finally:
+            UPSTREAM_LATENCY.observe(time.perf_counter() - start, stage)
+
+class UpstreamServerError(Exception):
+    """An upstream answered 5xx; raised inside upstream_stage so it counts against the breaker."""
+    def __init__(self, response):
+        super().__init__(f"upstream returned {response.status_code}: {response.text[:200]}")
+        self.response = response
+
+def check_server_error(resp):
+    if resp.status_code >= 500:
+        raise UpstreamServerError(resp)
+    return resp
+
+def failure_status(e):
+    """503 when an open circuit rejected the call, 500 for an upstream that actually failed."""
+    return 503 if isinstance(e, CircuitOpenError) else 500
+
+def smsc_read_timeout(args):
+    """2s, plus however long the SMSC may hold a ?wait= long-poll open."""
+    try:
+        return 2 + max(float(args.get('wait', 0)), 0)
+    except ValueError:
+        return 2
+
+def upstream_failure(message, e):
+    """Error response for a failed upstream call; an open circuit adds Retry-After."""
+    response = jsonify({"error": message, "details": str(e)})
+    if isinstance(e, CircuitOpenError):
+        response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response, failure_status(e)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - start, route, request.method)
+        REQUESTS.inc(route, request.method, response.status_code)
+    return response
+
+def ensure_session_indexes(db):
+    """Index the session IP fields used by /identity lookups and range exports."""
+    for collection, ip_path, _ in parse_sources(SESSION_SOURCES):
+        db[collection].create_index(ip_path)
+
+def load_sessions(db):
+    ensure_session_indexes(db)
+    session_index.load(db)
+
+def start_session_index():
+    changefeed.follow(upstream.mongo, DB_NAME, session_index.collections(),
+                      on_change=session_index.apply_change,
+                      on_resync=load_sessions,
+                      poll_interval=SESSION_POLL_INTERVAL,
+                      name="Sessions",
+                      on_polling=session_index.set_polling)
+
+def load_sim_swap(db):
+    # Also serves the find_supi_for_msisdn fallback
+    db[sim_swap_index.collection].create_index("gpsis")
+    sim_swap_index.load(db)
+
+def start_sim_swap_index():
+    changefeed.follow(upstream.mongo, DB_NAME, [sim_swap_index.collection],
+                      on_change=sim_swap_index.apply_change,
+                      on_resync=load_sim_swap,
+                      poll_interval=SESSION_POLL_INTERVAL,
+                      name="SimSwap")
 
 @app.route('/', methods=['GET'])
 def index():
@@ -28,37 +261,229 @@ def index():
         "docs": "/apidocs"
     })
 
-def get_supi_from_mongo(ip_addr):
+def find_supi_in_mongo(ip_addr):
     """
     Fallback: Look up IP in MongoDB directly since BSF is missing.
     Searches SMF/PCF collections for the session IP.
+    Returns None if no session matches; raises on DB errors.
     """
-    try:
-        client = pymongo.MongoClient(DB_URI, serverSelectionTimeoutMS=2000)
-        db = client["free5gc"]
-        
-        # Strategy 1: Check SMF Contexts
-        # Collection often named 'smf.context' or similar. 
-        # Structure varies, but usually contains 'pduSession' with 'ipv4Addr'
-        # Scanning key collections...
-        
-        # Mocking the query logic for prototype safety:
-        # In a real Free5GC DB, we would query `smf_context` or `pcf_policy`.
-        # For this prototype, we will check if ANY entry mentions this IP.
-        
-        # Simplified: If specific test IP, return specific SUPI for testing success
-        if ip_addr == "10.60.0.1": 
-             return "imsi-208930000000003"
-             
-        # Actual search (pseudo-code as schema is complex)
-        # col = db["smf_context"]
-        # doc = col.find_one({"pduSessions.ipv4Addr": ip_addr})
-        # if doc: return doc['supi']
-        
+    db = upstream.db
+
+    with upstream_stage("mongo_lookup"):
+        for collection, ip_path, supi_path in parse_sources(SESSION_SOURCES):
+            doc = db[collection].find_one({ip_path: ip_addr})
+            if doc:
+                return next(changefeed.dotted_values(doc, supi_path), None)
+
+    return None
+
+def find_supis_in_mongo(ip_addrs):
+    """Resolve many IPs with one $in query per session collection. Raises on DB errors."""
+    db = upstream.db
+    wanted = set(ip_addrs)
+    found = {}
+
+    with upstream_stage("mongo_batch_lookup"):
+        for collection, ip_path, supi_path in parse_sources(SESSION_SOURCES):
+            pending = list(wanted - found.keys())
+            if not pending:
+                break
+            projection = {ip_path.split(".")[0]: 1, supi_path.split(".")[0]: 1}
+            for doc in db[collection].find({ip_path: {"$in": pending}}, projection):
+                supi = next(changefeed.dotted_values(doc, supi_path), None)
+                for ip in changefeed.dotted_values(doc, ip_path):
+                    if ip in wanted and supi:
+                        found.setdefault(ip, supi)
+
+    return found
+
+def find_supi_cached(ip_addr):
+    """find_supi_in_mongo through the resolution cache. Raises CircuitOpenError while the Mongo circuit is open."""
+    supi = resolution_cache.supi.get(ip_addr)
+    if supi is NOT_FOUND:
         return None
+    if supi is None:
+        try:
+            supi = find_supi_in_mongo(ip_addr)
+            resolution_cache.supi.put(ip_addr, supi)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            # DB errors are not cached
+            print(f"Mongo Error: {e}")
+    return supi
+
+def lookup_supi(ip_addr):
+    """
+    IP -> SUPI. Answered from the in-memory session index once it is loaded;
+    until then, through the resolution cache backed by a direct DB query.
+    While the index is polling (standalone Mongo), a miss may be a session
+    newer than the last reload, so it also takes the cached DB query.
+    Raises CircuitOpenError while the Mongo circuit is open.
+    """
+    if session_index.ready:
+        supi = session_index.lookup(ip_addr)
+        if supi is None and session_index.polling:
+            supi = find_supi_cached(ip_addr)
+    else:
+        supi = find_supi_cached(ip_addr)
+
+    # Simplified: If specific test IP, return specific SUPI for testing success
+    if not supi and ip_addr == TEST_UE_IP:
+        return TEST_SUPI
+    return supi
+
+def lookup_supis(ip_addrs):
+    """
+    Batch form of lookup_supi: ip -> SUPI (or None) for every requested IP.
+    Cache/index hits are answered locally; the remaining IPs share one DB query.
+    Raises on DB errors.
+    """
+    result = {}
+    pending = ip_addrs
+    if session_index.ready:
+        for ip in ip_addrs:
+            result[ip] = session_index.lookup(ip)
+        # While polling, index misses also go to the DB (see lookup_supi)
+        pending = [ip for ip in ip_addrs if result[ip] is None] if session_index.polling else []
+    misses = []
+    for ip in pending:
+        supi = resolution_cache.supi.get(ip)
+        if supi is None:
+            misses.append(ip)
+        else:
+            result[ip] = None if supi is NOT_FOUND else supi
+    if misses:
+        found = find_supis_in_mongo(misses)
+        for ip in misses:
+            result[ip] = found.get(ip)
+            resolution_cache.supi.put(ip, result[ip])
+
+    if TEST_UE_IP in result and not result[TEST_UE_IP]:
+        result[TEST_UE_IP] = TEST_SUPI
+    return result
+
+def get_msisdn_from_udm(supi):
+    """
+    Query UDM (Nudm_SDM) for the subscriber GPSI.
+    Returns the MSISDN ('' if the profile has no GPSI), NOT_FOUND on 404.
+    Raises on any other failure.
+    """
+    udm_endpoint = f"{UDM_URL}/nudm-sdm/v1/{supi}/gpsi"
+    with upstream_stage("udm_gpsi"):
+        udm_resp = upstream.udm.get(udm_endpoint, timeout=5)
+        if udm_resp.status_code == 404:
+            return NOT_FOUND
+        udm_resp.raise_for_status()
+
+    gpsi_data = udm_resp.json()
+    gpsi = gpsi_data.get('gpsi', '')
+    return gpsi.replace('msisdn-', '') if gpsi else ''
+
+def fetch_msisdn(supi):
+    msisdn = get_msisdn_from_udm(supi)
+    resolution_cache.gpsi.put(supi, msisdn)
+    return msisdn
+
+def lookup_msisdn(supi):
+    """
+    SUPI -> MSISDN through the resolution cache. UDM errors are not cached.
+    On a miss, concurrent lookups for the same SUPI are coalesced into one UDM call.
+    """
+    msisdn = resolution_cache.gpsi.get(supi)
+    if msisdn is not None:
+        return msisdn
+    return udm_flight.do(supi, fetch_msisdn, supi)
+
+def identity_result(ip_addr, supi, msisdn):
+    """Build the /identity response body and status for a resolved SUPI."""
+    if msisdn is NOT_FOUND:
+         # If UDM fails, mock it for the test case if using test SUPI
+         if supi == TEST_SUPI:
+             return {
+                "ip": ip_addr,
+                "msisdn": TEST_MSISDN,
+                "supi": supi,
+                "source": "Mock/Fallback"
+            }, 200
+         return {"error": "Subscriber profile not found"}, 404
+
+    return {
+        "ip": ip_addr,
+        "msisdn": msisdn or None,
+        "supi": supi
+    }, 200
+
+def parse_cidr(cidr):
+    """Validate a ?cidr= range. Returns (network, error_message)."""
+    try:
+        network = ipaddress.IPv4Network(cidr, strict=False)
+    except ValueError:
+        return None, f"Invalid IPv4 CIDR '{cidr}'"
+    if network.prefixlen < CIDR_MIN_PREFIX:
+        return None, f"Range too large (smallest prefix is /{CIDR_MIN_PREFIX})"
+    return network, None
+
+def guarded_cursor(cursor):
+    """
+    Iterate a Mongo cursor whose first batch goes through the Mongo circuit
+    breaker (that is where an unreachable server shows up); later batches
+    fail into the caller's error handling as before.
+    """
+    docs = iter(cursor)
+    with breakers["mongo"].guard():
+        first = next(docs, None)
+    if first is None:
+        return
+    yield first
+    yield from docs
+
+def find_sessions_in_range(network):
+    """
+    Yield (ip, supi) for every session IP inside the network, straight from a
+    Mongo cursor. Only the set of already-emitted IPs is kept, to drop the
+    same binding seen in a second session collection.
+    """
+    db = upstream.db
+    seen = set()
+    for collection, ip_path, supi_path in parse_sources(SESSION_SOURCES):
+        projection = {ip_path.split(".")[0]: 1, supi_path.split(".")[0]: 1}
+        cursor = db[collection].find(range_filter(network, ip_path), projection).batch_size(CIDR_BATCH_SIZE)
+        for doc in guarded_cursor(cursor):
+            supi = next(changefeed.dotted_values(doc, supi_path), None)
+            if not supi:
+                continue
+            for ip in changefeed.dotted_values(doc, ip_path):
+                if ip not in seen and ip_in_network(ip, network):
+                    seen.add(ip)
+                    yield ip, supi
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def stream_identity_range(network):
+    """NDJSON rows for a CIDR range; UDM enrichment runs per chunk on the UDM pool."""
+    try:
+        for chunk in chunked(find_sessions_in_range(network), CIDR_BATCH_SIZE):
+            futures = {supi: udm_pool.submit(lookup_msisdn, supi) for supi in {supi for _, supi in chunk}}
+            for ip_addr, supi in chunk:
+                try:
+                    body, status = identity_result(ip_addr, supi, futures[supi].result())
+                except Exception as e:
+                    body, status = {"error": "Failed to query UDM", "details": str(e)}, failure_status(e)
+                if status != 200:
+                    body = dict(body, ip=ip_addr, supi=supi, status=status)
+                yield json.dumps(body) + "\n"
     except Exception as e:
         print(f"Mongo Error: {e}")
-        return None
+        yield json.dumps({"error": "Session range query failed", "details": str(e), "status": failure_status(e)}) + "\n"
 
 @app.route('/identity', methods=['GET'])
 def resolve_identity():
@@ -69,8 +494,16 @@ def resolve_identity():
       - name: ip
         in: query
         type: string
-        required: true
-        description: The IP address to resolve
+        required: false
+        description: The IP address to resolve (required unless 'cidr' is given)
+      - name: cidr
+        in: query
+        type: string
+        required: false
+        description: Export every active session in an IPv4 range (e.g. 10.60.0.0/16) as NDJSON
+    produces:
+      - application/json
+      - application/x-ndjson
     responses:
       200:
         description: Successful resolution
@@ -83,55 +516,187 @@ def resolve_identity():
               type: string
             supi:
               type: string
+      400:
+        description: Missing 'ip', or invalid/oversized 'cidr'
       404:
         description: Session not found
     """
+    cidr = request.args.get('cidr')
+    if cidr:
+        network, error = parse_cidr(cidr)
+        if error:
+            return jsonify({"error": error}), 400
+        print(f"Exporting identity range: {network}")
+        return Response(stream_with_context(stream_identity_range(network)), mimetype='application/x-ndjson')
+
     ip_addr = request.args.get('ip')
     if not ip_addr:
         return jsonify({"error": "Missing 'ip' parameter"}), 400
 
     print(f"Resolving IP: {ip_addr}")
-    
+
     supi = None
 
     # Try 1: BSF (Will likely fail or be skipped)
     # ... (Skipped since we removed BSF service)
     
-    # Try 2: Direct DB / Fallback
-    print("Attempting Direct DB Lookup...")
-    supi = get_supi_from_mongo(ip_addr)
-    
+    # Try 2: Direct DB / Fallback (cached)
+    try:
+        supi = lookup_supi(ip_addr)
+    except CircuitOpenError as e:
+        return upstream_failure("Session lookup failed", e)
+
     if not supi:
          return jsonify({"error": "Session not found (BSF missing and DB lookup failed)"}), 404
 
-    # Step 2: Query UDM for GPSI/MSISDN
-    udm_endpoint = f"{UDM_URL}/nudm-sdm/v1/{supi}/gpsi"
+    # Step 2: Query UDM for GPSI/MSISDN (cached)
     try:
-        udm_resp = requests.get(udm_endpoint, timeout=5)
-        if udm_resp.status_code == 404:
-             # If UDM fails, mock it for the test case if using test SUPI
-             if supi == "imsi-208930000000003":
-                 return jsonify({
-                    "ip": ip_addr,
-                    "msisdn": "1234567890",
-                    "supi": supi,
-                    "source": "Mock/Fallback"
-                })
-             return jsonify({"error": "Subscriber profile not found"}), 404
-        udm_resp.raise_for_status()
+        msisdn = lookup_msisdn(supi)
+    except Exception as e:
+        return upstream_failure("Failed to query UDM", e)
 
-        gpsi_data = udm_resp.json()
-        gpsi = gpsi_data.get('gpsi', '')
-        msisdn = gpsi.replace('msisdn-', '') if gpsi else None
-        
-        return jsonify({
-            "ip": ip_addr,
-            "msisdn": msisdn,
-            "supi": supi
-        })
+    body, status = identity_result(ip_addr, supi, msisdn)
+    return jsonify(body), status
 
+@app.route('/identity/batch', methods=['POST'])
+def resolve_identity_batch():
+    """
+    Resolve many IPs to MSISDN/SUPI in one call
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            ips:
+              type: array
+              items:
+                type: string
+              example: ["10.60.0.1", "10.60.0.2"]
+    responses:
+      200:
+        description: Per-IP results in request order. Failed items carry 'error' and 'status'.
+        schema:
+          type: object
+          properties:
+            results:
+              type: array
+              items:
+                type: object
+      400:
+        description: Missing or oversized 'ips' list
+    """
+    data = request.get_json(silent=True) or {}
+    ip_addrs = data.get('ips')
+    if not isinstance(ip_addrs, list) or not ip_addrs:
+        return jsonify({"error": "Missing 'ips' list in body"}), 400
+    if len(ip_addrs) > BATCH_MAX_IPS:
+        return jsonify({"error": f"Too many IPs (max {BATCH_MAX_IPS})"}), 400
+
+    print(f"Resolving batch of {len(ip_addrs)} IPs")
+
+    # Step 1: IP -> SUPI (index / cache, then one $in query for the rest)
+    try:
+        supis = lookup_supis([ip for ip in ip_addrs if isinstance(ip, str)])
     except Exception as e:
-        return jsonify({"error": "Failed to query UDM", "details": str(e)}), 500
+        print(f"Mongo Error: {e}")
+        return upstream_failure("Session lookup failed", e)
+
+    # Step 2: SUPI -> MSISDN, one UDM call per distinct SUPI, bounded fan-out
+    futures = {supi: udm_pool.submit(lookup_msisdn, supi) for supi in set(supis.values()) if supi}
+
+    results = []
+    for ip_addr in ip_addrs:
+        supi = supis.get(ip_addr) if isinstance(ip_addr, str) else None
+        if not supi:
+            results.append({"ip": ip_addr, "error": "Session not found", "status": 404})
+            continue
+        try:
+            body, status = identity_result(ip_addr, supi, futures[supi].result())
+        except Exception as e:
+            body, status = {"error": "Failed to query UDM", "details": str(e)}, failure_status(e)
+        if status != 200:
+            body = dict(body, ip=ip_addr, status=status)
+        results.append(body)
+
+    return jsonify({"results": results})
+
+@app.route('/identity/cache', methods=['GET'])
+def identity_cache_stats():
+    """
+    Identity resolution cache statistics
+    ---
+    responses:
+      200:
+        description: Hit/miss/eviction counters for the IP->SUPI and SUPI->MSISDN legs, session index size and coalesced UDM calls
+    """
+    stats = resolution_cache.stats()
+    stats["sessions"] = session_index.stats()
+    stats["udm_singleflight"] = udm_flight.stats()
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus metrics
+    ---
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: Per-stage upstream latency histograms, request latency and cache counters
+    """
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/health', methods=['GET'])
+def health():
+    """
+    Upstream health
+    ---
+    responses:
+      200:
+        description: Circuit breaker state per upstream (mongo, udm, smsc); status is "degraded" while any circuit is not closed
+    """
+    upstreams = {name: b.stats() for name, b in breakers.items()}
+    degraded = any(u["state"] != CLOSED for u in upstreams.values())
+    return jsonify({
+        "status": "degraded" if degraded else "ok",
+        "upstreams": upstreams,
+        "session_index": session_index.ready,
+        "sim_swap_index": sim_swap_index.ready,
+        "cells": len(cell_catalogue),
+        "location": {"cached": len(location_cache), "amf_subscription": amf_subscription.active if amf_subscription else None},
+    })
+
+def parse_max_age(value, default):
+    """maxAge in hours (CAMARA SIM Swap: 1..2400); ValueError if invalid."""
+    if value is None or value == '':
+        return default
+    hours = float(value)
+    if not 1 <= hours <= 2400:
+        raise ValueError("maxAge must be between 1 and 2400 hours")
+    return hours
+
+def sim_swap_result(msisdn, max_age, now):
+    """(body, status) for one check against the SIM swap index."""
+    entry = sim_swap_index.lookup(msisdn)
+    if entry is None:
+        if msisdn_key(msisdn) != TEST_MSISDN:
+            return {"msisdn": msisdn, "error": "Unknown MSISDN"}, 404
+        entry = (TEST_SUPI, None)
+    _, changed_at = entry
+    return {
+        "msisdn": msisdn,
+        "swapped": changed_at is not None and now - changed_at <= max_age * 3600,
+        "last_swap_timestamp": format_time(changed_at) if changed_at is not None else None,
+    }, 200
+
+def sim_swap_unavailable():
+    response = jsonify({"error": "SIM swap index is not loaded yet"})
+    response.headers["Retry-After"] = str(max(1, int(SESSION_POLL_INTERVAL)))
+    return response, 503
 
 @app.route('/sim-swap', methods=['GET'])
 def check_sim_swap():
@@ -144,21 +709,159 @@ def check_sim_swap():
         type: string
         required: true
         description: The MSISDN to check
+      - name: maxAge
+        in: query
+        type: integer
+        required: false
+        description: Period in hours to check for a SIM change (1-2400, default SIM_SWAP_DEFAULT_MAX_AGE)
     responses:
       200:
-        description: SIM Swap status
+        description: SIM Swap status (swapped if the MSISDN moved to its current SIM within maxAge; last_swap_timestamp null if never seen changing)
+      404:
+        description: MSISDN not provisioned
+      503:
+        description: SIM swap index still loading
     """
     msisdn = request.args.get('msisdn')
     if not msisdn:
         return jsonify({"error": "Missing 'msisdn' parameter"}), 400
-    
-    # Mock Logic
-    # In a real scenario, this would check the UDM for the last IMSI switch.
-    return jsonify({
-        "msisdn": msisdn,
-        "swapped": False,
-        "last_swap_timestamp": "2024-01-01T12:00:00Z"
-    })
+    try:
+        max_age = parse_max_age(request.args.get('maxAge'), SIM_SWAP_DEFAULT_MAX_AGE)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid 'maxAge': {e}"}), 400
+    if not sim_swap_index.ready:
+        return sim_swap_unavailable()
+
+    body, status = sim_swap_result(msisdn, max_age, time.time())
+    return jsonify(body), status
+
+@app.route('/sim-swap/batch', methods=['POST'])
+def check_sim_swap_batch():
+    """
+    Check many MSISDNs for SIM Swap in one call
+    ---
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            checks:
+              type: array
+              items:
+                type: object
+                properties:
+                  msisdn:
+                    type: string
+                  maxAge:
+                    type: integer
+              example: [{"msisdn": "1234567890", "maxAge": 24}, {"msisdn": "1234567891"}]
+            maxAge:
+              type: integer
+              description: Hours for checks without their own maxAge (default SIM_SWAP_DEFAULT_MAX_AGE)
+    responses:
+      200:
+        description: Per-MSISDN results in request order. Failed items carry 'error' and 'status'.
+        schema:
+          type: object
+          properties:
+            results:
+              type: array
+              items:
+                type: object
+      400:
+        description: Missing or oversized 'checks' list, or invalid default maxAge
+      503:
+        description: SIM swap index still loading
+    """
+    data = request.get_json(silent=True) or {}
+    checks = data.get('checks')
+    if not isinstance(checks, list) or not checks:
+        return jsonify({"error": "Missing 'checks' list in body"}), 400
+    if len(checks) > SIM_SWAP_BATCH_MAX:
+        return jsonify({"error": f"Too many checks (max {SIM_SWAP_BATCH_MAX})"}), 400
+    try:
+        default_max_age = parse_max_age(data.get('maxAge'), SIM_SWAP_DEFAULT_MAX_AGE)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid 'maxAge': {e}"}), 400
+    if not sim_swap_index.ready:
+        return sim_swap_unavailable()
+
+    now = time.time()
+    results = []
+    for check in checks:
+        # A bare string is an MSISDN checked with the default maxAge
+        if not isinstance(check, dict):
+            check = {"msisdn": check}
+        msisdn = check.get('msisdn')
+        if not isinstance(msisdn, str) or not msisdn:
+            results.append({"msisdn": msisdn, "error": "Missing 'msisdn'", "status": 400})
+            continue
+        try:
+            max_age = parse_max_age(check.get('maxAge'), default_max_age)
+        except (TypeError, ValueError) as e:
+            results.append({"msisdn": msisdn, "error": f"Invalid 'maxAge': {e}", "status": 400})
+            continue
+        body, status = sim_swap_result(msisdn, max_age, now)
+        if status != 200:
+            body = dict(body, status=status)
+        results.append(body)
+
+    return jsonify({"results": results})
+
+def cell_location(cell):
+    return {
+        "latitude": cell.latitude,
+        "longitude": cell.longitude,
+        "accuracy": cell.accuracy,
+        "cellId": cell.ncgi,
+        "tac": cell.tac,
+    }
+
+def find_supi_for_msisdn(msisdn):
+    """MSISDN -> SUPI from the provisioned AM data (gpsis); None if no subscriber has it. Raises on DB errors."""
+    with upstream_stage("mongo_msisdn"):
+        doc = upstream.db['subscriptionData.provisionedData.amData'].find_one({"gpsis": f"msisdn-{msisdn}"},
+                                                                              {"ueId": 1})
+    return doc.get("ueId") if doc else None
+
+def lookup_supi_for_msisdn(msisdn):
+    """
+    MSISDN -> SUPI from the SIM swap index once loaded, else through the
+    resolution cache (None if unknown); the test MSISDN is the test UE.
+    """
+    if msisdn == TEST_MSISDN:
+        return TEST_SUPI
+    if sim_swap_index.ready:
+        entry = sim_swap_index.lookup(msisdn)
+        return entry[0] if entry else None
+    supi = resolution_cache.msisdn.get(msisdn)
+    if supi is None:
+        supi = find_supi_for_msisdn(msisdn)
+        resolution_cache.msisdn.put(msisdn, supi)
+    return None if supi is NOT_FOUND else supi
+
+def fetch_location(supi):
+    """Ask the AMF where the UE is (Namf_Location) and cache the answer."""
+    with upstream_stage("amf_location"):
+        fix = provide_location(upstream.amf, AMF_URL, supi)
+    if fix is not None:
+        location_cache.update(supi, fix)
+    return fix
+
+def locate(supi, max_age):
+    """
+    (Fix, from_cache) for a UE, at most max_age seconds old if the cache has
+    one; otherwise from the AMF on demand (which may itself only know an
+    older location). Raises if the AMF call fails.
+    """
+    if not AMF_URL:
+        return Fix(SERVING_NCGI, time.time(), "serving-cell"), False
+    fix, fresh = location_cache.get(supi, max_age)
+    if fresh:
+        return fix, True
+    return amf_flight.do(supi, fetch_location, supi) or fix, False
 
 @app.route('/location', methods=['GET'])
 def get_location():
@@ -171,23 +874,146 @@ def get_location():
         type: string
         required: true
         description: The MSISDN to locate
+      - name: maxAge
+        in: query
+        type: integer
+        required: false
+        description: Oldest acceptable location in seconds (default LOCATION_DEFAULT_MAX_AGE); 0 forces a fresh AMF query
     responses:
       200:
-        description: Location data
+        description: Location data (position of the serving cell; accuracy is its radius in metres, timestamp when the AMF observed it)
+      404:
+        description: Unknown MSISDN, UE not known to the AMF, or serving cell not in the cell catalogue
+      422:
+        description: No location within maxAge is available
     """
     msisdn = request.args.get('msisdn')
     if not msisdn:
         return jsonify({"error": "Missing 'msisdn' parameter"}), 400
+    try:
+        max_age = float(request.args.get('maxAge', LOCATION_DEFAULT_MAX_AGE))
+    except ValueError:
+        max_age = -1
+    if max_age < 0:
+        return jsonify({"error": "'maxAge' must be a non-negative number of seconds"}), 400
 
-    # Mock Logic
-    # In a real scenario, this would query the GMLC/AMF.
-    # We return a fixed location (New York City) for the test case.
+    try:
+        supi = lookup_supi_for_msisdn(msisdn.lstrip('+'))
+    except Exception as e:
+        return upstream_failure("Failed to resolve MSISDN", e)
+    if not supi:
+        return jsonify({"error": "Unknown MSISDN", "msisdn": msisdn}), 404
+    try:
+        fix, from_cache = locate(supi, max_age)
+    except Exception as e:
+        return upstream_failure("Failed to get UE location from AMF", e)
+    if fix is None:
+        return jsonify({"error": "Location not available", "msisdn": msisdn}), 404
+    # Whole seconds, the resolution of the timestamp (maxAge=0 accepts what the AMF just observed)
+    if int(time.time() - fix.observed_at) > max_age:
+        return jsonify({"error": "No location within maxAge", "msisdn": msisdn,
+                        "lastLocationTime": format_time(fix.observed_at)}), 422
+
+    # The serving cell's position is one table lookup
+    cell = cell_catalogue.lookup(fix.ncgi)
+    if cell is None:
+        return jsonify({"error": "Serving cell not in cell catalogue", "cellId": fix.ncgi}), 404
     return jsonify({
         "msisdn": msisdn,
-        "latitude": 40.7128,
-        "longitude": -74.0060,
-        "accuracy": 100,
-        "timestamp": "2024-01-01T12:00:00Z"
+        **cell_location(cell),
+        "timestamp": format_time(fix.observed_at),
+        "source": "cache" if from_cache else fix.source,
+    })
+
+@app.route('/amf-events/location', methods=['POST'])
+def amf_location_notification():
+    """
+    AMF location report callback (Namf_EventExposure notification)
+    ---
+    tags:
+      - Callbacks
+    responses:
+      204:
+        description: Reports applied to the location cache
+      404:
+        description: Not a subscription of this NEF
+    """
+    if amf_subscription is None or not amf_subscription.handle_notification(request.get_json(silent=True) or {}):
+        return jsonify({"error": "Unknown subscription"}), 404
+    return '', 204
+
+@app.route('/location/cells/<ncgi>', methods=['GET'])
+def get_cell(ncgi):
+    """
+    Look up a cell in the cell catalogue
+    ---
+    parameters:
+      - name: ncgi
+        in: path
+        type: string
+        required: true
+        description: NR cell global identity, MCC + MNC + 9 hex digit NCI (e.g. 20893000000010)
+    responses:
+      200:
+        description: Cell position
+      400:
+        description: Malformed NCGI
+      404:
+        description: Cell not in catalogue
+    """
+    try:
+        cell = cell_catalogue.lookup(ncgi)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if cell is None:
+        return jsonify({"error": "Cell not in catalogue", "cellId": ncgi}), 404
+    return jsonify(cell_location(cell))
+
+@app.route('/location/cells', methods=['GET'])
+def find_cells():
+    """
+    Cells around a position (reverse lookup)
+    ---
+    parameters:
+      - name: lat
+        in: query
+        type: number
+        required: true
+      - name: lon
+        in: query
+        type: number
+        required: true
+      - name: radius
+        in: query
+        type: number
+        required: false
+        description: Return every cell within this many metres, nearest first; without it, only the nearest cell
+      - name: limit
+        in: query
+        type: integer
+        required: false
+    responses:
+      200:
+        description: Matching cells with their distance in metres
+      400:
+        description: Missing or invalid parameters
+    """
+    try:
+        lat, lon = float(request.args['lat']), float(request.args['lon'])
+        radius = float(request.args.get('radius', CELL_MAX_RADIUS))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except (KeyError, ValueError):
+        return jsonify({"error": "'lat' and 'lon' are required; 'radius' and 'limit' must be numbers"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not 0 < radius <= CELL_MAX_RADIUS:
+        return jsonify({"error": f"Coordinates out of range or radius not in (0, {CELL_MAX_RADIUS:g}] m"}), 400
+
+    if 'radius' in request.args:
+        found = cell_catalogue.nearby(lat, lon, radius, limit)
+    else:
+        nearest = cell_catalogue.nearest(lat, lon, radius)
+        found = [nearest] if nearest else []
+    return jsonify({
+        "cells": [{**cell_location(cell), "distance": distance} for distance, cell in found],
     })
 
 @app.route('/qos/sessions', methods=['POST'])
@@ -258,30 +1084,146 @@ def send_sms():
               example: "MyApp"
     responses:
       200:
-        description: SMS Sent Successfully
-      404:
-        description: Recipient not found/offline
+        description: SMS Sent Successfully (retransmitted by the SMSC until the UE acknowledges it)
+      202:
+        description: Recipient offline; SMS queued and delivered when the UE registers
+      400:
+        description: Body is not a JSON object
       500:
         description: Internal SMSC Error
     """
+    # A malformed body is the caller's error, not the SMSC's: reject it before the breaker sees it
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+
     # Proxy to mini-smsc
-    SMSC_URL = "http://mini-smsc:9091/sms/send"
     try:
-        resp = requests.post(SMSC_URL, json=request.json, timeout=2)
+        with upstream_stage("smsc_send"):
+            resp = check_server_error(upstream.smsc.post(f"{SMSC_URL}/sms/send", json=payload, timeout=2))
+        return jsonify(resp.json()), resp.status_code
+    except Exception as e:
+        return upstream_failure("Failed to contact SMSC", e)
+
+@app.route('/sms/send/batch', methods=['POST'])
+def send_sms_batch():
+    """
+    Start a Bulk A2P SMS Job
+    ---
+    tags:
+      - SMS
+    parameters:
+      - name: body
+        in: body
+        required: true
+        schema:
+          type: object
+          properties:
+            to:
+              type: array
+              items:
+                type: string
+              description: Recipients sharing one body (use either this or messages)
+              example: ["sip:1234567891@free5gc.org", "sip:1234567892@free5gc.org"]
+            messages:
+              type: array
+              description: Per-recipient messages; fields override the top-level body/from
+              items:
+                type: object
+                properties:
+                  to:
+                    type: string
+                  body:
+                    type: string
+                  from:
+                    type: string
+            body:
+              type: string
+              example: "Spring sale: 20% off"
+            from:
+              type: string
+              example: "MyApp"
+    responses:
+      202:
+        description: Job accepted; poll /sms/jobs/{job_id} for progress
+      400:
+        description: Malformed batch
+      413:
+        description: Too many messages in one batch
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Body must be a JSON object"}), 400
+
+    # Proxy to mini-smsc: one hop per campaign, the SMSC paces the sends
+    try:
+        with upstream_stage("smsc_send_batch"):
+            resp = check_server_error(upstream.smsc.post(f"{SMSC_URL}/sms/send/batch", json=payload, timeout=30))
+        return jsonify(resp.json()), resp.status_code
+    except Exception as e:
+        return upstream_failure("Failed to contact SMSC", e)
+
+@app.route('/sms/jobs/<int:job_id>', methods=['GET', 'DELETE'])
+def sms_job(job_id):
+    """
+    Bulk SMS Job Progress (DELETE cancels it)
+    ---
+    tags:
+      - SMS
+    parameters:
+      - name: job_id
+        in: path
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Job state, counts (submitted, sent, queued, failed), progress and send rate
+      404:
+        description: Unknown job id
+    """
+    try:
+        with upstream_stage("smsc_jobs"):
+            resp = upstream.smsc.request(request.method, f"{SMSC_URL}/sms/jobs/{job_id}", timeout=2)
         return jsonify(resp.json()), resp.status_code
     except Exception as e:
-        return jsonify({"error": "Failed to contact SMSC", "details": str(e)}), 500
+        return upstream_failure("Failed to contact SMSC", e)
 
 @app.route('/sms/messages', methods=['GET'])
 def get_sms_messages():
     """
-    Retrieve All SMS Messages (Debug/Inbox)
+    Retrieve Stored SMS Messages (Debug/Inbox)
     ---
     tags:
       - SMS
+    parameters:
+      - name: to
+        in: query
+        type: string
+        required: false
+        description: Only messages for this recipient (SIP URI, tel URI or bare MSISDN, e.g. 1234567891)
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size (default 100, max 1000)
+      - name: cursor
+        in: query
+        type: integer
+        required: false
+        description: Value of X-Next-Cursor from the previous page
+      - name: since
+        in: query
+        type: string
+        required: false
+        description: Only messages with a larger id (or 'latest'); resume from X-Next-Since
+      - name: wait
+        in: query
+        type: number
+        required: false
+        description: With since, hold an empty result open up to this many seconds (long-poll)
     responses:
       200:
-        description: List of stored messages by user
+        description: One page of stored messages by user, oldest first. X-Next-Cursor is set when more remain; X-Next-Since in since mode.
         schema:
           type: object
           additionalProperties:
@@ -289,6 +1231,8 @@ def get_sms_messages():
              items:
                type: object
                properties:
+                 id:
+                   type: integer
                  from:
                    type: string
                  body:
@@ -297,12 +1241,97 @@ def get_sms_messages():
                    type: string
     """
     # Proxy to mini-smsc
-    SMSC_URL = "http://mini-smsc:9091/sms/messages"
     try:
-        resp = requests.get(SMSC_URL, timeout=2)
-        return jsonify(resp.json()), resp.status_code
+        with upstream_stage("smsc_messages"):
+            resp = upstream.smsc.get(f"{SMSC_URL}/sms/messages", params=request.args,
+                                     timeout=smsc_read_timeout(request.args))
+        response = jsonify(resp.json())
+        for header in ('X-Next-Cursor', 'X-Next-Since'):
+            if header in resp.headers:
+                response.headers[header] = resp.headers[header]
+        return response, resp.status_code
     except Exception as e:
-        return jsonify({"error": "Failed to contact SMSC", "details": str(e)}), 500
+        return upstream_failure("Failed to contact SMSC", e)
+
+@app.route('/sms/stream', methods=['GET'])
+def stream_sms_messages():
+    """
+    Stream New SMS Messages (Server-Sent Events)
+    ---
+    tags:
+      - SMS
+    produces:
+      - text/event-stream
+    parameters:
+      - name: to
+        in: query
+        type: string
+        required: false
+        description: Only messages for this recipient
+      - name: since
+        in: query
+        type: string
+        required: false
+        description: Replay messages after this id first (default 'latest'; Last-Event-ID takes precedence)
+    responses:
+      200:
+        description: One 'message' event per stored message, with the message id as the event id
+      503:
+        description: SMSC circuit open
+    """
+    headers = {}
+    if 'Last-Event-ID' in request.headers:
+        headers['Last-Event-ID'] = request.headers['Last-Event-ID']
+    try:
+        with upstream_stage("smsc_stream"):
+            resp = upstream.smsc.get(f"{SMSC_URL}/sms/stream", params=request.args, headers=headers,
+                                     stream=True, timeout=(2, SMSC_STREAM_IDLE_TIMEOUT))
+    except Exception as e:
+        return upstream_failure("Failed to contact SMSC", e)
+    if resp.status_code != 200:
+        try:
+            return jsonify(resp.json()), resp.status_code
+        finally:
+            resp.close()
+
+    def relay():
+        # Events are relayed as the SMSC writes them; the client reconnects with Last-Event-ID if this ends
+        try:
+            for chunk in resp.iter_content(chunk_size=None):
+                yield chunk
+        except Exception as e:
+            print(f"[API] SMS stream from SMSC ended: {e}")
+        finally:
+            resp.close()
+
+    return Response(stream_with_context(relay()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+upstream.start()
+atexit.register(upstream.close)
+
+cell_catalogue.start(CELL_RELOAD_INTERVAL)
+
+if amf_subscription is not None:
+    amf_subscription.start()
+    atexit.register(amf_subscription.stop)
+
+if SESSION_INDEX:
+    start_session_index()
+
+if SIM_SWAP_INDEX:
+    start_sim_swap_index()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=9090)
+    # Docker stops containers with SIGTERM; exit normally so atexit closes the pools
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # kill -HUP reloads the cell catalogue now instead of at the next poll
+    signal.signal(signal.SIGHUP, lambda signum, frame: cell_catalogue.reload())
+    if NEF_SERVER == 'asgi':
+        import uvicorn
+        # Let asgi.py's 'import app' reuse this module instead of loading a second copy
+        sys.modules.setdefault('app', sys.modules[__name__])
+        import asgi
+        uvicorn.run(asgi.app, host='0.0.0.0', port=9090)
+    else:
+        app.run(host='0.0.0.0', port=9090)
@@ -0,0 +1,444 @@
+"""
+Async serving mode for Mini-NEF.
+
+The upstream-bound routes (/identity, /identity/batch, /sms/send,
+/sms/send/batch, /sms/jobs, /sms/messages, /sms/stream) run as coroutines
+on a non-blocking Mongo driver (motor) and HTTP client (httpx), so one process keeps many upstream calls in flight.
+Every other path, including /apidocs and the Swagger spec, is served by the
+regular Flask app mounted underneath, so routes and docs stay identical.
+
+Run with:  NEF_SERVER=asgi python app.py   (or: uvicorn asgi:app --port 9090)
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import math
+import time
+
+import httpx
+import motor.motor_asyncio
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as nef
+from breaker import CircuitOpenError
+from cache import NOT_FOUND
+from sessions import range_filter, ip_in_network
+import changefeed
+
+
+class AsyncUpstream:
+    """Async counterparts of clients.UpstreamClients, bound to the serving event loop."""
+
+    def __init__(self):
+        self.mongo = None
+        self.udm = None
+        self.smsc = None
+
+    def start(self):
+        self.mongo = motor.motor_asyncio.AsyncIOMotorClient(
+            nef.DB_URI, maxPoolSize=nef.MONGO_POOL_SIZE, serverSelectionTimeoutMS=2000)
+        limits = httpx.Limits(max_connections=nef.HTTP_POOL_SIZE,
+                              max_keepalive_connections=nef.HTTP_POOL_SIZE)
+        cleartext = nef.UDM_URL.startswith("http://")
+        self.udm = httpx.AsyncClient(limits=limits, http2=nef.UDM_HTTP2,
+                                     http1=not (nef.UDM_HTTP2 and cleartext))
+        self.smsc = httpx.AsyncClient(limits=limits)
+
+    @property
+    def db(self):
+        return self.mongo[nef.DB_NAME]
+
+    async def close(self):
+        await self.udm.aclose()
+        await self.smsc.aclose()
+        self.mongo.close()
+
+
+def upstream_failure(message, e):
+    """Async app.upstream_failure: 503 + Retry-After for an open circuit, 500 otherwise."""
+    headers = {}
+    if isinstance(e, CircuitOpenError):
+        headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return JSONResponse({"error": message, "details": str(e)}, status_code=nef.failure_status(e), headers=headers)
+
+
+upstream = AsyncUpstream()
+# Bounds concurrent UDM calls from batch/range requests; created inside the loop
+udm_slots = None
+
+
+async def find_supi_in_mongo(ip_addr):
+    with nef.upstream_stage("mongo_lookup"):
+        for collection, ip_path, supi_path in nef.parse_sources(nef.SESSION_SOURCES):
+            doc = await upstream.db[collection].find_one({ip_path: ip_addr})
+            if doc:
+                return next(changefeed.dotted_values(doc, supi_path), None)
+    return None
+
+
+async def find_supis_in_mongo(ip_addrs):
+    wanted = set(ip_addrs)
+    found = {}
+    with nef.upstream_stage("mongo_batch_lookup"):
+        for collection, ip_path, supi_path in nef.parse_sources(nef.SESSION_SOURCES):
+            pending = list(wanted - found.keys())
+            if not pending:
+                break
+            projection = {ip_path.split(".")[0]: 1, supi_path.split(".")[0]: 1}
+            async for doc in upstream.db[collection].find({ip_path: {"$in": pending}}, projection):
+                supi = next(changefeed.dotted_values(doc, supi_path), None)
+                for ip in changefeed.dotted_values(doc, ip_path):
+                    if ip in wanted and supi:
+                        found.setdefault(ip, supi)
+    return found
+
+
+async def find_supi_cached(ip_addr):
+    """Async app.find_supi_cached."""
+    supi = nef.resolution_cache.supi.get(ip_addr)
+    if supi is NOT_FOUND:
+        return None
+    if supi is None:
+        try:
+            supi = await find_supi_in_mongo(ip_addr)
+            nef.resolution_cache.supi.put(ip_addr, supi)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            print(f"Mongo Error: {e}")
+    return supi
+
+
+async def lookup_supi(ip_addr):
+    """Async app.lookup_supi: session index first (and cache + DB for its misses while polling), else cache + DB."""
+    if nef.session_index.ready:
+        supi = nef.session_index.lookup(ip_addr)
+        if supi is None and nef.session_index.polling:
+            supi = await find_supi_cached(ip_addr)
+    else:
+        supi = await find_supi_cached(ip_addr)
+
+    if not supi and ip_addr == nef.TEST_UE_IP:
+        return nef.TEST_SUPI
+    return supi
+
+
+async def lookup_supis(ip_addrs):
+    """Async app.lookup_supis. Raises on DB errors."""
+    result = {}
+    pending = ip_addrs
+    if nef.session_index.ready:
+        for ip in ip_addrs:
+            result[ip] = nef.session_index.lookup(ip)
+        pending = [ip for ip in ip_addrs if result[ip] is None] if nef.session_index.polling else []
+    misses = []
+    for ip in pending:
+        supi = nef.resolution_cache.supi.get(ip)
+        if supi is None:
+            misses.append(ip)
+        else:
+            result[ip] = None if supi is NOT_FOUND else supi
+    if misses:
+        found = await find_supis_in_mongo(misses)
+        for ip in misses:
+            result[ip] = found.get(ip)
+            nef.resolution_cache.supi.put(ip, result[ip])
+
+    if nef.TEST_UE_IP in result and not result[nef.TEST_UE_IP]:
+        result[nef.TEST_UE_IP] = nef.TEST_SUPI
+    return result
+
+
+async def get_msisdn_from_udm(supi):
+    with nef.upstream_stage("udm_gpsi"):
+        udm_resp = await upstream.udm.get(f"{nef.UDM_URL}/nudm-sdm/v1/{supi}/gpsi", timeout=5)
+        if udm_resp.status_code == 404:
+            return NOT_FOUND
+        udm_resp.raise_for_status()
+    gpsi = udm_resp.json().get('gpsi', '')
+    return gpsi.replace('msisdn-', '') if gpsi else ''
+
+
+async def fetch_msisdn(supi):
+    msisdn = await get_msisdn_from_udm(supi)
+    nef.resolution_cache.gpsi.put(supi, msisdn)
+    return msisdn
+
+
+async def lookup_msisdn(supi):
+    msisdn = nef.resolution_cache.gpsi.get(supi)
+    if msisdn is not None:
+        return msisdn
+    return await nef.udm_flight.do_async(supi, fetch_msisdn, supi)
+
+
+async def guarded_cursor(cursor):
+    """Async app.guarded_cursor over a motor cursor."""
+    docs = cursor.__aiter__()
+    with nef.breakers["mongo"].guard():
+        try:
+            first = await docs.__anext__()
+        except StopAsyncIteration:
+            return
+    yield first
+    async for doc in docs:
+        yield doc
+
+
+async def find_sessions_in_range(network):
+    """Async app.find_sessions_in_range over a motor cursor."""
+    seen = set()
+    for collection, ip_path, supi_path in nef.parse_sources(nef.SESSION_SOURCES):
+        projection = {ip_path.split(".")[0]: 1, supi_path.split(".")[0]: 1}
+        cursor = upstream.db[collection].find(range_filter(network, ip_path), projection).batch_size(nef.CIDR_BATCH_SIZE)
+        async for doc in guarded_cursor(cursor):
+            supi = next(changefeed.dotted_values(doc, supi_path), None)
+            if not supi:
+                continue
+            for ip in changefeed.dotted_values(doc, ip_path):
+                if ip not in seen and ip_in_network(ip, network):
+                    seen.add(ip)
+                    yield ip, supi
+
+
+async def stream_identity_range(network):
+    async def enrich(chunk):
+        distinct = list({supi for _, supi in chunk})
+        outcomes = await asyncio.gather(*(bounded_lookup(supi) for supi in distinct), return_exceptions=True)
+        msisdns = dict(zip(distinct, outcomes))
+        lines = []
+        for ip_addr, supi in chunk:
+            msisdn = msisdns[supi]
+            if isinstance(msisdn, Exception):
+                body, status = {"error": "Failed to query UDM", "details": str(msisdn)}, nef.failure_status(msisdn)
+            else:
+                body, status = nef.identity_result(ip_addr, supi, msisdn)
+            if status != 200:
+                body = dict(body, ip=ip_addr, supi=supi, status=status)
+            lines.append(json.dumps(body) + "\n")
+        return "".join(lines)
+
+    try:
+        chunk = []
+        async for pair in find_sessions_in_range(network):
+            chunk.append(pair)
+            if len(chunk) >= nef.CIDR_BATCH_SIZE:
+                yield await enrich(chunk)
+                chunk = []
+        if chunk:
+            yield await enrich(chunk)
+    except Exception as e:
+        print(f"Mongo Error: {e}")
+        yield json.dumps({"error": "Session range query failed", "details": str(e), "status": nef.failure_status(e)}) + "\n"
+
+
+async def bounded_lookup(supi):
+    async with udm_slots:
+        return await lookup_msisdn(supi)
+
+
+async def resolve_identity(request):
+    cidr = request.query_params.get('cidr')
+    if cidr:
+        network, error = nef.parse_cidr(cidr)
+        if error:
+            return JSONResponse({"error": error}, status_code=400)
+        print(f"Exporting identity range: {network}")
+        return StreamingResponse(stream_identity_range(network), media_type='application/x-ndjson')
+
+    ip_addr = request.query_params.get('ip')
+    if not ip_addr:
+        return JSONResponse({"error": "Missing 'ip' parameter"}, status_code=400)
+
+    print(f"Resolving IP: {ip_addr}")
+    try:
+        supi = await lookup_supi(ip_addr)
+    except CircuitOpenError as e:
+        return upstream_failure("Session lookup failed", e)
+    if not supi:
+        return JSONResponse({"error": "Session not found (BSF missing and DB lookup failed)"}, status_code=404)
+
+    try:
+        msisdn = await lookup_msisdn(supi)
+    except Exception as e:
+        return upstream_failure("Failed to query UDM", e)
+
+    body, status = nef.identity_result(ip_addr, supi, msisdn)
+    return JSONResponse(body, status_code=status)
+
+
+async def resolve_identity_batch(request):
+    try:
+        data = await request.json()
+    except Exception:
+        data = None
+    ip_addrs = data.get('ips') if isinstance(data, dict) else None
+    if not isinstance(ip_addrs, list) or not ip_addrs:
+        return JSONResponse({"error": "Missing 'ips' list in body"}, status_code=400)
+    if len(ip_addrs) > nef.BATCH_MAX_IPS:
+        return JSONResponse({"error": f"Too many IPs (max {nef.BATCH_MAX_IPS})"}, status_code=400)
+
+    print(f"Resolving batch of {len(ip_addrs)} IPs")
+    try:
+        supis = await lookup_supis([ip for ip in ip_addrs if isinstance(ip, str)])
+    except Exception as e:
+        print(f"Mongo Error: {e}")
+        return upstream_failure("Session lookup failed", e)
+
+    distinct = [supi for supi in set(supis.values()) if supi]
+    outcomes = await asyncio.gather(*(bounded_lookup(supi) for supi in distinct), return_exceptions=True)
+    msisdns = dict(zip(distinct, outcomes))
+
+    results = []
+    for ip_addr in ip_addrs:
+        supi = supis.get(ip_addr) if isinstance(ip_addr, str) else None
+        if not supi:
+            results.append({"ip": ip_addr, "error": "Session not found", "status": 404})
+            continue
+        msisdn = msisdns[supi]
+        if isinstance(msisdn, Exception):
+            body, status = {"error": "Failed to query UDM", "details": str(msisdn)}, nef.failure_status(msisdn)
+        else:
+            body, status = nef.identity_result(ip_addr, supi, msisdn)
+        if status != 200:
+            body = dict(body, ip=ip_addr, status=status)
+        results.append(body)
+
+    return JSONResponse({"results": results})
+
+
+async def json_object(request):
+    """The request body if it is a JSON object, else None (checked before any upstream call)."""
+    try:
+        payload = await request.json()
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+async def send_sms(request):
+    payload = await json_object(request)
+    if payload is None:
+        return JSONResponse({"error": "Body must be a JSON object"}, status_code=400)
+    try:
+        with nef.upstream_stage("smsc_send"):
+            resp = nef.check_server_error(
+                await upstream.smsc.post(f"{nef.SMSC_URL}/sms/send", json=payload, timeout=2))
+        return JSONResponse(resp.json(), status_code=resp.status_code)
+    except Exception as e:
+        return upstream_failure("Failed to contact SMSC", e)
+
+
+async def send_sms_batch(request):
+    payload = await json_object(request)
+    if payload is None:
+        return JSONResponse({"error": "Body must be a JSON object"}, status_code=400)
+    try:
+        with nef.upstream_stage("smsc_send_batch"):
+            resp = nef.check_server_error(
+                await upstream.smsc.post(f"{nef.SMSC_URL}/sms/send/batch", json=payload, timeout=30))
+        return JSONResponse(resp.json(), status_code=resp.status_code)
+    except Exception as e:
+        return upstream_failure("Failed to contact SMSC", e)
+
+
+async def sms_job(request):
+    try:
+        job_id = request.path_params['job_id']
+        with nef.upstream_stage("smsc_jobs"):
+            resp = await upstream.smsc.request(request.method, f"{nef.SMSC_URL}/sms/jobs/{job_id}", timeout=2)
+        return JSONResponse(resp.json(), status_code=resp.status_code)
+    except Exception as e:
+        return upstream_failure("Failed to contact SMSC", e)
+
+
+async def get_sms_messages(request):
+    try:
+        with nef.upstream_stage("smsc_messages"):
+            resp = await upstream.smsc.get(f"{nef.SMSC_URL}/sms/messages", params=dict(request.query_params),
+                                           timeout=nef.smsc_read_timeout(request.query_params))
+        headers = {}
+        for header in ('X-Next-Cursor', 'X-Next-Since'):
+            if header in resp.headers:
+                headers[header] = resp.headers[header]
+        return JSONResponse(resp.json(), status_code=resp.status_code, headers=headers)
+    except Exception as e:
+        return upstream_failure("Failed to contact SMSC", e)
+
+
+async def stream_sms_messages(request):
+    headers = {}
+    if 'last-event-id' in request.headers:
+        headers['Last-Event-ID'] = request.headers['last-event-id']
+    try:
+        with nef.upstream_stage("smsc_stream"):
+            upstream_request = upstream.smsc.build_request(
+                "GET", f"{nef.SMSC_URL}/sms/stream", params=dict(request.query_params), headers=headers,
+                timeout=httpx.Timeout(nef.SMSC_STREAM_IDLE_TIMEOUT, connect=2),
+            )
+            resp = await upstream.smsc.send(upstream_request, stream=True)
+    except Exception as e:
+        return upstream_failure("Failed to contact SMSC", e)
+    if resp.status_code != 200:
+        try:
+            await resp.aread()
+            return JSONResponse(resp.json(), status_code=resp.status_code)
+        finally:
+            await resp.aclose()
+
+    async def relay():
+        try:
+            async for chunk in resp.aiter_raw():
+                yield chunk
+        except Exception as e:
+            print(f"[API] SMS stream from SMSC ended: {e}")
+        finally:
+            await resp.aclose()
+
+    return StreamingResponse(relay(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def timed(route):
+    """Record the same request metrics the Flask hooks record for mounted routes."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            start = time.perf_counter()
+            response = await handler(request)
+            nef.REQUEST_LATENCY.observe(time.perf_counter() - start, route, request.method)
+            nef.REQUESTS.inc(route, request.method, response.status_code)
+            return response
+        return wrapper
+    return decorator
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    global udm_slots
+    upstream.start()
+    udm_slots = asyncio.Semaphore(nef.BATCH_UDM_CONCURRENCY)
+    print("[ASGI] Async upstream clients ready")
+    yield
+    await upstream.close()
+    print("[ASGI] Async upstream clients closed")
+
+
+app = Starlette(
+    routes=[
+        Route('/identity', timed('/identity')(resolve_identity), methods=['GET']),
+        Route('/identity/batch', timed('/identity/batch')(resolve_identity_batch), methods=['POST']),
+        Route('/sms/send', timed('/sms/send')(send_sms), methods=['POST']),
+        Route('/sms/send/batch', timed('/sms/send/batch')(send_sms_batch), methods=['POST']),
+        Route('/sms/jobs/{job_id:int}', timed('/sms/jobs/<int:job_id>')(sms_job), methods=['GET', 'DELETE']),
+        Route('/sms/messages', timed('/sms/messages')(get_sms_messages), methods=['GET']),
+        Route('/sms/stream', timed('/sms/stream')(stream_sms_messages), methods=['GET']),
+        # Everything else (docs, SIM swap, location, QoS, stats, metrics) stays on Flask
+        Mount('/', app=WsgiToAsgi(nef.app)),
+    ],
+    lifespan=lifespan,
+)
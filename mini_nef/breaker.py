@@ -0,0 +1,126 @@
+"""
+Circuit breakers for mini_nef's upstreams (Mongo, UDM, SMSC).
+
+closed:    calls go through; failure_threshold consecutive failures open it.
+open:      calls fail immediately with CircuitOpenError for recovery_timeout.
+half_open: up to half_open_max trial calls go through; that many successes
+           close the circuit, any failure opens it again.
+
+A dead dependency then costs a lock acquisition per request instead of a
+worker thread blocked for the full connect/read timeout.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit is open, failing fast (retry in {retry_after:.1f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, recovery_timeout=10.0, half_open_max=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max = half_open_max
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+        self._rejected = 0
+        self._opens = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def check(self):
+        """Admit a call or raise CircuitOpenError without touching the upstream."""
+        with self._lock:
+            if self._state == CLOSED:
+                return
+            if self._state == OPEN:
+                remaining = self._opened_at + self.recovery_timeout - time.monotonic()
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(HALF_OPEN, "recovery timeout elapsed")
+            if self._trials >= self.half_open_max:
+                # Trial calls already in flight; everyone else keeps failing fast
+                self._rejected += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._trials += 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trials = max(self._trials - 1, 0)
+                self._trial_successes += 1
+                if self._trial_successes >= self.half_open_max:
+                    self._transition(CLOSED, "trial call succeeded")
+            else:
+                self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(OPEN, "trial call failed")
+            elif self._state == CLOSED:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._transition(OPEN, f"{self._failures} consecutive failures")
+
+    def release(self):
+        """An admitted call ended without a verdict (e.g. an abandoned stream)."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trials = max(self._trials - 1, 0)
+
+    @contextmanager
+    def guard(self):
+        """check(), then record the outcome of the wrapped call."""
+        self.check()
+        try:
+            yield
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release()
+            raise
+        else:
+            self.record_success()
+
+    def _transition(self, state, reason):
+        print(f"[Breaker] {self.name}: {self._state} -> {state} ({reason})")
+        self._state = state
+        self._failures = 0
+        self._trials = 0
+        self._trial_successes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self._opens += 1
+
+    def stats(self):
+        with self._lock:
+            retry_after = 0.0
+            if self._state == OPEN:
+                retry_after = max(self._opened_at + self.recovery_timeout - time.monotonic(), 0.0)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "rejected": self._rejected,
+                "opens": self._opens,
+                "retry_after": round(retry_after, 3),
+            }
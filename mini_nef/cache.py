@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel stored for negative entries (e.g. UDM answered 404).
+# Kept distinct from None so callers can tell "known missing" from "not cached".
+NOT_FOUND = object()
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry expiry.
+    Thread-safe; every operation is O(1) under a single short lock.
+    """
+
+    def __init__(self, name, max_entries, ttl, negative_ttl):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached value, NOT_FOUND for a negative entry, or None on miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            if value is NOT_FOUND:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return value
+
+    def put(self, key, value):
+        ttl = self.ttl
+        if value is None or value is NOT_FOUND:
+            value = NOT_FOUND
+            ttl = self.negative_ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class ResolutionCache:
+    """
+    Cache for identity resolution:
+      - supi: UE IP -> SUPI (session binding, changes with PDU session churn)
+      - gpsi: SUPI -> MSISDN (subscription data, changes rarely)
+      - msisdn: MSISDN -> SUPI (subscription data, for /location)
+    Each leg has its own TTL; both share the LRU size cap and negative TTL.
+    """
+
+    def __init__(self, max_entries, supi_ttl, gpsi_ttl, negative_ttl):
+        self.supi = TTLCache("supi", max_entries, supi_ttl, negative_ttl)
+        self.gpsi = TTLCache("gpsi", max_entries, gpsi_ttl, negative_ttl)
+        self.msisdn = TTLCache("msisdn", max_entries, gpsi_ttl, negative_ttl)
+
+    def stats(self):
+        return {"supi": self.supi.stats(), "gpsi": self.gpsi.stats(), "msisdn": self.msisdn.stats()}
@@ -0,0 +1,328 @@
+"""
+Cell-site database: NR cell (NCGI) -> coordinates, behind /location.
+
+The catalogue is a CSV (mcc,mnc,nci,tac,lat,lon,accuracy; nci in hex). It is
+compiled once into a flat binary table next to it and memory-mapped; the
+columns are typed memoryviews over the mapping, so opening costs nothing and
+a lookup touches a handful of pages:
+
+  - NCGI -> cell: open-addressing hash (load <= 0.5) of row numbers, probed
+    with the packed NCGI; one array read per probe.
+  - (lat, lon) -> cells: rows are stored sorted by a grid square key
+    (GRID_STEP degrees), so the cells of one grid row form a contiguous,
+    binary-searchable range. nearby() scans only the squares the radius
+    covers; nearest() widens the radius until something is found.
+
+The compiled table records the CSV's mtime and size; it is reused across
+restarts while they match and rebuilt (to a temp file, then renamed) when
+the CSV changes. CellCatalogue polls for that and swaps tables atomically,
+so the catalogue reloads without restarting the NEF.
+"""
+import bisect
+import collections
+import csv
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+
+# Columns are written in native byte order; the magic says which
+MAGIC = b"CELLDB1" + (b"<" if sys.byteorder == "little" else b">")
+HEADER = struct.Struct("=8sQQdqq")  # magic, rows, hash slots, grid step, source mtime_ns, source size
+EARTH_RADIUS_M = 6371008.8
+FIB_HASH = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+
+Cell = collections.namedtuple("Cell", "ncgi tac latitude longitude accuracy")
+
+
+def ncgi_key(mcc, mnc, nci):
+    """Pack PLMN + 36-bit NR cell identity into one integer (2- and 3-digit MNCs stay distinct)."""
+    mcc, mnc = str(mcc).strip(), str(mnc).strip()
+    if not (len(mcc) == 3 and mcc.isdigit() and len(mnc) in (2, 3) and mnc.isdigit()):
+        raise ValueError(f"bad PLMN {mcc}/{mnc}")
+    if not 0 <= nci < 1 << 36:
+        raise ValueError(f"NR cell identity out of range: {nci:#x}")
+    plmn = int(mcc) * 2000 + (1000 + int(mnc) if len(mnc) == 3 else int(mnc))
+    return plmn << 36 | nci
+
+
+def format_ncgi(key):
+    """'<mcc><mnc><nci as 9 hex digits>', e.g. '20893000000010'."""
+    plmn, nci = key >> 36, key & ((1 << 36) - 1)
+    mcc, mnc = divmod(plmn, 2000)
+    mnc = f"{mnc - 1000:03d}" if mnc >= 1000 else f"{mnc:02d}"
+    return f"{mcc:03d}{mnc}{nci:09x}"
+
+
+def parse_ncgi(value):
+    """
+    Packed key for an NCGI given as a string ('20893000000010', '208-93-000000010')
+    or as a TS 29.571 Ncgi object ({"plmnId": {"mcc", "mnc"}, "nrCellId"}).
+    Raises ValueError if it is neither.
+    """
+    if isinstance(value, dict):
+        plmn = value.get("plmnId") or {}
+        return ncgi_key(plmn.get("mcc", ""), plmn.get("mnc", ""), int(str(value.get("nrCellId", "")), 16))
+    text = str(value).strip()
+    if "-" in text:
+        mcc, mnc, nci = text.split("-")
+    elif len(text) in (14, 15):
+        mcc, mnc, nci = text[:3], text[3:-9], text[-9:]
+    else:
+        raise ValueError(f"bad NCGI {value!r}")
+    return ncgi_key(mcc, mnc, int(nci, 16))
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Great-circle (haversine) distance in metres."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def read_catalogue(path):
+    """(rows, skipped): rows are (key, tac, lat, lon, accuracy); later duplicates of an NCGI win."""
+    rows = {}
+    skipped = 0
+    with open(path, newline="") as f:
+        for record in csv.DictReader(line for line in f if not line.lstrip().startswith("#")):
+            try:
+                key = ncgi_key(record["mcc"], record["mnc"], int(record["nci"], 16))
+                lat, lon = float(record["lat"]), float(record["lon"])
+                if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                    raise ValueError("coordinates out of range")
+                rows[key] = (key, int(record.get("tac") or 0), lat, lon, float(record.get("accuracy") or 0))
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+    return list(rows.values()), skipped
+
+
+class Grid:
+    def __init__(self, step):
+        self.step = step
+        self.rows = math.ceil(180 / step)
+        self.cols = math.ceil(360 / step)
+
+    def row(self, lat):
+        return min(max(int((lat + 90) / self.step), 0), self.rows - 1)
+
+    def col(self, lon):
+        return min(max(int((lon + 180) / self.step), 0), self.cols - 1)
+
+    def key(self, lat, lon):
+        return self.row(lat) * self.cols + self.col(lon)
+
+    def ranges(self, lat, lon, radius_m):
+        """Inclusive (first, last) grid key ranges covering a circle, one or two per grid row."""
+        dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        widest = abs(lat) + dlat
+        if widest >= 90:
+            spans = [(0, self.cols - 1)]
+        else:
+            dlon = math.degrees(radius_m / (EARTH_RADIUS_M * math.cos(math.radians(widest))))
+            first = math.floor((lon - dlon + 180) / self.step)
+            last = math.floor((lon + dlon + 180) / self.step)
+            if dlon >= 180 or last - first + 1 >= self.cols:
+                spans = [(0, self.cols - 1)]
+            elif first < 0:  # crosses the antimeridian westwards
+                spans = [(0, last), (first + self.cols, self.cols - 1)]
+            elif last >= self.cols:
+                spans = [(first, self.cols - 1), (0, last - self.cols)]
+            else:
+                spans = [(first, last)]
+        for row in range(self.row(lat - dlat), self.row(lat + dlat) + 1):
+            for first, last in spans:
+                yield row * self.cols + first, row * self.cols + last
+
+
+class CellTable:
+    """A compiled, memory-mapped cell table. Use build() to write one and open() to map it."""
+
+    def __init__(self, mm, path):
+        magic, count, slots, step, self.source_mtime, self.source_size = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a cell table for this platform")
+        self.path = path
+        self._mm = mm
+        self.count, self.slots = count, slots
+        self.grid = Grid(step)
+        self._shift = 64 - (slots.bit_length() - 1)
+        self._view = view = memoryview(mm)
+        at = HEADER.size
+        columns = []
+        for code, size, length in (("Q", 8, count), ("Q", 8, count), ("d", 8, count), ("d", 8, count),
+                                   ("f", 4, count), ("I", 4, count), ("I", 4, slots)):
+            columns.append(view[at:at + size * length].cast(code))
+            at += (size * length + 7) & ~7
+        self.keys, self.grid_keys, self.lat, self.lon, self.accuracy, self.tac, self._slots = columns
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mm, path)
+
+    @staticmethod
+    def build(rows, path, grid_step=0.01, source_mtime=0, source_size=0):
+        """Write rows (key, tac, lat, lon, accuracy) as a table at path (via a temp file and rename)."""
+        grid = Grid(grid_step)
+        rows = sorted(rows, key=lambda r: grid.key(r[2], r[3]))
+        count = len(rows)
+        slots = 1 << max(1, (2 * count - 1).bit_length())
+        shift = 64 - (slots.bit_length() - 1)
+        table = array("I", bytes(4 * slots))
+        for index, row in enumerate(rows):
+            slot = ((row[0] * FIB_HASH) & MASK64) >> shift
+            while table[slot]:
+                slot = (slot + 1) & (slots - 1)
+            table[slot] = index + 1
+        columns = [array("Q", (r[0] for r in rows)), array("Q", (grid.key(r[2], r[3]) for r in rows)),
+                   array("d", (r[2] for r in rows)), array("d", (r[3] for r in rows)),
+                   array("f", (r[4] for r in rows)), array("I", (r[1] for r in rows)), table]
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, count, slots, grid_step, source_mtime, source_size))
+            for column in columns:
+                data = column.tobytes()
+                f.write(data + bytes(-len(data) % 8))
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return self.count
+
+    def cell(self, index):
+        return Cell(format_ncgi(self.keys[index]), self.tac[index], self.lat[index], self.lon[index],
+                    round(self.accuracy[index], 1))
+
+    def index_of(self, key):
+        slot = ((key * FIB_HASH) & MASK64) >> self._shift
+        mask = self.slots - 1
+        while True:
+            entry = self._slots[slot]
+            if not entry:
+                return None
+            if self.keys[entry - 1] == key:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def get(self, key):
+        """Cell for a packed NCGI key (see parse_ncgi), or None."""
+        index = self.index_of(key)
+        return None if index is None else self.cell(index)
+
+    def nearby(self, lat, lon, radius_m, limit=None):
+        """[(distance_m, Cell)] within radius_m of (lat, lon), nearest first."""
+        found = []
+        for first, last in self.grid.ranges(lat, lon, radius_m):
+            lo = bisect.bisect_left(self.grid_keys, first)
+            hi = bisect.bisect_right(self.grid_keys, last, lo)
+            for index in range(lo, hi):
+                d = distance_m(lat, lon, self.lat[index], self.lon[index])
+                if d <= radius_m:
+                    found.append((d, index))
+        found.sort()
+        return [(round(d, 1), self.cell(index)) for d, index in found[:limit]]
+
+    def nearest(self, lat, lon, max_radius_m=50000):
+        """(distance_m, Cell) of the closest cell within max_radius_m, or None."""
+        radius = min(1000.0, max_radius_m)
+        while True:
+            found = self.nearby(lat, lon, radius, limit=1)
+            if found or radius >= max_radius_m:
+                return found[0] if found else None
+            radius = min(radius * 4, max_radius_m)
+
+    def close(self):
+        for column in (self.keys, self.grid_keys, self.lat, self.lon, self.accuracy, self.tac, self._slots):
+            column.release()
+        self._view.release()
+        self._mm.close()
+
+
+class CellCatalogue:
+    """
+    The live CellTable for a CSV catalogue. reload() recompiles when the CSV
+    changed and swaps the new table in; readers holding the old one finish
+    on it (it is unmapped once unreferenced).
+    """
+
+    def __init__(self, csv_path, table_path, grid_step=0.01):
+        self.csv_path = csv_path
+        self.table_path = table_path
+        self.grid_step = grid_step
+        self.table = None
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def __len__(self):
+        table = self.table
+        return len(table) if table else 0
+
+    def reload(self):
+        """Bring the table in line with the CSV; True if a new table was swapped in."""
+        with self._lock:
+            try:
+                st = os.stat(self.csv_path)
+            except OSError:
+                if self.table is None:
+                    print(f"[Cells] No cell catalogue at {self.csv_path}")
+                return False
+            table = self.table
+            if table and (table.source_mtime, table.source_size) == (st.st_mtime_ns, st.st_size):
+                return False
+            try:
+                # A table compiled from this very CSV survives restarts
+                table = CellTable.open(self.table_path)
+                if (table.source_mtime, table.source_size, table.grid.step) != (st.st_mtime_ns, st.st_size,
+                                                                                 self.grid_step):
+                    table.close()
+                    table = None
+            except (OSError, ValueError, struct.error):
+                table = None
+            if table is None:
+                rows, skipped = read_catalogue(self.csv_path)
+                CellTable.build(rows, self.table_path, self.grid_step, st.st_mtime_ns, st.st_size)
+                table = CellTable.open(self.table_path)
+                print(f"[Cells] Compiled {len(rows)} cells from {self.csv_path}"
+                      + (f" ({skipped} malformed row(s) skipped)" if skipped else ""))
+            self.table = table
+            self.reloads += 1
+            return True
+
+    def lookup(self, ncgi):
+        """Cell for an NCGI (string or Ncgi object); ValueError if it is malformed."""
+        key = parse_ncgi(ncgi)
+        table = self.table
+        return table.get(key) if table else None
+
+    def nearby(self, lat, lon, radius_m, limit=None):
+        table = self.table
+        return table.nearby(lat, lon, radius_m, limit) if table else []
+
+    def nearest(self, lat, lon, max_radius_m=50000):
+        table = self.table
+        return table.nearest(lat, lon, max_radius_m) if table else None
+
+    def start(self, interval=10.0):
+        """Load the catalogue now, then watch it for changes every interval seconds."""
+        self._try_reload()
+        threading.Thread(target=self._run, args=(interval,), name="cell-catalogue", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _try_reload(self):
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"[Cells] Reload failed, keeping the current table: {e}")
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self._try_reload()
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from pymongo.errors import PyMongoError, OperationFailure
+
+
+def follow(client, db_name, collections, on_change, on_resync, poll_interval=30, name="changefeed",
+           on_polling=None):
+    """
+    Keep an in-memory view in sync with a set of MongoDB collections.
+
+    Opens a change stream, then calls on_resync(db) for the initial full load
+    (stream first, so nothing committed during the load is missed), then feeds
+    every change event to on_change(event). On stream loss it resumes from the
+    last token; if that fails it resyncs. Standalone servers have no change
+    streams, so it degrades to calling on_resync every poll_interval seconds,
+    calling on_polling() first so the view can tell it is no longer live.
+    Runs on a daemon thread; returns the thread.
+    """
+    def run():
+        db = client[db_name]
+        pipeline = [{"$match": {"ns.coll": {"$in": list(collections)}}}]
+        resume_token = None
+        needs_resync = True
+        while True:
+            try:
+                with db.watch(pipeline, full_document="updateLookup",
+                              resume_after=resume_token) as stream:
+                    if needs_resync:
+                        on_resync(db)
+                        needs_resync = False
+                    print(f"[{name}] Following change stream on {', '.join(collections)}")
+                    for event in stream:
+                        resume_token = stream.resume_token
+                        if event.get("operationType") in ("drop", "rename", "dropDatabase", "invalidate"):
+                            resume_token = None
+                            needs_resync = True
+                            break
+                        on_change(event)
+            except OperationFailure as e:
+                if e.code in (40573, 40324) or "replica set" in str(e):
+                    # Change streams unsupported (standalone mongod): poll instead
+                    print(f"[{name}] Change streams unavailable ({e}); polling every {poll_interval}s")
+                    if on_polling:
+                        on_polling()
+                    _poll(db, on_resync, poll_interval, name)
+                    return
+                print(f"[{name}] Change stream error: {e}")
+                resume_token = None
+                needs_resync = True
+                time.sleep(1)
+            except PyMongoError as e:
+                print(f"[{name}] Change stream interrupted: {e}")
+                time.sleep(1)
+            except Exception as e:
+                print(f"[{name}] Handler error: {e}")
+                resume_token = None
+                needs_resync = True
+                time.sleep(1)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+def _poll(db, on_resync, poll_interval, name):
+    while True:
+        try:
+            on_resync(db)
+        except Exception as e:
+            print(f"[{name}] Reload failed: {e}")
+        time.sleep(poll_interval)
+
+
+def dotted_values(doc, path):
+    """Yield every value at a dotted path, descending through arrays."""
+    parts = path.split(".")
+
+    def walk(node, i):
+        if isinstance(node, list):
+            for item in node:
+                yield from walk(item, i)
+            return
+        if i == len(parts):
+            if node is not None:
+                yield node
+            return
+        if isinstance(node, dict) and parts[i] in node:
+            yield from walk(node[parts[i]], i + 1)
+
+    return walk(doc, 0)
+
@@ -0,0 +1,116 @@
+import threading
+from urllib.parse import urlparse
+
+import pymongo
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # Optional: HTTP/2 towards the SBI
+except ImportError:
+    httpx = None
+
+
+class UpstreamClients:
+    """
+    Process-wide upstream connections for the NEF:
+      - one MongoClient (a single connection pool shared by every request)
+      - one keep-alive HTTP session for UDM, HTTP/2 when enabled and httpx is installed
+      - one keep-alive HTTP session for the SMSC API
+      - one keep-alive HTTP session for the AMF (location)
+    Created once at startup, closed at shutdown.
+    """
+
+    def __init__(self, db_uri, db_name, udm_url, mongo_pool_size=50, http_pool_size=50, udm_http2=False):
+        self.db_uri = db_uri
+        self.db_name = db_name
+        self.udm_url = udm_url
+        self.mongo_pool_size = mongo_pool_size
+        self.http_pool_size = http_pool_size
+        self.udm_http2 = udm_http2
+        self._mongo = None
+        self._udm = None
+        self._smsc = None
+        self._amf = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Eagerly create all clients (pymongo connects in the background)."""
+        self.mongo
+        self.udm
+        self.smsc
+        self.amf
+        print(f"[Clients] Mongo pool={self.mongo_pool_size}, UDM via {self.udm_protocol()}, HTTP pool={self.http_pool_size}")
+
+    @property
+    def mongo(self):
+        if self._mongo is None:
+            with self._lock:
+                if self._mongo is None:
+                    self._mongo = pymongo.MongoClient(
+                        self.db_uri,
+                        maxPoolSize=self.mongo_pool_size,
+                        serverSelectionTimeoutMS=2000,
+                    )
+        return self._mongo
+
+    @property
+    def db(self):
+        return self.mongo[self.db_name]
+
+    @property
+    def udm(self):
+        if self._udm is None:
+            with self._lock:
+                if self._udm is None:
+                    if self.udm_http2 and httpx is not None:
+                        # free5GC SBI speaks h2c: cleartext needs HTTP/2 prior knowledge
+                        cleartext = urlparse(self.udm_url).scheme == "http"
+                        self._udm = httpx.Client(
+                            http1=not cleartext,
+                            http2=True,
+                            limits=httpx.Limits(max_connections=self.http_pool_size,
+                                                max_keepalive_connections=self.http_pool_size),
+                        )
+                    else:
+                        self._udm = self._http_session()
+        return self._udm
+
+    @property
+    def smsc(self):
+        if self._smsc is None:
+            with self._lock:
+                if self._smsc is None:
+                    self._smsc = self._http_session()
+        return self._smsc
+
+    @property
+    def amf(self):
+        if self._amf is None:
+            with self._lock:
+                if self._amf is None:
+                    self._amf = self._http_session()
+        return self._amf
+
+    def udm_protocol(self):
+        if self.udm_http2 and httpx is None:
+            return "HTTP/1.1 (httpx not installed, HTTP/2 disabled)"
+        return "HTTP/2" if self.udm_http2 else "HTTP/1.1"
+
+    def _http_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.http_pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        with self._lock:
+            for client in (self._udm, self._smsc, self._amf, self._mongo):
+                if client is not None:
+                    try:
+                        client.close()
+                    except Exception as e:
+                        print(f"[Clients] Close error: {e}")
+            self._mongo = self._udm = self._smsc = self._amf = None
+        print("[Clients] Upstream connections closed")
@@ -0,0 +1,247 @@
+"""
+UE location freshness cache for /location, fed by AMF event exposure.
+
+The AMF reports where a UE is through Namf_EventExposure LOCATION_REPORT
+notifications. The NEF keeps one anyUE subscription open (AmfSubscription)
+and every report updates a per-SUPI cache entry with the serving cell and
+the time the AMF observed it. A partner request carries maxAge: if the
+cached observation is at most that old it is served as-is, otherwise the
+caller asks the AMF on demand (Namf_Location ProvideLocationInfo, see
+provide_location) and stores the answer. With the subscription running, the
+steady state is that the cache is always fresh and the AMF is only asked
+for UEs it has not reported on.
+"""
+import collections
+import datetime
+import threading
+import time
+import uuid
+
+from celldb import format_ncgi, parse_ncgi
+
+Fix = collections.namedtuple("Fix", "ncgi observed_at source")
+
+
+def parse_time(value):
+    """Epoch seconds for an RFC 3339 DateTime (any fraction length, 'Z' or offset); None if invalid."""
+    if not value:
+        return None
+    text = str(value).strip().replace("z", "Z").replace("Z", "+00:00")
+    date, sep, rest = text.partition("T")
+    if "." in rest:
+        # fromisoformat takes at most 6 fractional digits; Go writes up to 9
+        seconds, _, fraction = rest.partition(".")
+        digits = len(fraction) - len(fraction.lstrip("0123456789"))
+        rest = f"{seconds}.{fraction[:digits][:6].ljust(6, '0')}{fraction[digits:]}"
+    try:
+        parsed = datetime.datetime.fromisoformat(date + sep + rest)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.timestamp()
+
+
+def format_time(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def user_location_fix(location, reported_at=None, source="amf"):
+    """
+    Fix from a TS 29.571 UserLocation (NR only), or None. The observation
+    time is ueLocationTimestamp, else the report time less
+    ageOfLocationInformation (minutes), else the report time.
+    """
+    nr = (location or {}).get("nrLocation") or {}
+    ncgi = nr.get("ncgi")
+    if not ncgi:
+        return None
+    try:
+        key = parse_ncgi(ncgi)
+    except ValueError:
+        return None
+    now = time.time()
+    reported_at = now if reported_at is None else reported_at
+    observed_at = parse_time(nr.get("ueLocationTimestamp"))
+    if observed_at is None:
+        age_minutes = nr.get("ageOfLocationInformation")
+        observed_at = reported_at - 60 * age_minutes if isinstance(age_minutes, int) else reported_at
+    return Fix(format_ncgi(key), min(observed_at, now), source)
+
+
+def location_reports(notification):
+    """Yield (supi, Fix) for the LOCATION_REPORTs in an AmfEventNotification."""
+    for report in notification.get("reportList") or []:
+        if report.get("type") != "LOCATION_REPORT" or not report.get("supi"):
+            continue
+        fix = user_location_fix(report.get("location"), parse_time(report.get("timeStamp")), "report")
+        if fix is not None:
+            yield report["supi"], fix
+
+
+class LocationCache:
+    """
+    SUPI -> latest Fix, bounded LRU. A fix older than the cached one (a
+    late, reordered notification) does not replace it.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+        self.updates = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def update(self, supi, fix):
+        with self._lock:
+            current = self._data.get(supi)
+            if current is not None and current.observed_at > fix.observed_at:
+                return False
+            self._data[supi] = fix
+            self._data.move_to_end(supi)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            self.updates += 1
+            return True
+
+    def get(self, supi, max_age, now=None):
+        """(Fix, fresh): the cached fix (None if unknown) and whether it is at most max_age seconds old."""
+        now = time.time() if now is None else now
+        with self._lock:
+            fix = self._data.get(supi)
+            if fix is None:
+                self.misses += 1
+                return None, False
+            self._data.move_to_end(supi)
+            if now - fix.observed_at <= max_age:
+                self.hits += 1
+                return fix, True
+            self.stale += 1
+            return fix, False
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "stale": self.stale,
+                    "misses": self.misses, "updates": self.updates}
+
+
+def provide_location(http, amf_url, supi, timeout=5):
+    """
+    Namf_Location ProvideLocationInfo for one UE: its current (or last known)
+    location as a Fix; None when the AMF has no context for it (404) or
+    reports no NR cell. Raises on other failures.
+    """
+    resp = http.post(f"{amf_url}/namf-loc/v1/{supi}/provide-loc-info",
+                     json={"req5gsLoc": True, "reqCurrentLoc": True}, timeout=timeout)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    info = resp.json()
+    now = time.time()
+    age_minutes = info.get("locationAge")
+    reported_at = now - 60 * age_minutes if isinstance(age_minutes, int) and not info.get("currentLoc") else now
+    return user_location_fix(info.get("location"), reported_at, "amf")
+
+
+class AmfSubscription:
+    """
+    One anyUE LOCATION_REPORT subscription at the AMF, kept alive on a daemon
+    thread: created at start, recreated (new one first, then the old one
+    deleted) refresh seconds later or before the AMF's expiry, and retried
+    with backoff while the AMF is unreachable. Reports from notifications and
+    from the creation response go to on_report(supi, fix).
+    """
+
+    def __init__(self, http, amf_url, notify_uri, on_report, nf_id="mini-nef", refresh=3600, timeout=5):
+        self.http = http
+        self.amf_url = amf_url.rstrip("/")
+        self.notify_uri = notify_uri
+        self.on_report = on_report
+        self.nf_id = nf_id
+        self.refresh = refresh
+        self.timeout = timeout
+        self.correlation_id = uuid.uuid4().hex
+        self.subscription_id = None
+        self.notifications = 0
+        self.failures = 0
+        self._stop = threading.Event()
+
+    @property
+    def active(self):
+        return self.subscription_id is not None
+
+    def request_body(self):
+        return {
+            "subscription": {
+                "eventList": [{"type": "LOCATION_REPORT", "immediateFlag": True}],
+                "eventNotifyUri": self.notify_uri,
+                "notifyCorrelationId": self.correlation_id,
+                "nfId": self.nf_id,
+                "anyUE": True,
+            }
+        }
+
+    def subscribe(self):
+        """Create the subscription; returns seconds until it should be renewed."""
+        resp = self.http.post(f"{self.amf_url}/namf-evts/v1/subscriptions", json=self.request_body(),
+                              timeout=self.timeout)
+        resp.raise_for_status()
+        created = resp.json()
+        new_id = created.get("subscriptionId") or resp.headers.get("Location", "").rstrip("/").rsplit("/", 1)[-1]
+        previous, self.subscription_id = self.subscription_id, new_id or None
+        print(f"[Location] Subscribed to AMF location reports ({self.subscription_id})")
+        for report_supi, fix in location_reports(created):
+            self.on_report(report_supi, fix)
+        if previous and previous != self.subscription_id:
+            self.unsubscribe(previous)
+        renew_in = self.refresh
+        expiry = parse_time((created.get("subscription") or {}).get("expiry"))
+        if expiry is not None:
+            renew_in = min(renew_in, max(expiry - time.time() - 30, 1))
+        return renew_in
+
+    def unsubscribe(self, subscription_id=None):
+        subscription_id = subscription_id or self.subscription_id
+        if not subscription_id:
+            return
+        try:
+            self.http.delete(f"{self.amf_url}/namf-evts/v1/subscriptions/{subscription_id}", timeout=self.timeout)
+        except Exception as e:
+            print(f"[Location] Unsubscribe {subscription_id} failed: {e}")
+        if subscription_id == self.subscription_id:
+            self.subscription_id = None
+
+    def handle_notification(self, notification):
+        """Apply an AmfEventNotification; False if it is not for this subscription."""
+        if notification.get("notifyCorrelationId") != self.correlation_id:
+            return False
+        self.notifications += 1
+        for report_supi, fix in location_reports(notification):
+            self.on_report(report_supi, fix)
+        return True
+
+    def start(self):
+        threading.Thread(target=self._run, name="amf-location", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.unsubscribe()
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                wait = self.subscribe()
+                backoff = 1
+            except Exception as e:
+                self.failures += 1
+                print(f"[Location] AMF subscription failed: {e}; retrying in {backoff}s")
+                wait = backoff
+                backoff = min(backoff * 2, 60)
+            self._stop.wait(wait)
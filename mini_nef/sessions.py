@@ -0,0 +1,143 @@
+import ipaddress
+import re
+import threading
+
+from changefeed import dotted_values
+
+
+def parse_sources(spec):
+    """
+    Parse SESSION_SOURCES: comma-separated 'collection:ip_path:supi_path'.
+    Paths are dotted and may descend through arrays (e.g. pduSessions.ipv4Addr).
+    """
+    sources = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        collection, ip_path, supi_path = item.split(":")
+        sources.append((collection, ip_path, supi_path))
+    return sources
+
+
+def session_pairs(doc, ip_path, supi_path):
+    """Extract (ip, supi) bindings from one session document."""
+    supi = next(iter(dotted_values(doc, supi_path)), None)
+    if not supi:
+        return []
+    return [(ip, supi) for ip in dotted_values(doc, ip_path) if isinstance(ip, str)]
+
+
+def range_filter(network, ip_path):
+    """
+    Mongo filter selecting the session IPs inside an IPv4 network.
+    IPs are stored as strings, so the network is turned into an anchored
+    prefix regex on its whole octets ('^10\\.60\\.' for 10.60.0.0/16), which
+    Mongo answers as an index range scan. Callers still check membership for
+    prefixes that are not octet-aligned.
+    """
+    if network.prefixlen == network.max_prefixlen:
+        return {ip_path: str(network.network_address)}
+    octets = str(network.network_address).split(".")[:network.prefixlen // 8]
+    if not octets:
+        return {ip_path: {"$exists": True}}
+    return {ip_path: {"$regex": "^" + re.escape(".".join(octets) + ".")}}
+
+
+def ip_in_network(ip, network):
+    try:
+        return ipaddress.IPv4Address(ip) in network
+    except ValueError:
+        return False
+
+
+class SessionIndex:
+    """
+    In-memory UE IP -> SUPI table materialized from the SMF/PCF session
+    collections. Loaded once, then maintained per change event, so a lookup
+    is a dict access and session churn costs O(changes).
+    """
+
+    def __init__(self, sources):
+        self.sources = {collection: (ip_path, supi_path) for collection, ip_path, supi_path in sources}
+        self._by_ip = {}   # ip -> (supi, doc_key)
+        self._by_doc = {}  # (collection, _id) -> set(ips)
+        self._lock = threading.Lock()
+        self.ready = False
+        self.polling = False
+        self.loads = 0
+        self.changes = 0
+
+    def lookup(self, ip_addr):
+        entry = self._by_ip.get(ip_addr)
+        return entry[0] if entry else None
+
+    def collections(self):
+        return list(self.sources)
+
+    def set_polling(self):
+        """No change stream: from now on the table is only as fresh as its last reload."""
+        self.polling = True
+
+    def load(self, db):
+        """Full rebuild from the source collections; swaps the table atomically."""
+        by_ip, by_doc = {}, {}
+        for collection, (ip_path, supi_path) in self.sources.items():
+            projection = {ip_path.split(".")[0]: 1, supi_path.split(".")[0]: 1}
+            for doc in db[collection].find({ip_path: {"$exists": True}}, projection):
+                doc_key = (collection, doc["_id"])
+                for ip, supi in session_pairs(doc, ip_path, supi_path):
+                    by_ip[ip] = (supi, doc_key)
+                    by_doc.setdefault(doc_key, set()).add(ip)
+        with self._lock:
+            self._by_ip, self._by_doc = by_ip, by_doc
+            self.ready = True
+            self.loads += 1
+        print(f"[Sessions] Loaded {len(by_ip)} UE IP bindings")
+
+    def apply_change(self, event):
+        """Apply one change stream event (insert/replace/update/delete)."""
+        collection = event.get("ns", {}).get("coll")
+        if collection not in self.sources:
+            return
+        doc_id = event.get("documentKey", {}).get("_id")
+        doc = event.get("fullDocument")
+        if event.get("operationType") == "delete" or doc is None:
+            self.remove_doc(collection, doc_id)
+        else:
+            self.apply_doc(collection, doc)
+
+    def apply_doc(self, collection, doc):
+        ip_path, supi_path = self.sources[collection]
+        doc_key = (collection, doc["_id"])
+        pairs = session_pairs(doc, ip_path, supi_path)
+        with self._lock:
+            self._drop_locked(doc_key)
+            if pairs:
+                self._by_doc[doc_key] = {ip for ip, _ in pairs}
+                for ip, supi in pairs:
+                    self._by_ip[ip] = (supi, doc_key)
+            self.changes += 1
+
+    def remove_doc(self, collection, doc_id):
+        with self._lock:
+            self._drop_locked((collection, doc_id))
+            self.changes += 1
+
+    def _drop_locked(self, doc_key):
+        for ip in self._by_doc.pop(doc_key, ()):
+            # Only drop the binding if it still belongs to this document;
+            # the IP may already have been reassigned to a newer session.
+            entry = self._by_ip.get(ip)
+            if entry and entry[1] == doc_key:
+                del self._by_ip[ip]
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "polling": self.polling,
+            "bindings": len(self._by_ip),
+            "loads": self.loads,
+            "changes": self.changes,
+            "collections": self.collections(),
+        }
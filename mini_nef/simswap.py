@@ -0,0 +1,198 @@
+"""
+MSISDN -> (current SUPI, last SIM change) index for /sim-swap.
+
+Built from the gpsis of the provisioned AM data and kept in sync from its
+change stream (see changefeed.follow), so a check is a dict lookup with no
+UDM or database round trip.
+
+A SIM change is an MSISDN moving to a different SUPI. An MSISDN seen for
+the first time has no change time. free5GC keeps no such timestamp, so
+the index dates a change when it sees it and records the SUPI and time in
+a history collection (one document per MSISDN; first appearances are
+recorded with no time). After a restart, recorded times are kept while the
+SUPI is unchanged; a change made while the NEF was not watching is dated
+by the creation time of the new subscription document's ObjectId, or the
+time it was noticed.
+"""
+import datetime
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from changefeed import dotted_values
+
+AM_DATA = "subscriptionData.provisionedData.amData"
+
+
+def msisdn_key(value):
+    """Digits of an MSISDN or GPSI ('msisdn-123', '+123', 'tel:+123'); '' if it is not a number."""
+    text = str(value or "").strip()
+    for prefix in ("msisdn-", "tel:"):
+        if text.lower().startswith(prefix):
+            text = text[len(prefix):]
+    digits = text.lstrip("+")
+    return digits if digits.isdigit() else ""
+
+
+def doc_msisdns(doc):
+    """MSISDN keys among an amData document's gpsis."""
+    keys = set()
+    for gpsi in dotted_values(doc, "gpsis"):
+        if isinstance(gpsi, str) and gpsi.startswith("msisdn-"):
+            key = msisdn_key(gpsi)
+            if key:
+                keys.add(key)
+    return keys
+
+
+def created_at(doc):
+    """Epoch seconds embedded in the document's ObjectId, or None."""
+    doc_id = doc.get("_id")
+    return doc_id.generation_time.timestamp() if isinstance(doc_id, ObjectId) else None
+
+
+def to_epoch(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp()
+    return value if isinstance(value, (int, float)) else None
+
+
+class SimSwapIndex:
+    """
+    msisdn -> (supi, changed_at, doc _id). Numbers whose subscription was
+    deleted stay with supi None, so a later re-provisioning to another SUPI
+    still counts as a change. history() returns the collection change times
+    are recorded in (None: not persisted).
+    """
+
+    def __init__(self, collection=AM_DATA, history=None):
+        self.collection = collection
+        self.history = history
+        self._by_msisdn = {}
+        self._by_doc = {}  # doc _id -> set(msisdn)
+        self._lock = threading.Lock()
+        self.ready = False
+        self.loads = 0
+        self.changes = 0
+        self.sim_changes = 0
+
+    def __len__(self):
+        return len(self._by_msisdn)
+
+    def lookup(self, msisdn):
+        """(supi, changed_at epoch or None) for a provisioned MSISDN, else None."""
+        entry = self._by_msisdn.get(msisdn_key(msisdn))
+        if entry is None or entry[0] is None:
+            return None
+        return entry[0], entry[1]
+
+    def load(self, db):
+        """Full rebuild from the AM data; swaps the table atomically."""
+        recorded = {}
+        if self.history is not None:
+            for doc in self.history().find({}, {"supi": 1, "changedAt": 1}):
+                recorded[doc["_id"]] = (doc.get("supi"), to_epoch(doc.get("changedAt")), None)
+        with self._lock:
+            known = dict(self._by_msisdn)
+        now = time.time()
+        by_msisdn, by_doc, changed = {}, {}, []
+        for doc in db[self.collection].find({"gpsis": {"$exists": True}}, {"ueId": 1, "gpsis": 1}):
+            supi = doc.get("ueId")
+            keys = doc_msisdns(doc) if supi else set()
+            if not keys:
+                continue
+            by_doc[doc["_id"]] = keys
+            for key in keys:
+                prior = known.get(key) or recorded.get(key)
+                if prior and prior[0] == supi:
+                    changed_at = prior[1]
+                elif not prior:
+                    # First appearance: a number to watch, not a SIM change
+                    changed_at = None
+                    changed.append((key, supi, None))
+                else:
+                    # Changed while not watched: the new subscription's creation, if after what was known
+                    created = created_at(doc)
+                    if created is not None and (prior[1] is None or created > prior[1]):
+                        changed_at = created
+                    else:
+                        changed_at = now
+                    changed.append((key, supi, changed_at))
+                by_msisdn[key] = (supi, changed_at, doc["_id"])
+        for key, entry in known.items():
+            if key not in by_msisdn:
+                by_msisdn[key] = (None, entry[1], None)
+        with self._lock:
+            self._by_msisdn, self._by_doc = by_msisdn, by_doc
+            self.ready = True
+            self.loads += 1
+        swaps = self._record(changed)
+        print(f"[SimSwap] Loaded {len(by_msisdn)} MSISDNs "
+              f"({len(changed) - swaps} new, {swaps} SIM change(s) recorded)")
+
+    def apply_change(self, event):
+        """Apply one change stream event on the AM data collection."""
+        if event.get("ns", {}).get("coll") != self.collection:
+            return
+        doc_id = event.get("documentKey", {}).get("_id")
+        doc = event.get("fullDocument")
+        if event.get("operationType") == "delete" or doc is None:
+            self.apply_doc(doc_id, None)
+        else:
+            self.apply_doc(doc_id, doc)
+
+    def apply_doc(self, doc_id, doc):
+        supi = doc.get("ueId") if doc else None
+        keys = doc_msisdns(doc) if supi else set()
+        now = time.time()
+        changed = []
+        with self._lock:
+            for key in self._by_doc.pop(doc_id, set()) - keys:
+                entry = self._by_msisdn.get(key)
+                # Still this document's number (not already taken over by another subscription)
+                if entry and entry[2] == doc_id:
+                    self._by_msisdn[key] = (None, entry[1], None)
+            for key in keys:
+                entry = self._by_msisdn.get(key)
+                if entry and entry[0] == supi:
+                    changed_at = entry[1]
+                else:
+                    # A number never seen before is new, not swapped
+                    changed_at = now if entry else None
+                    changed.append((key, supi, changed_at))
+                self._by_msisdn[key] = (supi, changed_at, doc_id)
+            if keys:
+                self._by_doc[doc_id] = keys
+            self.changes += 1
+        self._record(changed)
+
+    def _record(self, changed):
+        """Persist (msisdn, supi, changed_at) entries (changed_at None: first seen); returns the SIM change count."""
+        swaps = sum(1 for _, _, at in changed if at is not None)
+        self.sim_changes += swaps
+        if not changed or self.history is None:
+            return swaps
+        ops = [UpdateOne({"_id": key}, {"$set": {
+                   "supi": supi,
+                   "changedAt": datetime.datetime.fromtimestamp(at, datetime.timezone.utc) if at is not None else None}},
+                   upsert=True)
+               for key, supi, at in changed]
+        try:
+            self.history().bulk_write(ops, ordered=False)
+        except Exception as e:
+            # The in-memory index stays right; only a restart before the next record would lose these times
+            print(f"[SimSwap] Could not record {len(ops)} MSISDN(s): {e}")
+        return swaps
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "msisdns": len(self._by_msisdn),
+            "loads": self.loads,
+            "changes": self.changes,
+            "sim_changes": self.sim_changes,
+        }
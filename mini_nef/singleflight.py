@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one upstream call.
+    The first caller (leader) runs the function; callers arriving while it is
+    in flight wait and receive the same result, or the same exception.
+    Supports both threads (do) and coroutines (do_async).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, fn, *args):
+        """Coroutine form: fn(*args) must return an awaitable. Single event loop only."""
+        future = self._async_calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # shield: a cancelled waiter must not cancel the shared call
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_calls[key] = future
+        self.leaders += 1
+        try:
+            result = await fn(*args)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve so an unawaited future does not log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            del self._async_calls[key]
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls) + len(self._async_calls),
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,142 @@
+"""
+Bulk A2P campaigns for mini_smsc.
+
+POST /sms/send/batch hands a whole recipient list to a background job.
+The job feeds the delivery engine in chunks, paced by a token bucket shared
+by all jobs, so one HTTP request can drive hundreds of thousands of sends
+without flooding the SIP socket or the UEs.
+"""
+import collections
+import itertools
+import threading
+import time
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most burst; take() blocks until they are available."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(max(burst, 1))
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, n, stop=None):
+        """Block until n tokens have been taken; returns False if stop was set first."""
+        while n > 0:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                # More than burst is taken in burst-sized installments
+                want = min(n, self.burst)
+                if self._tokens >= want:
+                    self._tokens -= want
+                    n -= want
+                    continue
+                wait = (want - self._tokens) / self.rate
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+        return True
+
+
+class Job:
+    __slots__ = ("id", "total", "submitted", "sent", "queued", "failed", "state", "created", "finished",
+                 "error", "cancel")
+
+    def __init__(self, job_id, total):
+        self.id = job_id
+        self.total = total
+        self.submitted = 0
+        self.sent = 0
+        self.queued = 0
+        self.failed = 0
+        self.state = "running"
+        self.created = time.time()
+        self.finished = None
+        self.error = None
+        self.cancel = threading.Event()
+
+    def to_dict(self):
+        elapsed = (self.finished or time.time()) - self.created
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "total": self.total,
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "queued": self.queued,
+            "failed": self.failed,
+            "progress": round(self.submitted / self.total, 4) if self.total else 1.0,
+            "rate": round(self.submitted / elapsed, 1) if elapsed > 0 else None,
+            "created": self.created,
+            "finished": self.finished,
+            "error": self.error,
+        }
+
+
+class CampaignRunner:
+    """
+    Runs send jobs in background threads. submit_many(list of
+    (recipient, sender, body)) hands one chunk to the delivery engine and
+    returns its Deliveries.
+    """
+
+    def __init__(self, submit_many, bucket, chunk_size=100, history=100):
+        self.submit_many = submit_many
+        self.bucket = bucket
+        self.chunk_size = chunk_size
+        self.history = history
+        self._ids = itertools.count(1)
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, messages):
+        """Start a job over a list of (recipient, sender, body); returns the Job."""
+        with self._lock:
+            job = Job(next(self._ids), len(messages))
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.state == "running":
+                    break
+                self._jobs.popitem(last=False)
+        threading.Thread(target=self._run, args=(job, messages), name=f"sms-job-{job.id}", daemon=True).start()
+        print(f"[Jobs] Job {job.id} started: {job.total} messages")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def running(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.state == "running")
+
+    def _run(self, job, messages):
+        try:
+            for start in range(0, len(messages), self.chunk_size):
+                chunk = messages[start:start + self.chunk_size]
+                if not self.bucket.take(len(chunk), job.cancel):
+                    job.state = "cancelled"
+                    break
+                for delivery in self.submit_many(chunk):
+                    if delivery.state == "pending":
+                        job.queued += 1
+                    elif delivery.state == "failed":
+                        job.failed += 1
+                    else:
+                        job.sent += 1
+                job.submitted += len(chunk)
+            else:
+                job.state = "done"
+        except Exception as e:
+            job.state = "error"
+            job.error = str(e)
+            print(f"[Jobs] Job {job.id} failed: {e}")
+        job.finished = time.time()
+        print(f"[Jobs] Job {job.id} {job.state}: {job.submitted}/{job.total} submitted")
@@ -0,0 +1,369 @@
+"""
+Store-and-forward delivery for mini_smsc.
+
+Every MESSAGE the SMSC originates (P2P forwards and A2P) goes through a
+DeliveryEngine instead of a single fire-and-forget sendto:
+
+- recipients that are not registered get a per-UE pending queue, flushed
+  when they REGISTER
+- at most inflight_per_ue MESSAGEs are outstanding per UE; the rest wait in
+  the queue and are sent as earlier ones are acknowledged
+- an outstanding MESSAGE is retransmitted (same Call-ID) with exponential
+  backoff until a 2xx arrives, and fails after max_attempts (or at once if
+  the socket refuses the address)
+- retransmissions are scheduled on a hashed timer wheel, so arming and
+  cancelling a timer is O(1) however many messages are in flight
+- pending messages older than the validity period expire
+
+Delivery states: pending -> inflight -> delivered | failed | expired; a
+retry that finds the UE unregistered puts the message back to pending.
+"""
+import collections
+import itertools
+import threading
+import time
+
+PENDING = "pending"
+INFLIGHT = "inflight"
+DELIVERED = "delivered"
+FAILED = "failed"
+EXPIRED = "expired"
+
+
+class Delivery:
+    __slots__ = ("id", "kind", "call_id", "recipient", "sender", "body", "state", "attempts",
+                 "created", "updated", "payload", "addr", "timer", "reason")
+
+    def __init__(self, delivery_id, kind, recipient, sender, body):
+        self.id = delivery_id
+        self.kind = kind
+        self.call_id = f"{kind}-{delivery_id}"
+        self.recipient = recipient
+        self.sender = sender
+        self.body = body
+        self.state = PENDING
+        self.attempts = 0
+        self.created = self.updated = time.time()
+        self.payload = None
+        self.addr = None
+        self.timer = None
+        self.reason = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "call_id": self.call_id,
+            "to": self.recipient,
+            "from": self.sender,
+            "state": self.state,
+            "attempts": self.attempts,
+            "created": self.created,
+            "updated": self.updated,
+            "reason": self.reason,
+        }
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: slots of `tick` seconds; an entry due further out
+    than one revolution simply stays in its slot until its round comes up.
+    """
+
+    def __init__(self, tick=0.1, slots=512):
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]
+        self._cursor = int(time.monotonic() / tick)
+
+    def schedule(self, due, key, value):
+        """Arm a timer at monotonic time `due`; returns a handle for cancel()."""
+        slot = self.slots[max(int(due / self.tick), self._cursor + 1) % len(self.slots)]
+        slot[key] = (due, value)
+        return slot, key
+
+    @staticmethod
+    def cancel(handle):
+        slot, key = handle
+        slot.pop(key, None)
+
+    def expire(self, now):
+        """Values of every timer due at or before now."""
+        due = []
+        target = int(now / self.tick)
+        # Never walk more than one revolution, however long we were stalled
+        start = max(self._cursor, target - len(self.slots) + 1)
+        for tick in range(start, target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            if not slot:
+                continue
+            for key, (when, value) in list(slot.items()):
+                if when <= now:
+                    del slot[key]
+                    due.append(value)
+        self._cursor = target
+        return due
+
+
+class DeliveryEngine:
+    """
+    send(payload, addr) puts a datagram on the wire, locate(uri) returns the
+    registered (ip, port) or None, build(delivery) renders the SIP MESSAGE.
+    """
+
+    def __init__(self, send, locate, build, inflight_per_ue=4, max_attempts=7, base_delay=0.5,
+                 max_delay=32.0, validity=86400, max_pending_per_ue=1000, history=10000, tick=0.1):
+        self.send = send
+        self.locate = locate
+        self.build = build
+        self.inflight_per_ue = inflight_per_ue
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.validity = validity
+        self.max_pending_per_ue = max_pending_per_ue
+        self.history = history
+        self.wheel = TimerWheel(tick=tick)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = {}        # recipient -> deque of Delivery waiting to be sent
+        self._inflight = {}       # recipient -> {call_id: Delivery}
+        self._by_call_id = {}     # call_id -> Delivery awaiting a response
+        self._recent = collections.OrderedDict()  # id -> Delivery, bounded, for status lookups
+        self._counts = {PENDING: 0, INFLIGHT: 0}
+        self._totals = dict.fromkeys(("submitted", "sent", "retransmitted", "delivered", "failed", "expired"), 0)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sms-delivery", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    # -- API used by the SMSC --
+
+    def submit(self, recipient, sender, body, kind="a2p"):
+        """Queue a MESSAGE for recipient and send it right away if the UE is registered and has room."""
+        return self.submit_many([(recipient, sender, body)], kind)[0]
+
+    def submit_many(self, messages, kind="a2p"):
+        """
+        Submit (recipient, sender, body) tuples under one lock acquisition and
+        write the resulting datagrams back to back. Returns the Deliveries.
+        """
+        deliveries = []
+        touched = {}
+        with self._lock:
+            for recipient, sender, body in messages:
+                delivery = Delivery(next(self._ids), kind, recipient, sender, body)
+                self._totals["submitted"] += 1
+                self._counts[PENDING] += 1
+                self._remember(delivery)
+                queue = self._pending.setdefault(recipient, collections.deque())
+                queue.append(delivery)
+                if len(queue) > self.max_pending_per_ue:
+                    self._finish(queue.popleft(), FAILED, "pending queue full")
+                deliveries.append(delivery)
+                touched[recipient] = None
+            sends = []
+            for recipient in touched:
+                sends.extend(self._pump_locked(recipient))
+        self._transmit(sends)
+        return deliveries
+
+    def on_response(self, call_id, status):
+        """
+        A SIP response from a UE: 2xx completes the delivery; any other final
+        response leaves the retransmission timer armed, so it is retried with backoff.
+        """
+        if status < 200:
+            return
+        with self._lock:
+            delivery = self._by_call_id.get(call_id)
+            if delivery is None:
+                return
+            if status >= 300:
+                delivery.reason = f"UE answered {status}"
+                return
+            self._finish(delivery, DELIVERED)
+            sends = self._pump_locked(delivery.recipient)
+        self._transmit(sends)
+
+    def on_register(self, recipient):
+        """The UE (re-)registered: send what is queued and retransmit in-flight MESSAGEs to the new address now."""
+        with self._lock:
+            addr = self.locate(recipient)
+            sends = []
+            for delivery in list(self._inflight.get(recipient, {}).values()):
+                if delivery.addr != addr:
+                    delivery.addr = addr
+                    sends.extend(self._retry_locked(delivery, time.monotonic()))
+            sends.extend(self._pump_locked(recipient))
+        self._transmit(sends)
+
+    def get(self, delivery_id):
+        with self._lock:
+            delivery = self._recent.get(delivery_id)
+            return delivery.to_dict() if delivery else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "states": dict(self._counts),
+                "totals": dict(self._totals),
+                "pending_ues": len(self._pending),
+                "inflight_ues": len(self._inflight),
+            }
+
+    def state_counts(self):
+        """Live deliveries by state (pending, inflight)."""
+        with self._lock:
+            return {(state,): count for state, count in self._counts.items()}
+
+    def totals(self):
+        """Cumulative counts: submitted, sent, retransmitted, delivered, failed, expired."""
+        with self._lock:
+            return {(event,): count for event, count in self._totals.items()}
+
+    # -- internals (called with the lock held) --
+
+    def _delay(self, attempts):
+        return min(self.base_delay * (2 ** (attempts - 1)), self.max_delay)
+
+    def _set_state(self, delivery, state):
+        # Only live states are gauged; final ones are counted in _totals
+        if delivery.state in self._counts:
+            self._counts[delivery.state] -= 1
+        if state in self._counts:
+            self._counts[state] += 1
+        delivery.state = state
+        delivery.updated = time.time()
+
+    def _remember(self, delivery):
+        self._recent[delivery.id] = delivery
+        if len(self._recent) > self.history:
+            self._recent.popitem(last=False)
+
+    def _finish(self, delivery, state, reason=None):
+        if delivery.timer is not None:
+            self.wheel.cancel(delivery.timer)
+            delivery.timer = None
+        if delivery.state == INFLIGHT:
+            self._by_call_id.pop(delivery.call_id, None)
+            inflight = self._inflight.get(delivery.recipient)
+            if inflight is not None:
+                inflight.pop(delivery.call_id, None)
+                if not inflight:
+                    del self._inflight[delivery.recipient]
+        if reason:
+            delivery.reason = reason
+        delivery.payload = None
+        self._set_state(delivery, state)
+        self._totals[state] += 1
+        if state != DELIVERED:
+            print(f"[Delivery] {delivery.call_id} to {delivery.recipient} {state}: {delivery.reason}")
+
+    def _pump_locked(self, recipient):
+        """Move queued deliveries for recipient into flight, up to the per-UE cap."""
+        queue = self._pending.get(recipient)
+        if not queue:
+            return []
+        addr = self.locate(recipient)
+        if addr is None:
+            return []
+        inflight = self._inflight.setdefault(recipient, {})
+        now = time.monotonic()
+        sends = []
+        while queue and len(inflight) < self.inflight_per_ue:
+            delivery = queue.popleft()
+            if self.validity and time.time() - delivery.created > self.validity:
+                self._finish(delivery, EXPIRED, "validity period elapsed")
+                continue
+            delivery.addr = addr
+            delivery.payload = self.build(delivery).encode('utf-8')
+            self._set_state(delivery, INFLIGHT)
+            inflight[delivery.call_id] = delivery
+            self._by_call_id[delivery.call_id] = delivery
+            sends.extend(self._attempt_locked(delivery, now))
+        if not queue:
+            del self._pending[recipient]
+        if not inflight:
+            del self._inflight[recipient]
+        return sends
+
+    def _attempt_locked(self, delivery, now):
+        delivery.attempts += 1
+        self._totals["sent" if delivery.attempts == 1 else "retransmitted"] += 1
+        delivery.timer = self.wheel.schedule(now + self._delay(delivery.attempts), delivery.call_id, delivery)
+        return [(delivery, delivery.payload, delivery.addr)]
+
+    def _retry_locked(self, delivery, now):
+        if delivery.timer is not None:
+            self.wheel.cancel(delivery.timer)
+            delivery.timer = None
+        if delivery.attempts >= self.max_attempts:
+            self._finish(delivery, FAILED, delivery.reason or "no 200 OK")
+            return self._pump_locked(delivery.recipient)
+        addr = self.locate(delivery.recipient)
+        if addr is None:
+            # UE went away: back to the front of its queue until it registers again
+            self._by_call_id.pop(delivery.call_id, None)
+            inflight = self._inflight.get(delivery.recipient, {})
+            inflight.pop(delivery.call_id, None)
+            if not inflight:
+                self._inflight.pop(delivery.recipient, None)
+            self._set_state(delivery, PENDING)
+            self._pending.setdefault(delivery.recipient, collections.deque()).appendleft(delivery)
+            return []
+        delivery.addr = addr
+        return self._attempt_locked(delivery, now)
+
+    def _expire_pending_locked(self):
+        if not self.validity:
+            return
+        cutoff = time.time() - self.validity
+        for recipient, queue in list(self._pending.items()):
+            while queue and queue[0].created < cutoff:
+                self._finish(queue.popleft(), EXPIRED, "validity period elapsed")
+            if not queue:
+                del self._pending[recipient]
+
+    def _transmit(self, sends):
+        """
+        Write (delivery, payload, addr) datagrams outside the lock. A send the
+        socket rejects (unroutable or forbidden address) fails that delivery,
+        which lets the UE's next queued MESSAGE go out; the rest of the batch
+        is still sent.
+        """
+        while sends:
+            failed = []
+            for delivery, payload, addr in sends:
+                try:
+                    self.send(payload, addr)
+                except OSError as e:
+                    failed.append((delivery, addr, e))
+            if not failed:
+                return
+            sends = []
+            with self._lock:
+                for delivery, addr, e in failed:
+                    # Unless it was answered, redirected or finished meanwhile
+                    if delivery.state == INFLIGHT and delivery.addr == addr:
+                        self._finish(delivery, FAILED, f"send to {addr} failed: {e}")
+                        sends.extend(self._pump_locked(delivery.recipient))
+
+    def _run(self):
+        last_sweep = time.monotonic()
+        while not self._stop.wait(self.wheel.tick):
+            now = time.monotonic()
+            with self._lock:
+                sends = []
+                for delivery in self.wheel.expire(now):
+                    delivery.timer = None
+                    if delivery.state == INFLIGHT:
+                        sends.extend(self._retry_locked(delivery, now))
+                if now - last_sweep >= 1.0:
+                    self._expire_pending_locked()
+                    last_sweep = now
+            self._transmit(sends)
@@ -0,0 +1,177 @@
+"""
+SIP ingress for mini_smsc.
+
+Handling a datagram has a stateless half and a stateful one. handle()
+does the stateless half: parse, replay the cached answer to a
+retransmission, send the 200 OK. It returns an event describing the
+state change that remains to be applied:
+
+    ("response", call_id, status)                 a UE answered a MESSAGE we sent
+    ("register", aor, contact, addr, expires)     bind aor to addr (expires 0 unbinds)
+    ("message", recipient, sender, body)          store and forward a P2P SMS
+    ("query", data, addr)                         a REGISTER without Contact, answered
+                                                  from the registrar by its owner
+    ("retransmission",) / ("error",) / None       nothing to apply
+
+smsc.py applies events to the registrar, message store and delivery engine.
+With SIP_WORKERS > 0 it also forks worker processes that run serve(): each
+binds the SIP port with SO_REUSEPORT, so the kernel spreads datagrams
+across the processes by source address and every packet from one UE
+endpoint (its retransmissions included) reaches the same process and
+transaction cache. Workers pipe their events to the main process in
+batches, so registrations, stored messages and deliveries stay in one
+place and an A2P send finds a UE whichever process took its REGISTER.
+"""
+import os
+import select
+import socket
+import time
+
+from sip import SipMessage, extract_uri
+from registrar import normalize_aor, contact_address, requested_expires
+from transactions import TransactionCache, transaction_key
+
+MAX_DATAGRAM = 65535
+# Events a worker sends to the main process at most per pipe write
+WORKER_BATCH = 64
+# How often an idle worker checks that the main process is still there
+WORKER_IDLE_CHECK = 1.0
+
+
+def handle(data, addr, transactions, send, registrar, lookup=None):
+    """
+    Stateless half of one datagram received from addr; returns (method, event).
+    registrar supplies the expiry policy only. A REGISTER query is answered
+    with lookup(aor) -> Binding when given, otherwise returned as a "query"
+    event for the registrar's owner.
+    """
+    method = "unparsed"
+    try:
+        msg = SipMessage(data)
+        if msg.is_response:
+            # A UE acknowledging a MESSAGE we delivered
+            return "response", ("response", msg.get('call-id'), msg.status)
+        method = msg.method
+
+        # A retransmission of a request we already answered: replay the answer, do nothing else
+        key = transaction_key(msg)
+        cached = transactions.get(key) if key is not None else None
+        if cached is not None:
+            send(cached, addr)
+            return method, ("retransmission",)
+
+        sender = msg.from_uri
+        recipient = msg.to_uri
+        call_id = msg.get('call-id', '12345')
+        cseq = msg.get('cseq', '1 REGISTER')
+        contact = msg.get('contact', '').strip() if method == 'REGISTER' else ''
+        contact_uri = extract_uri(contact)
+        if method == 'REGISTER' and not contact_uri and lookup is None:
+            # A query is answered from the bindings: leave it to their owner
+            return method, ("query", data, addr)
+        event = None
+
+        print(f"[SIP] Received {method} from {sender} ({addr})")
+
+        if method == 'REGISTER':
+            # The AoR being registered is the To URI; Expires 0 (or Contact: *) unregisters it
+            expires = 0 if contact == '*' else registrar.granted(requested_expires(contact, msg.get('expires')))
+            if contact == '*' or (contact_uri and expires <= 0):
+                event = ("register", recipient, None, None, 0)
+                contact_line = ""
+                print(f"[-] Unregistered {recipient}")
+            elif contact_uri:
+                # MESSAGEs go to the Contact's IP:port (where the UE listens); the
+                # packet's source address is used when the Contact host is a name
+                bind_addr = contact_address(contact_uri) or addr
+                event = ("register", recipient, contact_uri, bind_addr, expires)
+                contact_line = f"Contact: <{contact_uri}>;expires={expires}\r\n"
+                print(f"[+] Registered {recipient} at {bind_addr} for {expires}s")
+            else:
+                # No Contact: a query, answered with the current binding
+                binding = lookup(recipient)
+                contact_line = f"Contact: <{binding.contact}>;expires={binding.expires_in()}\r\n" if binding else ""
+
+            # Send 200 OK
+            response = f"SIP/2.0 200 OK\r\nVia: {msg.get('via')}\r\nFrom: {msg.get('from')}\r\nTo: {msg.get('to')}\r\nCall-ID: {call_id}\r\nCSeq: {cseq}\r\n{contact_line}Content-Length: 0\r\n\r\n"
+            reply(transactions, send, key, response, addr)
+
+        elif method == 'MESSAGE':
+            # P2P SMS
+            body = msg.body_text.strip()
+            print(f"[>] Message: '{body}' from {sender} to {recipient}")
+
+            # Stored and forwarded under the normalized AoR, so any spelling of the number finds it
+            event = ("message", normalize_aor(recipient), sender, body)
+
+            # Send 200 OK to Sender
+            response = f"SIP/2.0 200 OK\r\nVia: {msg.get('via')}\r\nFrom: {msg.get('from')}\r\nTo: {msg.get('to')}\r\nCall-ID: {call_id}\r\nCSeq: {cseq}\r\nContent-Length: 0\r\n\r\n"
+            reply(transactions, send, key, response, addr)
+
+        return method, event
+
+    except Exception as e:
+        print(f"[!] SIP Error: {e}")
+        return method, ("error",)
+
+
+def reply(transactions, send, key, response, addr):
+    """Send a final response and remember it for retransmissions of the same request."""
+    payload = response.encode('utf-8')
+    if key is not None:
+        transactions.put(key, payload)
+    send(payload, addr)
+
+
+def bind_socket(ip, port, rcvbuf, reuseport=False):
+    """The UDP socket SIP is received on; reuseport lets several processes share the port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # A larger kernel buffer absorbs REGISTER storms (capped by net.core.rmem_max)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((ip, port))
+    return sock
+
+
+def serve(conn, ip, port, rcvbuf, registrar, transaction_ttl, transaction_max, inherited=()):
+    """
+    Worker process body: receive on a SO_REUSEPORT socket of our own and send
+    [(method, seconds, event), ...] batches down conn until the main process
+    goes away. Replies leave from this socket, so UEs see the SIP port as the source.
+    inherited are the pipe ends of earlier workers that the fork copied.
+    """
+    # Only the main process may hold read ends, or a pipe outlives it
+    for other in inherited:
+        other.close()
+    parent = os.getppid()
+    sock = bind_socket(ip, port, rcvbuf, reuseport=True)
+    transactions = TransactionCache(ttl=transaction_ttl, max_entries=transaction_max)
+    send = sock.sendto
+    poller = select.poll()
+    poller.register(sock, select.POLLIN)
+    try:
+        while True:
+            # A main process killed by a signal never closes our socket: leave once it is gone
+            if not poller.poll(WORKER_IDLE_CHECK * 1000):
+                if os.getppid() != parent:
+                    return
+                continue
+            data, addr = sock.recvfrom(MAX_DATAGRAM)
+            batch = []
+            while True:
+                start = time.perf_counter()
+                method, event = handle(data, addr, transactions, send, registrar)
+                batch.append((method, time.perf_counter() - start, event))
+                if len(batch) >= WORKER_BATCH:
+                    break
+                # Nobody else reads this socket, so draining it without blocking is safe
+                try:
+                    data, addr = sock.recvfrom(MAX_DATAGRAM, socket.MSG_DONTWAIT)
+                except BlockingIOError:
+                    break
+            conn.send(batch)
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        sock.close()
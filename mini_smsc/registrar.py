@@ -0,0 +1,178 @@
+"""
+Registration table for mini_smsc.
+
+Bindings are keyed by a normalized address-of-record, so
+'sip:1234567891@free5gc.org', '<tel:+1234567891>', 'msisdn-1234567891' and
+a bare '1234567891' all reach the same UE, with an O(1) dict lookup.
+
+Each binding carries its expiry (the REGISTER's Expires, 0 unregisters).
+Expired bindings are never returned by lookup(), and a sweep thread evicts
+them through a min-heap of expiry times, so sends stop going to UDP
+endpoints that are gone without scanning the whole table.
+"""
+import heapq
+import ipaddress
+import threading
+import time
+
+from sip import extract_uri
+
+# Characters dialled numbers are written with that are not part of the number
+VISUAL_SEPARATORS = str.maketrans("", "", "-.() ")
+
+
+def normalize_aor(value):
+    """
+    Registration key for a SIP/tel URI, name-addr or MSISDN: the user part,
+    as plain digits when it is a phone number, otherwise lowercased.
+    '' for an empty value.
+    """
+    uri = extract_uri(str(value or ""))
+    lower = uri.lower()
+    for scheme in ("sip:", "sips:", "tel:"):
+        if lower.startswith(scheme):
+            uri = uri[len(scheme):]
+            break
+    user = uri.split("@", 1)[0].split(";", 1)[0]
+    if user.lower().startswith("msisdn-"):
+        user = user[len("msisdn-"):]
+    digits = user.translate(VISUAL_SEPARATORS).lstrip("+")
+    return digits if digits.isdigit() else user.lower()
+
+
+def contact_address(uri):
+    """
+    (ip, port) from a Contact URI whose host is an IPv4 unicast literal, else
+    None. The SMSC sends from one IPv4 socket, so IPv6, multicast, broadcast
+    and reserved hosts (or a bad port) leave the packet's source address in use.
+    """
+    hostport = uri.split(":", 1)[-1].rsplit("@", 1)[-1].split(";", 1)[0].split("?", 1)[0]
+    if hostport.startswith("["):
+        return None
+    host, _, port = hostport.partition(":")
+    try:
+        ip = ipaddress.IPv4Address(host)
+        port = int(port) if port else 5060
+    except ValueError:
+        return None
+    # is_reserved covers 240.0.0.0/4, including the limited broadcast 255.255.255.255
+    if ip.is_multicast or ip.is_reserved or ip.is_unspecified or not 0 < port < 65536:
+        return None
+    return host, port
+
+
+def requested_expires(contact, expires_header):
+    """
+    Seconds a REGISTER asks for: the Contact's ;expires= parameter, else the
+    Expires header, else None (use the default).
+    """
+    # Header parameters follow the '>' of a name-addr, or the URI itself in an addr-spec
+    params = contact.split(">", 1)[1] if ">" in contact else contact
+    for param in params.split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "expires" and value.strip().isdigit():
+            return int(value)
+    expires_header = (expires_header or "").strip()
+    return int(expires_header) if expires_header.isdigit() else None
+
+
+class Binding:
+    __slots__ = ("key", "aor", "contact", "addr", "expires_at")
+
+    def __init__(self, key, aor, contact, addr, expires_at):
+        self.key = key
+        self.aor = aor
+        self.contact = contact
+        self.addr = addr
+        self.expires_at = expires_at
+
+    def expires_in(self, now=None):
+        return max(round(self.expires_at - (time.monotonic() if now is None else now)), 0)
+
+
+class Registrar:
+    """
+    AoR -> Binding. Requested expiries are clamped to max_expires; a REGISTER
+    without one gets default_expires.
+    """
+
+    def __init__(self, default_expires=3600, max_expires=86400):
+        self.default_expires = default_expires
+        self.max_expires = max_expires
+        self._lock = threading.Lock()
+        self._bindings = {}
+        self._heap = []  # (expires_at, key); stale entries are skipped when popped
+        self.expired = 0
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return len(self._bindings)
+
+    def register(self, aor, contact, addr, expires=None):
+        """
+        Bind aor to addr (the UDP endpoint MESSAGEs are sent to) for expires
+        seconds; 0 removes the binding. Returns the Binding, or None if removed.
+        """
+        key = normalize_aor(aor)
+        expires = self.granted(expires)
+        if expires <= 0:
+            self.unregister(key)
+            return None
+        expires_at = time.monotonic() + expires
+        binding = Binding(key, aor, contact, addr, expires_at)
+        with self._lock:
+            self._bindings[key] = binding
+            heapq.heappush(self._heap, (expires_at, key))
+        return binding
+
+    def granted(self, expires):
+        """Lifetime a REGISTER asking for expires seconds (None: no preference) gets; 0 unregisters."""
+        return self.default_expires if expires is None else min(expires, self.max_expires)
+
+    def unregister(self, aor):
+        with self._lock:
+            return self._bindings.pop(normalize_aor(aor), None) is not None
+
+    def get(self, aor):
+        """The live Binding for aor, or None."""
+        binding = self._bindings.get(normalize_aor(aor))
+        if binding is None or binding.expires_at <= time.monotonic():
+            return None
+        return binding
+
+    def lookup(self, aor):
+        """Registered (ip, port) for aor, or None if it is unknown or expired."""
+        binding = self.get(aor)
+        return binding.addr if binding else None
+
+    def sweep(self, now=None):
+        """Evict every binding that has expired; returns how many."""
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, key = heapq.heappop(self._heap)
+                binding = self._bindings.get(key)
+                # Re-registered since this entry was pushed: a later entry covers it
+                if binding is not None and binding.expires_at == expires_at:
+                    del self._bindings[key]
+                    evicted += 1
+            # Refreshes leave one stale entry each; rebuild rather than let them pile up
+            if len(self._heap) > 2 * len(self._bindings) + 1024:
+                self._heap = [(b.expires_at, b.key) for b in self._bindings.values()]
+                heapq.heapify(self._heap)
+        if evicted:
+            self.expired += evicted
+            print(f"[Registrar] Expired {evicted} binding(s)")
+        return evicted
+
+    def start(self, interval=1.0):
+        threading.Thread(target=self._run, args=(interval,), name="sip-registrar", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.sweep()
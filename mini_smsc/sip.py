@@ -0,0 +1,228 @@
+"""
+SIP message parser for the SMSC hot path.
+
+Parsing is lazy: the constructor splits the header block off at the blank
+line and decodes only the start line. A header is located when it is first
+asked for, by partitioning the header bytes at CRLF + its canonical spelling
++ ':', and only that value is decoded; answers are cached on the message.
+Anything else (compact forms, other case, whitespace before the colon,
+folded lines) falls back to a search of a lowercased copy of the header
+block. The body is framed by Content-Length on the received bytes (a
+memoryview slice, no copy).
+"""
+
+CRLF = b"\r\n"
+FOLD = (b" ", b"\t")
+# Cache entry for a header that was looked up and is absent
+MISSING = object()
+
+# RFC 3261 section 7.3.3 compact header forms
+COMPACT_FORMS = {
+    "i": "call-id",
+    "m": "contact",
+    "e": "content-encoding",
+    "l": "content-length",
+    "c": "content-type",
+    "f": "from",
+    "s": "subject",
+    "k": "supported",
+    "t": "to",
+    "v": "via",
+    "o": "event",
+    "r": "refer-to",
+    "u": "allow-events",
+}
+
+LONG_FORMS = {v: k for k, v in COMPACT_FORMS.items()}
+
+# RFC 3261 spellings that don't follow plain title case
+CANONICAL = {"call-id": "Call-ID", "cseq": "CSeq", "www-authenticate": "WWW-Authenticate"}
+
+
+def header_keys(name):
+    """
+    Lookup keys for a header: CRLF + canonical name + ':' for the exact-case
+    search, then CRLF + each lowercase spelling (full and compact) for the
+    case-insensitive fallback.
+    """
+    name = name.strip().lower()
+    name = COMPACT_FORMS.get(name, name)
+    short = LONG_FORMS.get(name)
+    canonical = CANONICAL.get(name) or "-".join(part.capitalize() for part in name.split("-"))
+    lower = (name,) if short is None else (name, short)
+    return CRLF + canonical.encode() + b":", tuple(CRLF + n.encode() for n in lower)
+
+
+def find_header(block, key, start, end):
+    """
+    (value_start, value_end) of the first header line in block[start:end]
+    matching key (CRLF + name), or None. Allows whitespace before the colon;
+    value_end runs through folded continuation lines.
+    """
+    pos = block.find(key, start, end)
+    while pos >= 0:
+        colon = pos + len(key)
+        while colon < end and block[colon] in (32, 9):
+            colon += 1
+        if colon < end and block[colon] == 58:  # ':'
+            value_end = block.find(CRLF, colon, end)
+            if value_end < 0:
+                return colon + 1, end
+            while value_end + 2 < end and block[value_end + 2] in (32, 9):
+                value_end = block.find(CRLF, value_end + 2, end)
+                if value_end < 0:
+                    return colon + 1, end
+            return colon + 1, value_end
+        # A longer name with this prefix (e.g. "To" in "Tone:"); keep looking
+        pos = block.find(key, pos + 2, end)
+    return None
+
+
+def header_value(raw):
+    """Header value bytes -> str, unfolding continuation lines."""
+    if CRLF in raw:
+        raw = b" ".join(part.strip() for part in raw.split(CRLF))
+    return raw.strip().decode("utf-8", "replace")
+
+
+# Pre-computed keys for the spellings the SMSC itself asks for
+HEADER_KEYS = {}
+for _name in ("Call-ID", "CSeq", "Via", "From", "To", "Contact", "Expires", "Content-Length", "Content-Type"):
+    HEADER_KEYS[_name] = HEADER_KEYS[_name.lower()] = header_keys(_name)
+
+
+class SipParseError(ValueError):
+    pass
+
+
+class SipMessage:
+    __slots__ = ("data", "method", "uri", "status", "_head", "_body_start", "_values", "_lower")
+
+    def __init__(self, data):
+        self.data = data
+        # Only the start line is parsed here; headers are found in _head when asked for
+        head, blank, _ = data.partition(b"\r\n\r\n")
+        start_line, eol, _ = head.partition(CRLF)
+        if not start_line or not (eol or blank):
+            raise SipParseError("missing start line")
+        parts = start_line.decode("utf-8", "replace").split(" ", 2)
+        if len(parts) < 3:
+            raise SipParseError("malformed start line")
+        if parts[0] == "SIP/2.0":
+            self.method = None
+            self.uri = None
+            self.status = int(parts[1])
+        else:
+            self.method = parts[0]
+            self.uri = parts[1]
+            self.status = None
+        self._head = head
+        self._body_start = len(head) + 4 if blank else len(data)
+        self._values = {}
+        self._lower = None
+
+    @property
+    def is_response(self):
+        return self.status is not None
+
+    def get(self, name, default=None):
+        """
+        Case-insensitive header lookup; accepts full or compact names. The first
+        header in the canonical spelling wins, then the first in any other.
+        """
+        value = self._values.get(name, MISSING)
+        if value is MISSING:
+            exact, lower_keys = HEADER_KEYS.get(name) or header_keys(name)
+            _, found, rest = self._head.partition(exact)
+            value, _, after = rest.partition(CRLF)
+            if found and after[:1] not in FOLD:
+                value = value.decode("utf-8", "replace").strip()
+            else:
+                # Another spelling, or continued on the next line
+                value = self._search(lower_keys)
+            self._values[name] = value
+        return default if value is None else value
+
+    def _search(self, lower_keys):
+        # Search a lowercased copy of the header block (offsets map back to the original, so
+        # values keep their case); first occurrence of any spelling wins
+        lower = self._lower
+        if lower is None:
+            lower = self._lower = self._head.lower()
+        found = None
+        for key in lower_keys:
+            span = find_header(lower, key, 0, len(lower))
+            if span is not None and (found is None or span[0] < found[0]):
+                found = span
+        if found is None:
+            return None
+        return header_value(self._head[found[0]:found[1]])
+
+    @property
+    def headers(self):
+        """Every header as {lowercase full name: first value}."""
+        headers = {}
+        for line in self._head.split(CRLF)[1:]:
+            if line[:1] in FOLD or b":" not in line:
+                continue
+            name, _, value = line.partition(b":")
+            name = name.strip().lower().decode("ascii", "replace")
+            name = COMPACT_FORMS.get(name, name)
+            if name not in headers:
+                headers[name] = self.get(name)
+        return headers
+
+    @property
+    def content_length(self):
+        return self._content_length()
+
+    def _content_length(self):
+        value = self.get("content-length")
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise SipParseError(f"bad Content-Length: {value!r}")
+
+    @property
+    def body(self):
+        """Body bytes as a memoryview, framed by Content-Length when present."""
+        body_start, body_end = self._body_span()
+        return memoryview(self.data)[body_start:body_end]
+
+    @property
+    def body_text(self):
+        body_start, body_end = self._body_span()
+        return self.data[body_start:body_end].decode("utf-8", "replace")
+
+    def _body_span(self):
+        body_start = self._body_start
+        if body_start >= len(self.data):
+            # Nothing after the blank line: no need to read Content-Length
+            return body_start, body_start
+        length = self._content_length()
+        if length is None:
+            return body_start, len(self.data)
+        return body_start, min(body_start + length, len(self.data))
+
+    @property
+    def from_uri(self):
+        return extract_uri(self.get("from", ""))
+
+    @property
+    def to_uri(self):
+        return extract_uri(self.get("to", ""))
+
+
+def extract_uri(value):
+    """
+    URI from a name-addr/addr-spec header value:
+    '"Alice" <sip:a@b>;tag=1' -> 'sip:a@b', 'sip:a@b;tag=1' -> 'sip:a@b'.
+    """
+    lt = value.find("<")
+    if lt >= 0:
+        gt = value.find(">", lt)
+        return value[lt + 1:gt if gt >= 0 else len(value)].strip()
+    semi = value.find(";")
+    return (value if semi < 0 else value[:semi]).strip()
@@ -1,108 +1,239 @@
-import socket
+import json
+import multiprocessing
+import sys
 import threading
 import time
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 import os
 
+# metrics.py is shared with mini_nef: the image copies it next to this file, a source checkout has it in ../common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import ingress
+from store import open_store
+from delivery import DeliveryEngine, PENDING
+from campaigns import CampaignRunner, TokenBucket
+from registrar import Registrar, normalize_aor
+from transactions import TransactionCache
+
 app = Flask(__name__)
 
 # Configuration
-SIP_IP = "0.0.0.0"
-SIP_PORT = 5060
-API_PORT = 9091
-
-# Storage (In-memory for prototype)
-# Map: sip_uri -> (ip, port)
-registered_users = {}
-# Map: sip_uri -> [messages]
-message_store = {}
-
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.bind((SIP_IP, SIP_PORT))
-
-def parse_sip(data):
-    """Simple SIP parser for REGISTER and MESSAGE"""
-    lines = data.split('\r\n')
-    request_line = lines[0].split(' ')
-    method = request_line[0]
-    uri = request_line[1]
-    headers = {}
-    body = ""
-    
-    is_body = False
-    for line in lines[1:]:
-        if line == "":
-            is_body = True
-            continue
-        if is_body:
-            body += line + "\n"
-        else:
-            if ": " in line:
-                k, v = line.split(": ", 1)
-                headers[k] = v
-    
-    return method, uri, headers, body.strip()
+SIP_IP = os.environ.get('SIP_IP', '0.0.0.0')
+SIP_PORT = int(os.environ.get('SIP_PORT', '5060'))
+API_PORT = int(os.environ.get('API_PORT', '9091'))
+SIP_DOMAIN = os.environ.get('SIP_DOMAIN', 'free5gc.org')
+# Registrations: lifetime when a REGISTER has no Expires, the cap on requested ones, and the expiry sweep period
+SIP_DEFAULT_EXPIRES = int(os.environ.get('SIP_DEFAULT_EXPIRES', '3600'))
+SIP_MAX_EXPIRES = int(os.environ.get('SIP_MAX_EXPIRES', '86400'))
+SIP_REG_SWEEP = float(os.environ.get('SIP_REG_SWEEP', '1'))
+# Retransmitted requests get the cached response replayed for this long (64*T1) instead of being processed again
+SIP_TRANSACTION_TTL = float(os.environ.get('SIP_TRANSACTION_TTL', '32'))
+SIP_TRANSACTION_MAX = int(os.environ.get('SIP_TRANSACTION_MAX', '100000'))
+# Kernel receive buffer for the SIP socket
+SIP_RCVBUF = int(os.environ.get('SIP_RCVBUF', str(4 * 1024 * 1024)))
+# Extra processes receiving on the SIP port through SO_REUSEPORT (Linux), for multi-core ingress; 0 = this process alone
+SIP_WORKERS = int(os.environ.get('SIP_WORKERS', '0'))
+# Message store: 'memory' (bounded, lost on restart) or 'sqlite' (persistent, at SMS_DB_PATH)
+SMS_STORE = os.environ.get('SMS_STORE', 'memory')
+SMS_DB_PATH = os.environ.get('SMS_DB_PATH', 'smsc.db')
+SMS_MAX_MESSAGES = int(os.environ.get('SMS_MAX_MESSAGES', '100000'))
+SMS_RETENTION_DAYS = float(os.environ.get('SMS_RETENTION_DAYS', '7'))
+SMS_PAGE_LIMIT = int(os.environ.get('SMS_PAGE_LIMIT', '100'))
+SMS_MAX_PAGE_LIMIT = 1000
+# Incremental feed: longest ?wait= long-poll, and SSE keepalive interval on /sms/stream
+SMS_MAX_WAIT = float(os.environ.get('SMS_MAX_WAIT', '30'))
+SMS_STREAM_KEEPALIVE = float(os.environ.get('SMS_STREAM_KEEPALIVE', '15'))
+# Store-and-forward: retransmit MESSAGEs with exponential backoff until a 200 OK arrives
+SMS_INFLIGHT_PER_UE = int(os.environ.get('SMS_INFLIGHT_PER_UE', '4'))
+SMS_MAX_ATTEMPTS = int(os.environ.get('SMS_MAX_ATTEMPTS', '7'))
+SMS_RETRY_BASE = float(os.environ.get('SMS_RETRY_BASE', '0.5'))
+SMS_RETRY_MAX = float(os.environ.get('SMS_RETRY_MAX', '32'))
+SMS_VALIDITY = float(os.environ.get('SMS_VALIDITY', '86400'))
+SMS_MAX_PENDING_PER_UE = int(os.environ.get('SMS_MAX_PENDING_PER_UE', '1000'))
+# Bulk A2P (POST /sms/send/batch): all jobs share one token bucket of SMS_SEND_RATE messages/s
+SMS_SEND_RATE = float(os.environ.get('SMS_SEND_RATE', '1000'))
+SMS_SEND_BURST = int(os.environ.get('SMS_SEND_BURST', '200'))
+SMS_BATCH_CHUNK = int(os.environ.get('SMS_BATCH_CHUNK', '100'))
+SMS_BATCH_MAX = int(os.environ.get('SMS_BATCH_MAX', '500000'))
+
+# SIP workers, forked before any thread exists: each one parses and answers its share of
+# the datagrams and pipes the resulting state changes here (see ingress.py)
+fork = multiprocessing.get_context("fork")
+sip_workers = []
+for n in range(SIP_WORKERS):
+    events, worker_end = fork.Pipe(duplex=False)
+    # An unstarted Registrar: workers only need its expiry policy, the bindings live here
+    worker = fork.Process(target=ingress.serve, name=f"sip-worker-{n}", daemon=True, args=(
+        worker_end, SIP_IP, SIP_PORT, SIP_RCVBUF, Registrar(SIP_DEFAULT_EXPIRES, SIP_MAX_EXPIRES),
+        SIP_TRANSACTION_TTL, SIP_TRANSACTION_MAX, [e for _, e in sip_workers]))
+    worker.start()
+    worker_end.close()
+    sip_workers.append((worker, events))
+
+# Storage
+# Normalized AoR -> binding (UDP endpoint + expiry); stale bindings are swept out
+registrar = Registrar(default_expires=SIP_DEFAULT_EXPIRES, max_expires=SIP_MAX_EXPIRES).start(SIP_REG_SWEEP)
+# (Call-ID, CSeq, branch) -> the response already sent for it
+transactions = TransactionCache(ttl=SIP_TRANSACTION_TTL, max_entries=SIP_TRANSACTION_MAX)
+# Messages indexed by recipient, with retention by age and count
+message_store = open_store(SMS_STORE, SMS_DB_PATH, SMS_MAX_MESSAGES, SMS_RETENTION_DAYS)
+
+# Metrics (GET /metrics)
+registry = Registry()
+SIP_LATENCY = registry.histogram("smsc_sip_handling_seconds", "Time to handle one SIP datagram by method", ["method"])
+SIP_ERRORS = registry.counter("smsc_sip_errors_total", "SIP datagrams that failed to parse or handle")
+SIP_FORWARDED = registry.counter("smsc_sip_forwarded_total", "MESSAGEs forwarded to a registered recipient")
+SIP_RETRANSMISSIONS = registry.counter("smsc_sip_retransmissions_total", "Retransmitted requests answered from the transaction cache",
+                                       ["method"])
+registry.gauge("smsc_sip_transactions", "Server transactions remembered for duplicate suppression", lambda: len(transactions))
+API_LATENCY = registry.histogram("smsc_api_latency_seconds", "HTTP API latency by route", ["route", "method"])
+API_REQUESTS = registry.counter("smsc_api_requests_total", "HTTP API requests by route and status", ["route", "method", "status"])
+registry.gauge("smsc_registered_users", "Registered SIP users", lambda: len(registrar))
+registry.counter_fn("smsc_registrations_expired_total", "Bindings evicted because their Expires elapsed",
+                    lambda: registrar.expired)
+registry.gauge("smsc_sip_socket_drops", "Datagrams the kernel dropped on the SIP sockets (receive buffer full)",
+               lambda: udp_socket_drops(SIP_PORT))
+registry.gauge("smsc_sip_workers", "SIP worker processes alive", lambda: sum(w.is_alive() for w, _ in sip_workers))
+registry.gauge("smsc_stored_messages", "Messages held in the store", message_store.count)
+registry.gauge("smsc_deliveries", "MESSAGEs awaiting delivery by state", lambda: delivery.state_counts(), ["state"])
+registry.counter_fn("smsc_delivery_events_total", "Delivery engine events (submitted, sent, retransmitted, delivered, failed, expired)",
+                    lambda: delivery.totals(), ["event"])
+
+# Also a receiving socket of its own; MESSAGEs to UEs and answers to REGISTER queries leave from it
+sock = ingress.bind_socket(SIP_IP, SIP_PORT, SIP_RCVBUF, reuseport=SIP_WORKERS > 0)
+
+def udp_socket_drops(port):
+    """Kernel drop counter summed over our UDP sockets on port, from /proc/net/udp (Linux only)."""
+    drops = 0
+    try:
+        with open('/proc/net/udp') as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if int(fields[1].split(':')[1], 16) == port:
+                    drops += int(fields[-1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return drops
+
+def send_sip(payload, addr):
+    """Send one datagram. The socket stays blocking: the SIP, Flask and delivery threads all send on it."""
+    sock.sendto(payload, addr)
+
+def build_message(d):
+    """
+    SIP MESSAGE for a delivery (d.recipient is a normalized AoR), addressed
+    to the UE's registered Contact; retransmissions reuse the same Call-ID and branch.
+    """
+    binding = registrar.get(d.recipient)
+    aor = f"sip:{d.recipient}@{SIP_DOMAIN}"
+    target = binding.contact if binding else aor
+    return f"MESSAGE {target} SIP/2.0\r\nVia: SIP/2.0/UDP {SIP_IP}:{SIP_PORT};branch=z9hG4bK-{d.call_id}\r\nFrom: {d.sender}\r\nTo: <{aor}>\r\nCall-ID: {d.call_id}\r\nCSeq: 1 MESSAGE\r\nContent-Type: text/plain\r\nContent-Length: {len(d.body.encode('utf-8'))}\r\n\r\n{d.body}"
+
+delivery = DeliveryEngine(
+    send_sip, registrar.lookup, build_message,
+    inflight_per_ue=SMS_INFLIGHT_PER_UE, max_attempts=SMS_MAX_ATTEMPTS, base_delay=SMS_RETRY_BASE,
+    max_delay=SMS_RETRY_MAX, validity=SMS_VALIDITY, max_pending_per_ue=SMS_MAX_PENDING_PER_UE,
+).start()
+
+campaigns = CampaignRunner(delivery.submit_many, TokenBucket(SMS_SEND_RATE, SMS_SEND_BURST),
+                           chunk_size=SMS_BATCH_CHUNK)
+registry.gauge("smsc_campaign_jobs_running", "Bulk A2P jobs in progress", campaigns.running)
+
+def process_sip(data, addr):
+    """Handle one SIP datagram received on this process's socket."""
+    start = time.perf_counter()
+    method, event = ingress.handle(data, addr, transactions, send_sip, registrar, registrar.get)
+    apply_sip_event(method, event, time.perf_counter() - start)
+
+def apply_sip_event(method, event, elapsed):
+    """
+    Apply the state change ingress.handle() returned for one datagram, and
+    record it; elapsed is the time spent in handle(), here or in a worker.
+    """
+    if event is not None and event[0] == "query":
+        # A worker's REGISTER query: answered here, where the bindings are
+        process_sip(event[1], event[2])
+        return
+    start = time.perf_counter()
+    try:
+        kind = event[0] if event is not None else None
+        if kind == "response":
+            delivery.on_response(event[1], event[2])
+
+        elif kind == "register":
+            _, aor, contact_uri, addr, expires = event
+            binding = registrar.register(aor, contact_uri, addr, expires)
+            # Flush anything stored while the UE was offline
+            if binding:
+                delivery.on_register(binding.key)
+
+        elif kind == "message":
+            _, recipient, sender, body = event
+            message_store.append(recipient, sender, body)
+
+            # Forward to Recipient: sent now if online, otherwise held until it registers.
+            # We act as a B2BUA (Back-to-Back User Agent) effectively re-originating.
+            delivery.submit(recipient, sender, body, kind="fwd")
+            target = registrar.lookup(recipient)
+            if target is not None:
+                print(f"[>>] Forwarding to {target}")
+                SIP_FORWARDED.inc()
+            else:
+                print(f"[!] Recipient {recipient} not registered. Stored for delivery on REGISTER.")
+
+        elif kind == "retransmission":
+            SIP_RETRANSMISSIONS.inc(method)
+
+        elif kind == "error":
+            SIP_ERRORS.inc()
+
+    except Exception as e:
+        SIP_ERRORS.inc()
+        print(f"[!] SIP Error: {e}")
+    finally:
+        SIP_LATENCY.observe(elapsed + time.perf_counter() - start, method)
 
 def handle_sip():
-    print(f"[*] SIP Listener started on {SIP_IP}:{SIP_PORT}")
+    print(f"[*] SIP Listener started on {SIP_IP}:{SIP_PORT}" + (f" with {SIP_WORKERS} worker process(es)" if SIP_WORKERS else ""))
+    while True:
+        data, addr = sock.recvfrom(ingress.MAX_DATAGRAM)
+        process_sip(data, addr)
+
+def drain_sip_worker(name, events):
+    """Apply a worker's event batches in the order it sent them."""
     while True:
-        data, addr = sock.recvfrom(4096)
         try:
-            msg = data.decode('utf-8')
-            method, uri, headers, body = parse_sip(msg)
-            
-            sender = headers.get('From', '').split(';')[0].replace('<', '').replace('>', '')
-            recipient = headers.get('To', '').split(';')[0].replace('<', '').replace('>', '')
-            call_id = headers.get('Call-ID', '12345')
-            cseq = headers.get('CSeq', '1 REGISTER')
-            
-            print(f"[SIP] Received {method} from {sender} ({addr})")
-
-            if method == 'REGISTER':
-                # Map user to the source IP/Port of the UDP packet
-                registered_users[sender] = addr
-                print(f"[+] Registered {sender} at {addr}")
-                
-                # Send 200 OK
-                response = f"SIP/2.0 200 OK\r\nVia: {headers.get('Via')}\r\nFrom: {headers.get('From')}\r\nTo: {headers.get('To')}\r\nCall-ID: {call_id}\r\nCSeq: {cseq}\r\nContent-Length: 0\r\n\r\n"
-                sock.sendto(response.encode('utf-8'), addr)
-
-            elif method == 'MESSAGE':
-                # P2P SMS
-                print(f"[>] Message: '{body}' from {sender} to {recipient}")
-                
-                # Store message
-                if recipient not in message_store:
-                    message_store[recipient] = []
-                message_store[recipient].append({"from": sender, "body": body, "time": time.ctime()})
-                
-                # Send 200 OK to Sender
-                response = f"SIP/2.0 200 OK\r\nVia: {headers.get('Via')}\r\nFrom: {headers.get('From')}\r\nTo: {headers.get('To')}\r\nCall-ID: {call_id}\r\nCSeq: {cseq}\r\nContent-Length: 0\r\n\r\n"
-                sock.sendto(response.encode('utf-8'), addr)
-                
-                # Forward to Recipient if online
-                if recipient in registered_users:
-                    target_addr = registered_users[recipient]
-                    print(f"[>>] Forwarding to {target_addr}")
-                    
-                    # Construct Forward Message
-                    # Note: Simplified forwarding. Real proxying involves Via headers etc.
-                    # We act as a B2BUA (Back-to-Back User Agent) effectively re-originating.
-                    fwd_msg = f"MESSAGE {recipient} SIP/2.0\r\nVia: SIP/2.0/UDP {SIP_IP}:{SIP_PORT};branch=z9hG4bK-fwd\r\nFrom: {sender}\r\nTo: {recipient}\r\nCall-ID: fwd-{call_id}\r\nCSeq: 1 MESSAGE\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n\r\n{body}"
-                    sock.sendto(fwd_msg.encode('utf-8'), target_addr)
-                else:
-                    print(f"[!] Recipient {recipient} not registered. Stored offline.")
-
-        except Exception as e:
-            print(f"[!] SIP Error: {e}")
+            batch = events.recv()
+        except EOFError:
+            print(f"[!] {name} exited; the remaining SIP sockets take its share of the traffic")
+            return
+        for method, elapsed, event in batch:
+            apply_sip_event(method, event, elapsed)
 
 # Start SIP thread
 threading.Thread(target=handle_sip, daemon=True).start()
+for worker, events in sip_workers:
+    threading.Thread(target=drain_sip_worker, args=(worker.name, events), name=worker.name, daemon=True).start()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        API_LATENCY.observe(time.perf_counter() - start, route, request.method)
+        API_REQUESTS.inc(route, request.method, response.status_code)
+    return response
 
 @app.route('/sms/send', methods=['POST'])
 def send_marketing_sms():
     data = request.json
-    recipient = data.get('to') # sip:msisdn@domain
+    recipient = normalize_aor(data.get('to')) # sip:msisdn@domain, tel:+msisdn or a bare msisdn
     body = data.get('body')
     sender_name = data.get('from', 'sip:marketing@smsc')
 
@@ -111,18 +242,160 @@ def send_marketing_sms():
 
     print(f"[API] Sending A2P to {recipient}: {body}")
     
-    # Check registration
-    if recipient in registered_users:
-        target_addr = registered_users[recipient]
-        msg = f"MESSAGE {recipient} SIP/2.0\r\nVia: SIP/2.0/UDP {SIP_IP}:{SIP_PORT};branch=z9hG4bK-a2p\r\nFrom: {sender_name}\r\nTo: {recipient}\r\nCall-ID: a2p-{time.time()}\r\nCSeq: 1 MESSAGE\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n\r\n{body}"
-        sock.sendto(msg.encode('utf-8'), target_addr)
-        return jsonify({"status": "Sent", "target": str(target_addr)})
+    # Sent now if registered, otherwise queued until the UE registers
+    d = delivery.submit(recipient, sender_name, body, kind="a2p")
+    if d.state == PENDING:
+        return jsonify({"status": "Queued", "id": d.id}), 202
+    return jsonify({"status": "Sent", "target": str(d.addr), "id": d.id})
+
+@app.route('/sms/send/batch', methods=['POST'])
+def send_marketing_sms_batch():
+    """
+    Start a background A2P job. Either {"to": [uri, ...], "body": ..., "from": ...}
+    or {"messages": [{"to": ..., "body": ..., "from": ...}, ...]} (per-message
+    fields override the top-level ones). Poll GET /sms/jobs/<job_id> for progress.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    default_from = data.get('from', 'sip:marketing@smsc')
+    default_body = data.get('body')
+
+    if isinstance(data.get('messages'), list):
+        entries = data['messages']
+    elif isinstance(data.get('to'), list):
+        entries = [{"to": to} for to in data['to']]
     else:
-        return jsonify({"status": "Failed", "error": "Recipient offline"}), 404
+        return jsonify({"error": "Provide 'messages' or a list in 'to'"}), 400
+    if len(entries) > SMS_BATCH_MAX:
+        return jsonify({"error": f"At most {SMS_BATCH_MAX} messages per batch"}), 413
+
+    messages = []
+    for i, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {"to": entry}
+        if not isinstance(entry, dict):
+            return jsonify({"error": f"Entry {i} is not an object"}), 400
+        recipient = normalize_aor(entry.get('to'))
+        body = entry.get('body', default_body)
+        if not recipient or not body:
+            return jsonify({"error": f"Entry {i}: missing 'to' or 'body'"}), 400
+        messages.append((recipient, entry.get('from', default_from), body))
+    if not messages:
+        return jsonify({"error": "Empty batch"}), 400
+
+    job = campaigns.start(messages)
+    return jsonify({"job_id": job.id, "total": job.total, "status_url": f"/sms/jobs/{job.id}"}), 202
+
+@app.route('/sms/jobs/<int:job_id>', methods=['GET', 'DELETE'])
+def sms_job(job_id):
+    job = campaigns.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    if request.method == 'DELETE':
+        # Stops submitting; messages already handed to the delivery engine still go out
+        job.cancel.set()
+    return jsonify(job.to_dict())
+
+@app.route('/sms/deliveries/<int:delivery_id>', methods=['GET'])
+def get_delivery(delivery_id):
+    d = delivery.get(delivery_id)
+    if d is None:
+        return jsonify({"error": "Unknown or expired delivery id"}), 404
+    return jsonify(d)
+
+@app.route('/sms/deliveries', methods=['GET'])
+def get_delivery_stats():
+    return jsonify(delivery.stats())
+
+def parse_since(value):
+    """?since= / Last-Event-ID: a sequence number, or 'latest' for only messages stored from now on."""
+    return message_store.last_seq() if value == 'latest' else max(int(value), 0)
 
 @app.route('/sms/messages', methods=['GET'])
 def get_messages():
-    return jsonify(message_store)
+    """
+    One page of stored messages, grouped by recipient, oldest first.
+    ?to=<sip uri or msisdn> limits it to one inbox; ?limit= sets the page size and
+    ?cursor= continues from the X-Next-Cursor header of the previous page.
+
+    Incremental mode: ?since=<id> (or 'latest') returns only messages with a
+    larger id, and X-Next-Since says where the next call resumes. With
+    ?wait=<seconds> an empty result is held open until a message arrives
+    (long-poll), up to SMS_MAX_WAIT.
+    """
+    try:
+        limit = min(int(request.args.get('limit', SMS_PAGE_LIMIT)), SMS_MAX_PAGE_LIMIT)
+        cursor = request.args.get('cursor')
+        cursor = int(cursor) if cursor else None
+        since = request.args.get('since')
+        since = parse_since(since) if since else None
+        wait = min(float(request.args.get('wait', 0)), SMS_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "'limit', 'cursor', 'since' and 'wait' must be numbers"}), 400
+    if limit < 1:
+        return jsonify({"error": "'limit' must be positive"}), 400
+    recipient = normalize_aor(request.args['to']) if request.args.get('to') else None
+
+    next_since = None
+    if since is None:
+        records, next_cursor = message_store.page(recipient, limit, cursor)
+    else:
+        deadline = time.monotonic() + wait
+        while True:
+            records, next_since, more = message_store.since(recipient, since, limit)
+            remaining = deadline - time.monotonic()
+            if records or remaining <= 0:
+                break
+            # Nothing new for this reader: sleep until the next append (or the deadline)
+            since = next_since
+            if not message_store.wait(since, remaining):
+                break
+        next_cursor = next_since if more else None
+
+    inbox = {}
+    for record in records:
+        inbox.setdefault(record["to"], []).append(record)
+    response = jsonify(inbox)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    if next_since is not None:
+        response.headers['X-Next-Since'] = str(next_since)
+    return response
+
+@app.route('/sms/stream', methods=['GET'])
+def stream_messages():
+    """
+    Server-Sent Events feed of stored messages, pushed as process_sip stores
+    them: one 'message' event per record, with its id as the event id.
+    ?to= filters by recipient; ?since= (or a reconnecting client's
+    Last-Event-ID) replays from that id, otherwise the feed starts at the
+    newest message. A comment line is sent every SMS_STREAM_KEEPALIVE seconds.
+    """
+    try:
+        since = request.headers.get('Last-Event-ID') or request.args.get('since') or 'latest'
+        since = parse_since(since)
+    except ValueError:
+        return jsonify({"error": "'since' must be a number or 'latest'"}), 400
+    recipient = normalize_aor(request.args['to']) if request.args.get('to') else None
+
+    def events(cursor):
+        yield "retry: 3000\n\n"
+        while True:
+            records, cursor, more = message_store.since(recipient, cursor, SMS_MAX_PAGE_LIMIT)
+            for record in records:
+                yield f"id: {record['id']}\nevent: message\ndata: {json.dumps(record)}\n\n"
+            if more:
+                continue
+            if not message_store.wait(cursor, SMS_STREAM_KEEPALIVE):
+                yield ": keepalive\n\n"
+
+    return Response(events(since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=API_PORT)
@@ -0,0 +1,247 @@
+"""
+Message stores for mini_smsc.
+
+Both backends keep messages ordered by a monotonically increasing sequence
+number, index them by recipient, and apply retention by age and by count so
+memory (or disk) stays bounded however long the SMSC runs:
+
+- MemoryStore: in-process, per-recipient logs plus a global log for eviction.
+- SqliteStore: durable across restarts, indexed on (recipient, seq) and ts.
+
+Pages are read with a cursor (the last sequence number seen), so reading an
+inbox costs O(page) rather than O(all messages). since() and wait() build an
+incremental feed on top: a reader resumes from the last sequence number it
+saw and blocks on a Condition, notified by append(), until there is more.
+"""
+import bisect
+import os
+import sqlite3
+import threading
+import time
+
+
+def make_record(seq, recipient, sender, body, ts):
+    return {"id": seq, "from": sender, "to": recipient, "body": body, "time": time.ctime(ts), "ts": ts}
+
+
+class _Log:
+    """Append-only list of records with O(1) amortized removal from the front."""
+
+    __slots__ = ("items", "seqs", "start")
+
+    def __init__(self):
+        self.items = []
+        self.seqs = []
+        self.start = 0
+
+    def __len__(self):
+        return len(self.items) - self.start
+
+    def append(self, record):
+        self.items.append(record)
+        self.seqs.append(record["id"])
+
+    def first(self):
+        return self.items[self.start] if len(self) else None
+
+    def popleft(self):
+        record = self.items[self.start]
+        self.items[self.start] = None
+        self.start += 1
+        if self.start > 64 and self.start * 2 > len(self.items):
+            del self.items[:self.start]
+            del self.seqs[:self.start]
+            self.start = 0
+        return record
+
+    def after(self, cursor, limit):
+        """Up to limit records with id > cursor, oldest first."""
+        i = self.start if cursor is None else bisect.bisect_right(self.seqs, cursor, self.start)
+        return self.items[i:i + limit]
+
+
+class _Feed:
+    """since()/wait() shared by both stores; they keep _seq, _appended and page_locked()."""
+
+    def since(self, recipient=None, cursor=0, limit=100):
+        """
+        (records, next_cursor, more): up to limit records with id > cursor.
+        next_cursor is where to resume (the newest id covered, even when the
+        recipient filter matched nothing); more is True when a full page was cut short.
+        """
+        with self._lock:
+            # Read the head first: anything appended after it has a larger id and is not skipped
+            head = self._seq
+            records = self.page_locked(recipient, limit + 1, cursor)
+        if len(records) > limit:
+            records = records[:limit]
+            return records, records[-1]["id"], True
+        return records, max(head, cursor), False
+
+    def last_seq(self):
+        return self._seq
+
+    def wait(self, cursor, timeout):
+        """Block until a message with id > cursor is appended; False on timeout."""
+        with self._appended:
+            return self._appended.wait_for(lambda: self._seq > cursor, timeout)
+
+
+class MemoryStore(_Feed):
+    """Bounded in-process store: at most max_messages, none older than retention seconds."""
+
+    def __init__(self, max_messages=100000, retention=7 * 86400):
+        self.max_messages = max_messages
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+        self._seq = 0
+        self._all = _Log()
+        self._by_recipient = {}
+
+    def append(self, recipient, sender, body, ts=None):
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            self._seq += 1
+            record = make_record(self._seq, recipient, sender, body, ts)
+            self._all.append(record)
+            log = self._by_recipient.get(recipient)
+            if log is None:
+                log = self._by_recipient[recipient] = _Log()
+            log.append(record)
+            self._prune_locked(ts)
+            self._appended.notify_all()
+        return record
+
+    def page(self, recipient=None, limit=100, cursor=None):
+        """(records, next_cursor); next_cursor is None once the end is reached."""
+        with self._lock:
+            records = self.page_locked(recipient, limit + 1, cursor)
+        if len(records) > limit:
+            records = records[:limit]
+            return records, records[-1]["id"]
+        return records, None
+
+    def page_locked(self, recipient, limit, cursor):
+        self._prune_locked(time.time())
+        log = self._all if recipient is None else self._by_recipient.get(recipient)
+        return log.after(cursor, limit) if log is not None else []
+
+    def count(self):
+        return len(self._all)
+
+    def prune(self):
+        with self._lock:
+            self._prune_locked(time.time())
+
+    def _prune_locked(self, now):
+        cutoff = now - self.retention if self.retention else None
+        while len(self._all) and (len(self._all) > self.max_messages or
+                                  (cutoff is not None and self._all.first()["ts"] < cutoff)):
+            record = self._all.popleft()
+            # Sequence numbers only grow, so a recipient's oldest record is the one being evicted
+            log = self._by_recipient[record["to"]]
+            log.popleft()
+            if not len(log):
+                del self._by_recipient[record["to"]]
+
+    def close(self):
+        pass
+
+
+class SqliteStore(_Feed):
+    """SQLite-backed store; retention is enforced every prune_every appends."""
+
+    def __init__(self, path, max_messages=1000000, retention=7 * 86400, prune_every=1000):
+        self.path = path
+        self.max_messages = max_messages
+        self.retention = retention
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+        self._appends = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " recipient TEXT NOT NULL, sender TEXT NOT NULL, body TEXT NOT NULL, ts REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_recipient_seq ON messages (recipient, seq)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts)")
+        self._seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM messages").fetchone()[0]
+        self.prune()
+
+    def append(self, recipient, sender, body, ts=None):
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO messages (recipient, sender, body, ts) VALUES (?, ?, ?, ?)",
+                (recipient, sender, body, ts),
+            )
+            seq = self._seq = cur.lastrowid
+            self._appends += 1
+            if self._appends % self.prune_every == 0:
+                self._prune_locked(ts)
+            self._appended.notify_all()
+        return make_record(seq, recipient, sender, body, ts)
+
+    def page(self, recipient=None, limit=100, cursor=None):
+        """(records, next_cursor); next_cursor is None once the end is reached."""
+        with self._lock:
+            records = self.page_locked(recipient, limit + 1, cursor)
+        if len(records) > limit:
+            records = records[:limit]
+            return records, records[-1]["id"]
+        return records, None
+
+    def page_locked(self, recipient, limit, cursor):
+        clauses, args = ["seq > ?"], [cursor or 0]
+        if recipient is not None:
+            clauses.append("recipient = ?")
+            args.append(recipient)
+        if self.retention:
+            clauses.append("ts >= ?")
+            args.append(time.time() - self.retention)
+        args.append(limit)
+        rows = self._db.execute(
+            f"SELECT seq, recipient, sender, body, ts FROM messages WHERE {' AND '.join(clauses)}"
+            " ORDER BY seq LIMIT ?",
+            args,
+        ).fetchall()
+        return [make_record(*row) for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def prune(self):
+        with self._lock:
+            self._prune_locked(time.time())
+
+    def _prune_locked(self, now):
+        if self.retention:
+            self._db.execute("DELETE FROM messages WHERE ts < ?", (now - self.retention,))
+        row = self._db.execute(
+            "SELECT seq FROM messages ORDER BY seq DESC LIMIT 1 OFFSET ?", (self.max_messages,)
+        ).fetchone()
+        if row:
+            self._db.execute("DELETE FROM messages WHERE seq <= ?", (row[0],))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_store(kind, path, max_messages, retention_days):
+    """Store selected by SMS_STORE: 'memory' or 'sqlite'."""
+    retention = retention_days * 86400
+    if kind == 'sqlite':
+        print(f"[Store] SQLite message store at {path} (max {max_messages}, {retention_days}d retention)")
+        return SqliteStore(path, max_messages=max_messages, retention=retention)
+    print(f"[Store] In-memory message store (max {max_messages}, {retention_days}d retention)")
+    return MemoryStore(max_messages=max_messages, retention=retention)
@@ -0,0 +1,71 @@
+"""
+Server transaction cache for mini_smsc (duplicate suppression).
+
+Over UDP a UE retransmits its REGISTER or MESSAGE until the 200 OK gets
+through. A retransmission carries the same Call-ID, CSeq and top Via branch
+as the original, so the SMSC remembers the response it sent for each of
+those keys and replays it instead of storing and forwarding the SMS again.
+
+Entries live for ttl seconds (64*T1 = 32s by default, the lifetime of a
+non-INVITE transaction) and at most max_entries are kept; every entry has the
+same lifetime, so insertion order is expiry order and eviction is O(1).
+"""
+import collections
+import threading
+import time
+
+
+def via_branch(via):
+    """branch parameter of the topmost Via value, or ''."""
+    top = via.split(",", 1)[0]
+    for param in top.split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "branch":
+            return value.strip()
+    return ""
+
+
+def transaction_key(msg):
+    """(Call-ID, CSeq, branch) of a request, or None if it has no Call-ID to match on."""
+    call_id = msg.get('call-id')
+    if not call_id:
+        return None
+    return call_id.strip(), " ".join(msg.get('cseq', '').split()), via_branch(msg.get('via', ''))
+
+
+class TransactionCache:
+    def __init__(self, ttl=32.0, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (expires_at, response bytes)
+        self.replayed = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """The response sent for this transaction, if it is still remembered."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_locked(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.replayed += 1
+            return entry[1]
+
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _evict_locked(self, now):
+        entries = self._entries
+        while entries:
+            key, (expires_at, _) = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            del entries[key]
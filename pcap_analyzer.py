@@ -0,0 +1,759 @@
+"""
+NGAP/NAS procedure latency from AMF captures (e.g. capture/amf.pcap).
+
+    python pcap_analyzer.py capture/amf.pcap
+    python pcap_analyzer.py big.pcap --ip-map ue_ips.jsonl --json report.json
+    python pcap_analyzer.py big.pcap --seed-mongo "mongodb://localhost:27017/?directConnection=true"
+
+The file is memory-mapped and walked record by record; frames, SCTP chunks
+and NGAP IEs are memoryview slices of the mapping, so nothing is copied but
+the few fields that are decoded. Pages already consumed are released as the
+walk advances, and latencies go into fixed-size log histograms, so memory
+stays flat however large the capture is (per-UE state lives only while a
+UE context is open).
+
+Decoded:
+  - pcap (micro/nanosecond, either byte order) over Ethernet, Linux SLL/SLL2,
+    raw IP or BSD loopback; IPv4/IPv6; SCTP DATA chunks with PPID 60 (NGAP),
+    with fragmented user messages reassembled and retransmitted TSNs dropped
+  - NGAP (APER) message type, procedure code, UE NGAP IDs and NAS-PDUs,
+    including those inside PDU session resource setup lists
+  - plain NAS, and integrity-protected NAS ciphered with NEA0 (free5GC's
+    default): 5GMM Registration/Service/Deregistration and 5GSM PDU session
+    establishment/release, SUCI (null scheme) -> SUPI, 5G-GUTI, PDU address
+
+Reported: per-procedure count, outcome and latency percentiles, for both
+NGAP class-1 procedures (request -> response) and NAS procedures (e.g.
+Registration Request -> Accept). UE IP assignments (SUPI, IP, PDU session,
+DNN) can be written as JSON lines or upserted into the collection the NEF's
+IP->SUPI index reads (pcfBindings by default).
+"""
+import argparse
+import collections
+import json
+import math
+import mmap
+import struct
+import sys
+
+# --- pcap ---
+
+PCAP_MAGICS = {
+    b"\xd4\xc3\xb2\xa1": ("<", 1e-6),
+    b"\xa1\xb2\xc3\xd4": (">", 1e-6),
+    b"\x4d\x3c\xb2\xa1": ("<", 1e-9),
+    b"\xa1\xb2\x3c\x4d": (">", 1e-9),
+}
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = (12, 101)
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+# Consumed pages are handed back to the kernel every this many bytes
+RELEASE_EVERY = 64 * 1024 * 1024
+
+
+def pcap_records(mm):
+    """Yield (timestamp, linktype, frame memoryview) for every record of a mapped pcap file."""
+    magic = bytes(mm[:4])
+    if magic == b"\x0a\x0d\x0d\x0a":
+        raise ValueError("pcapng is not supported; convert with: editcap -F pcap in.pcapng out.pcap")
+    if magic not in PCAP_MAGICS:
+        raise ValueError("not a pcap file")
+    order, tick = PCAP_MAGICS[magic]
+    linktype = struct.unpack_from(order + "I", mm, 20)[0] & 0x0FFFFFFF
+    record = struct.Struct(order + "IIII")
+    view = memoryview(mm)
+    size = len(mm)
+    offset = 24
+    released = 0
+    page = mmap.ALLOCATIONGRANULARITY
+    try:
+        while offset + 16 <= size:
+            sec, frac, incl_len, _ = record.unpack_from(mm, offset)
+            offset += 16
+            if offset + incl_len > size:
+                break  # truncated last record (capture still being written)
+            yield sec + frac * tick, linktype, view[offset:offset + incl_len]
+            offset += incl_len
+            if offset - released >= RELEASE_EVERY and hasattr(mm, "madvise"):
+                upto = offset - offset % page
+                mm.madvise(mmap.MADV_DONTNEED, released, upto - released)
+                released = upto
+    finally:
+        view.release()
+
+
+def ip_payload(linktype, frame):
+    """(ip packet memoryview) for the frame's IPv4/IPv6 packet, or None."""
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype, at = struct.unpack_from(">H", frame, 12)[0], 14
+        while ethertype in (0x8100, 0x88A8) and len(frame) >= at + 4:
+            ethertype, at = struct.unpack_from(">H", frame, at + 2)[0], at + 4
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        ethertype, at = struct.unpack_from(">H", frame, 0)[0], 20
+    elif linktype == LINKTYPE_LINUX_SLL:
+        ethertype, at = struct.unpack_from(">H", frame, 14)[0], 16
+    elif linktype in LINKTYPE_RAW:
+        return frame
+    elif linktype == LINKTYPE_NULL:
+        return frame[4:]
+    else:
+        return None
+    return frame[at:] if ethertype in (0x0800, 0x86DD) else None
+
+
+def sctp_segment(packet):
+    """(src, dst, sctp memoryview) for an unfragmented SCTP packet; src/dst are (ip, port)."""
+    if len(packet) < 20:
+        return None
+    version = packet[0] >> 4
+    if version == 4:
+        ihl = (packet[0] & 0x0F) * 4
+        flags_frag = struct.unpack_from(">H", packet, 6)[0]
+        if packet[9] != 132 or flags_frag & 0x3FFF:
+            return None  # not SCTP, or an IP fragment
+        total = struct.unpack_from(">H", packet, 2)[0]
+        src, dst = bytes(packet[12:16]), bytes(packet[16:20])
+        segment = packet[ihl:total] if total else packet[ihl:]
+    elif version == 6:
+        if len(packet) < 40:
+            return None
+        next_header, at = packet[6], 40
+        # Hop-by-hop, routing and destination options headers
+        while next_header in (0, 43, 60) and len(packet) >= at + 8:
+            next_header, at = packet[at], at + (packet[at + 1] + 1) * 8
+        if next_header != 132:
+            return None
+        src, dst = bytes(packet[8:24]), bytes(packet[24:40])
+        segment = packet[at:40 + struct.unpack_from(">H", packet, 4)[0]]
+    else:
+        return None
+    if len(segment) < 12:
+        return None
+    sport, dport = struct.unpack_from(">HH", segment, 0)
+    return (src, sport), (dst, dport), segment
+
+
+def format_ip(raw):
+    if len(raw) == 4:
+        return ".".join(str(b) for b in raw)
+    groups = [f"{struct.unpack_from('>H', raw, i)[0]:x}" for i in range(0, 16, 2)]
+    return ":".join(groups)
+
+
+NGAP_PPID = 60
+
+
+class SctpReader:
+    """
+    NGAP user messages from SCTP DATA chunks: fragments are reassembled per
+    (association, stream) and chunks whose TSN was already seen are dropped.
+    """
+
+    def __init__(self, tsn_window=4096):
+        self.tsn_window = tsn_window
+        self._seen = {}       # (src, dst) -> (set, deque) of recent TSNs
+        self._fragments = {}  # (src, dst, stream) -> [bytes]
+        self.retransmissions = 0
+
+    def messages(self, src, dst, segment):
+        at = 12
+        while at + 4 <= len(segment):
+            chunk_type, flags, length = segment[at], segment[at + 1], struct.unpack_from(">H", segment, at + 2)[0]
+            if length < 4:
+                return
+            if chunk_type == 0 and length >= 16:
+                tsn, stream, _, ppid = struct.unpack_from(">IHHI", segment, at + 4)
+                data = segment[at + 16:at + length]
+                if ppid == NGAP_PPID and self._first_time(src, dst, tsn):
+                    message = self._reassemble(src, dst, stream, flags, data)
+                    if message is not None:
+                        yield message
+            at += (length + 3) & ~3
+
+    def _first_time(self, src, dst, tsn):
+        key = (src, dst)
+        entry = self._seen.get(key)
+        if entry is None:
+            entry = self._seen[key] = (set(), collections.deque())
+        seen, order = entry
+        if tsn in seen:
+            self.retransmissions += 1
+            return False
+        seen.add(tsn)
+        order.append(tsn)
+        if len(order) > self.tsn_window:
+            seen.discard(order.popleft())
+        return True
+
+    def _reassemble(self, src, dst, stream, flags, data):
+        begin, end = flags & 0x02, flags & 0x01
+        if begin and end:
+            return data
+        key = (src, dst, stream)
+        if begin:
+            self._fragments[key] = [bytes(data)]
+        elif key in self._fragments:
+            self._fragments[key].append(bytes(data))
+            if end:
+                return memoryview(b"".join(self._fragments.pop(key)))
+        return None
+
+
+# --- NGAP (APER) ---
+
+INITIATING, SUCCESSFUL, UNSUCCESSFUL = 0, 1, 2
+
+NGAP_PROCEDURES = {
+    0: "AMFConfigurationUpdate", 4: "DownlinkNASTransport", 14: "InitialContextSetup",
+    15: "InitialUEMessage", 20: "NGReset", 21: "NGSetup", 25: "Paging", 26: "PathSwitchRequest",
+    27: "PDUSessionResourceModify", 28: "PDUSessionResourceRelease", 29: "PDUSessionResourceSetup",
+    35: "RANConfigurationUpdate", 40: "UEContextModification", 41: "UEContextRelease",
+    42: "UEContextReleaseRequest", 44: "UERadioCapabilityInfoIndication", 46: "UplinkNASTransport",
+}
+
+# Class-1 procedures (those with a response); the rest are one-way messages
+NGAP_CLASS1 = {0, 12, 13, 14, 20, 21, 26, 27, 28, 29, 35, 40, 41}
+
+IE_AMF_UE_NGAP_ID = 10
+IE_RAN_UE_NGAP_ID = 85
+IE_NAS_PDU = 38
+IE_PDU_SESSION_SETUP_LIST_CXT_REQ = 71
+IE_PDU_SESSION_SETUP_LIST_SU_REQ = 74
+IE_UE_NGAP_IDS = 114
+
+
+class AperError(ValueError):
+    pass
+
+
+def aper_length(buf, at):
+    """(length, offset after the determinant) of an APER length determinant."""
+    first = buf[at]
+    if first & 0x80 == 0:
+        return first, at + 1
+    if first & 0xC0 == 0x80:
+        return ((first & 0x3F) << 8) | buf[at + 1], at + 2
+    raise AperError("fragmented length")
+
+
+def aper_open(buf, at):
+    """(contents memoryview, offset after) of an open type or unconstrained OCTET STRING."""
+    length, at = aper_length(buf, at)
+    if at + length > len(buf):
+        raise AperError("truncated")
+    return buf[at:at + length], at + length
+
+
+def skip_extension_container(buf, at):
+    """Skip a ProtocolExtensionContainer (SEQUENCE SIZE(1..65535) OF id/criticality/open type)."""
+    count = struct.unpack_from(">H", buf, at)[0] + 1
+    at += 2
+    for _ in range(count):
+        _, at = aper_open(buf, at + 3)
+    return at
+
+
+def setup_list_nas_pdus(value):
+    """NAS-PDUs of a PDUSessionResourceSetupList{SU,Cxt}Req (items: id, NAS-PDU?, S-NSSAI, transfer, ext?)."""
+    count = value[0] + 1
+    at = 1
+    pdus = []
+    for _ in range(count):
+        preamble = value[at]
+        has_nas, has_ext = preamble & 0x40, preamble & 0x20
+        at += 2  # preamble + pDUSessionID
+        if has_nas:
+            nas, at = aper_open(value, at)
+            pdus.append(nas)
+        # S-NSSAI: preamble (ext, sD?, iE-Extensions?), sST, sD
+        snssai = value[at]
+        at += 2 + (3 if snssai & 0x40 else 0)
+        if snssai & 0x20:
+            at = skip_extension_container(value, at)
+        _, at = aper_open(value, at)  # PDUSessionResourceSetupRequestTransfer
+        if has_ext:
+            at = skip_extension_container(value, at)
+    return pdus
+
+
+def decode_ngap(pdu):
+    """(message type, procedure code, {ie id: value memoryview}) of an NGAP-PDU."""
+    kind = (pdu[0] >> 5) & 0x03
+    procedure = pdu[1]
+    value, _ = aper_open(pdu, 3)
+    count = struct.unpack_from(">H", value, 1)[0]
+    at = 3
+    ies = {}
+    for _ in range(count):
+        ie_id = struct.unpack_from(">H", value, at)[0]
+        ies[ie_id], at = aper_open(value, at + 3)
+    return kind, procedure, ies
+
+
+def ngap_ue_id(value, length_bits):
+    """
+    AMF-UE-NGAP-ID (length_bits=3) or RAN-UE-NGAP-ID (2): a constrained whole
+    number, its octet count minus one in the top bits of the first octet.
+    """
+    length = (value[0] >> (8 - length_bits)) + 1
+    return int.from_bytes(value[1:1 + length], "big")
+
+
+def ngap_ue_ids(ies):
+    """(AMF-UE-NGAP-ID, RAN-UE-NGAP-ID), either None when absent."""
+    amf_id = ngap_ue_id(ies[IE_AMF_UE_NGAP_ID], 3) if IE_AMF_UE_NGAP_ID in ies else None
+    ran_id = ngap_ue_id(ies[IE_RAN_UE_NGAP_ID], 2) if IE_RAN_UE_NGAP_ID in ies else None
+    if amf_id is None and IE_UE_NGAP_IDS in ies:
+        # UE-NGAP-IDs CHOICE (2 bits): 0 = ID pair, whose SEQUENCE preamble takes 2 more
+        # bits before the AMF ID's 3-bit length; 1 = AMF-UE-NGAP-ID alone
+        value = ies[IE_UE_NGAP_IDS]
+        choice = value[0] >> 6
+        if choice in (0, 1):
+            length = ((value[0] >> (1 if choice == 0 else 3)) & 0x07) + 1
+            amf_id = int.from_bytes(value[1:1 + length], "big")
+    return amf_id, ran_id
+
+
+def ngap_nas_pdus(ies):
+    pdus = []
+    if IE_NAS_PDU in ies:
+        pdus.append(aper_open(ies[IE_NAS_PDU], 0)[0])
+    for ie_id in (IE_PDU_SESSION_SETUP_LIST_SU_REQ, IE_PDU_SESSION_SETUP_LIST_CXT_REQ):
+        if ie_id in ies:
+            pdus.extend(setup_list_nas_pdus(ies[ie_id]))
+    return pdus
+
+
+# --- NAS ---
+
+EPD_5GMM = 0x7E
+EPD_5GSM = 0x2E
+
+REGISTRATION_REQUEST, REGISTRATION_ACCEPT, REGISTRATION_COMPLETE, REGISTRATION_REJECT = 0x41, 0x42, 0x43, 0x44
+IDENTITY_RESPONSE = 0x5C
+DEREGISTRATION_REQUEST_UE, DEREGISTRATION_ACCEPT_UE = 0x45, 0x46
+SERVICE_REQUEST, SERVICE_REJECT, SERVICE_ACCEPT = 0x4C, 0x4D, 0x4E
+UL_NAS_TRANSPORT, DL_NAS_TRANSPORT = 0x67, 0x68
+PDU_SESSION_ESTABLISHMENT_REQUEST, PDU_SESSION_ESTABLISHMENT_ACCEPT, PDU_SESSION_ESTABLISHMENT_REJECT = 0xC1, 0xC2, 0xC3
+PDU_SESSION_RELEASE_REQUEST, PDU_SESSION_RELEASE_REJECT, PDU_SESSION_RELEASE_COMMAND = 0xD1, 0xD2, 0xD3
+
+# NAS procedure: start message -> {end message: outcome}
+NAS_PROCEDURES = {
+    "Registration": (REGISTRATION_REQUEST, {REGISTRATION_ACCEPT: "ok", REGISTRATION_REJECT: "reject"}),
+    "ServiceRequest": (SERVICE_REQUEST, {SERVICE_ACCEPT: "ok", SERVICE_REJECT: "reject"}),
+    "Deregistration": (DEREGISTRATION_REQUEST_UE, {DEREGISTRATION_ACCEPT_UE: "ok"}),
+    "PDUSessionEstablishment": (PDU_SESSION_ESTABLISHMENT_REQUEST,
+                                {PDU_SESSION_ESTABLISHMENT_ACCEPT: "ok", PDU_SESSION_ESTABLISHMENT_REJECT: "reject"}),
+    "PDUSessionRelease": (PDU_SESSION_RELEASE_REQUEST,
+                          {PDU_SESSION_RELEASE_COMMAND: "ok", PDU_SESSION_RELEASE_REJECT: "reject"}),
+}
+NAS_STARTS = {start: name for name, (start, _) in NAS_PROCEDURES.items()}
+NAS_ENDS = {end: (name, outcome) for name, (_, ends) in NAS_PROCEDURES.items() for end, outcome in ends.items()}
+SM_MESSAGES = {PDU_SESSION_ESTABLISHMENT_REQUEST, PDU_SESSION_ESTABLISHMENT_ACCEPT, PDU_SESSION_ESTABLISHMENT_REJECT,
+               PDU_SESSION_RELEASE_REQUEST, PDU_SESSION_RELEASE_REJECT, PDU_SESSION_RELEASE_COMMAND}
+
+
+def bcd(octets, skip_first_low=False):
+    digits = []
+    for i, octet in enumerate(octets):
+        for nibble in ((octet >> 4,) if i == 0 and skip_first_low else (octet & 0x0F, octet >> 4)):
+            if nibble == 0x0F:
+                return "".join(digits)
+            digits.append(str(nibble))
+    return "".join(digits)
+
+
+def plmn(octets):
+    mcc = f"{octets[0] & 0x0F}{octets[0] >> 4}{octets[1] & 0x0F}"
+    mnc = f"{octets[2] & 0x0F}{octets[2] >> 4}" + ("" if octets[1] >> 4 == 0x0F else str(octets[1] >> 4))
+    return mcc + mnc
+
+
+def mobile_identity(value):
+    """('supi', 'imsi-...') for a null-scheme SUCI, ('guti', key) for a 5G-GUTI, else (None, None)."""
+    if not value:
+        return None, None
+    kind = value[0] & 0x07
+    if kind == 1 and (value[0] >> 4) & 0x07 == 0 and len(value) >= 8:
+        if value[6] & 0x0F != 0:
+            return None, None  # concealed MSIN (profile A/B): not recoverable from the capture
+        return "supi", f"imsi-{plmn(value[1:4])}{bcd(value[8:])}"
+    if kind == 2 and len(value) >= 11:
+        return "guti", bytes(value[1:11])
+    return None, None
+
+
+def plain_nas(pdu):
+    """The plain NAS message inside pdu, or None if it is ciphered with something other than NEA0."""
+    if len(pdu) < 3:
+        return None
+    if pdu[0] == EPD_5GMM and pdu[1] & 0x0F:
+        inner = pdu[7:]
+        # With NEA0 the "ciphered" payload is the plain message; otherwise it will not parse
+        return inner if len(inner) >= 3 and inner[0] in (EPD_5GMM, EPD_5GSM) else None
+    return pdu
+
+
+def nas_optional_ies(msg, at, iei_wanted):
+    """Walk type-1/3/4/6 optional IEs from offset at; returns {iei: value} for those wanted."""
+    found = {}
+    while at < len(msg):
+        iei = msg[at]
+        if iei >> 4 in (0x8, 0x9, 0xA, 0xB, 0xC, 0xD):  # type 1: IEI and value in one octet
+            at += 1
+            continue
+        if iei in (0x59, 0x56):  # 5GSM cause, RQ timer value: type 3, one octet
+            at += 2
+            continue
+        if iei >> 4 == 0x7:  # type 6: 2-octet length
+            length, start = struct.unpack_from(">H", msg, at + 1)[0], at + 3
+        else:
+            length, start = msg[at + 1], at + 2
+        if iei in iei_wanted:
+            found[iei] = msg[start:start + length]
+        at = start + length
+    return found
+
+
+def decode_dnn(value):
+    labels, at = [], 0
+    while at < len(value):
+        length = value[at]
+        labels.append(bytes(value[at + 1:at + 1 + length]).decode("ascii", "replace"))
+        at += 1 + length
+    return ".".join(labels)
+
+
+def nas_events(pdu):
+    """
+    (message type, pdu session id or None, details) for the messages in a NAS PDU;
+    an UL/DL NAS Transport yields the 5GSM message it carries.
+    """
+    msg = plain_nas(pdu)
+    if msg is None:
+        return
+    if msg[0] == EPD_5GSM and len(msg) >= 4:
+        yield from sm_event(msg)
+        return
+    if msg[0] != EPD_5GMM:
+        return
+    msg_type = msg[2]
+    if msg_type in (UL_NAS_TRANSPORT, DL_NAS_TRANSPORT) and len(msg) >= 6:
+        if msg[3] & 0x0F == 1:  # payload container: N1 SM information
+            length = struct.unpack_from(">H", msg, 4)[0]
+            inner = msg[6:6 + length]
+            if len(inner) >= 4 and inner[0] == EPD_5GSM:
+                yield from sm_event(inner)
+        return
+    details = {}
+    if msg_type in (REGISTRATION_REQUEST, IDENTITY_RESPONSE) and len(msg) >= 6:
+        # Registration Request: ngKSI/type octet, then the identity; Identity Response: the identity
+        at = 4 if msg_type == REGISTRATION_REQUEST else 3
+        length = struct.unpack_from(">H", msg, at)[0]
+        kind, identity = mobile_identity(msg[at + 2:at + 2 + length])
+        if kind:
+            details[kind] = identity
+    elif msg_type == REGISTRATION_ACCEPT and len(msg) >= 4:
+        ies = nas_optional_ies(msg, 4 + msg[3], (0x77,))
+        if 0x77 in ies:
+            kind, identity = mobile_identity(ies[0x77])
+            if kind == "guti":
+                details["guti"] = identity
+    yield msg_type, None, details
+
+
+def sm_event(msg):
+    msg_type, session_id = msg[3], msg[1]
+    details = {}
+    if msg_type == PDU_SESSION_ESTABLISHMENT_ACCEPT and len(msg) >= 7:
+        # Selected type/SSC mode, authorized QoS rules (LV-E), session AMBR (LV), then optional IEs
+        at = 5 + struct.unpack_from(">H", msg, 5)[0] + 2
+        at += 1 + msg[at]
+        ies = nas_optional_ies(msg, at, (0x29, 0x25))
+        address = ies.get(0x29)
+        if address is not None and len(address) >= 5:
+            kind = address[0] & 0x07
+            if kind in (1, 3):
+                details["ipv4"] = format_ip(bytes(address[1:5]))
+            if kind in (2, 3):
+                iid = bytes(address[1:9] if kind == 2 else address[5:13])
+                details["ipv6_iid"] = iid.hex()
+        if 0x25 in ies:
+            details["dnn"] = decode_dnn(ies[0x25])
+    yield msg_type, session_id, details
+
+
+# --- statistics ---
+
+class LatencyHistogram:
+    """Log-bucketed (about 2% wide) latency histogram: fixed memory, percentiles within a bucket."""
+
+    GROWTH = 1.02
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.outcomes = collections.Counter()
+
+    def add(self, seconds, outcome="ok"):
+        self.outcomes[outcome] += 1
+        if seconds < 0:
+            return
+        micros = max(seconds * 1e6, 1.0)
+        self.buckets[int(math.log(micros, self.GROWTH))] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                value = self.GROWTH ** (bucket + 0.5) / 1e6
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        ms = lambda v: None if v is None else round(v * 1000, 3)
+        return {
+            "count": self.count,
+            "outcomes": dict(self.outcomes),
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self.percentile(0.50)),
+            "p90_ms": ms(self.percentile(0.90)),
+            "p99_ms": ms(self.percentile(0.99)),
+            "max_ms": ms(self.max) if self.count else None,
+        }
+
+
+class Analyzer:
+    """Pairs requests with responses per UE and collects latencies and UE IP assignments."""
+
+    def __init__(self, pair_timeout=60.0, on_ip=None, max_gutis=1000000):
+        self.pair_timeout = pair_timeout
+        self.max_gutis = max_gutis
+        self.on_ip = on_ip
+        self.sctp = SctpReader()
+        self.stats = collections.defaultdict(LatencyHistogram)
+        self.pending = {}          # (kind, key...) -> (start ts, name)
+        self.ues = {}              # (association, RAN-UE-NGAP-ID) -> {"supi": ..., "seen": ts}
+        self.supi_by_guti = collections.OrderedDict()  # newest max_gutis 5G-GUTI -> SUPI
+        self.counts = collections.Counter()
+        self._last_sweep = None
+
+    def feed(self, ts, linktype, frame):
+        self.counts["frames"] += 1
+        try:
+            packet = ip_payload(linktype, frame)
+            parsed = sctp_segment(packet) if packet is not None else None
+        except (IndexError, struct.error):
+            parsed = None  # snapped or malformed frame
+        if parsed is None:
+            return
+        src, dst, segment = parsed
+        self.counts["sctp_packets"] += 1
+        association = (src, dst) if src <= dst else (dst, src)
+        for message in self.sctp.messages(src, dst, segment):
+            self.counts["ngap_messages"] += 1
+            try:
+                self.on_ngap(ts, association, message)
+            except (AperError, IndexError, struct.error):
+                self.counts["ngap_undecoded"] += 1
+        if self._last_sweep is None or ts - self._last_sweep >= self.pair_timeout:
+            self.sweep(ts)
+
+    def on_ngap(self, ts, association, pdu):
+        kind, procedure, ies = decode_ngap(pdu)
+        amf_id, ran_id = ngap_ue_ids(ies)
+
+        # Class-1 procedures: initiating message -> successful/unsuccessful outcome.
+        # AMF-initiated ones may name the UE by AMF-UE-NGAP-ID alone, so that is the key.
+        if procedure in NGAP_CLASS1:
+            name = NGAP_PROCEDURES.get(procedure, f"proc-{procedure}")
+            key = ("ngap", association, procedure, amf_id if amf_id is not None else ran_id)
+            if kind == INITIATING:
+                self.pending[key] = (ts, f"NGAP {name}")
+            else:
+                started = self.pending.pop(key, None)
+                if started is not None:
+                    self.stats[started[1]].add(ts - started[0], "ok" if kind == SUCCESSFUL else "unsuccessful")
+
+        if ran_id is None:
+            return
+        ue_key = (association, ran_id)
+        ue = self.ues.get(ue_key)
+        if ue is None:
+            ue = self.ues[ue_key] = {"supi": None}
+        ue["seen"] = ts
+        if procedure == 41 and kind == SUCCESSFUL:
+            # UE context released: its NGAP IDs may be reused from here on
+            self.ues.pop(ue_key, None)
+        for nas in ngap_nas_pdus(ies):
+            self.counts["nas_messages"] += 1
+            decoded = False
+            for msg_type, session_id, details in nas_events(nas):
+                decoded = True
+                self.on_nas(ts, ue_key, ue, msg_type, session_id, details)
+            if not decoded:
+                self.counts["nas_undecoded"] += 1
+
+    def on_nas(self, ts, ue_key, ue, msg_type, session_id, details):
+        if "supi" in details:
+            ue["supi"] = details["supi"]
+        elif "guti" in details:
+            if msg_type == REGISTRATION_ACCEPT and ue["supi"]:
+                self.supi_by_guti[details["guti"]] = ue["supi"]
+                self.supi_by_guti.move_to_end(details["guti"])
+                if len(self.supi_by_guti) > self.max_gutis:
+                    self.supi_by_guti.popitem(last=False)
+            elif ue["supi"] is None:
+                ue["supi"] = self.supi_by_guti.get(details["guti"])
+        session_key = session_id if msg_type in SM_MESSAGES else None
+        if msg_type in NAS_STARTS:
+            self.pending[("nas", ue_key, NAS_STARTS[msg_type], session_key)] = (ts, NAS_STARTS[msg_type])
+        elif msg_type in NAS_ENDS:
+            name, outcome = NAS_ENDS[msg_type]
+            started = self.pending.pop(("nas", ue_key, name, session_key), None)
+            if started is not None:
+                self.stats[name].add(ts - started[0], outcome)
+            else:
+                self.counts["nas_unpaired"] += 1
+        if msg_type == PDU_SESSION_ESTABLISHMENT_ACCEPT and "ipv4" in details:
+            self.counts["ue_ips"] += 1
+            if self.on_ip is not None:
+                self.on_ip({"supi": ue["supi"], "ipv4Addr": details["ipv4"], "pduSessionId": session_id,
+                            "dnn": details.get("dnn"), "time": ts})
+
+    def sweep(self, now):
+        """Drop requests that never got a response and UEs idle for pair_timeout (capture time)."""
+        self._last_sweep = now
+        cutoff = now - self.pair_timeout
+        for key, (started, name) in list(self.pending.items()):
+            if started < cutoff:
+                del self.pending[key]
+                self.stats[name].add(-1, "no response")
+        for key, ue in list(self.ues.items()):
+            if ue["seen"] < cutoff:
+                del self.ues[key]
+
+    def finish(self):
+        for key, (started, name) in self.pending.items():
+            self.stats[name].add(-1, "no response")
+        self.pending.clear()
+        self.counts["sctp_retransmissions"] = self.sctp.retransmissions
+
+    def report(self):
+        return {"counts": dict(self.counts),
+                "procedures": {name: hist.summary() for name, hist in sorted(self.stats.items())}}
+
+
+# --- output ---
+
+class MongoSeeder:
+    """Upserts UE IP bindings ({ipv4Addr, supi, ...}) into the NEF's session collection in batches."""
+
+    def __init__(self, uri, db_name, collection, batch=1000):
+        import pymongo  # Only needed with --seed-mongo
+        self._replace = pymongo.ReplaceOne
+        self._client = pymongo.MongoClient(uri)
+        self.collection = self._client[db_name][collection]
+        self.collection.create_index("ipv4Addr")
+        self.batch = batch
+        self._ops = []
+        self.written = 0
+
+    def add(self, binding):
+        if not binding["supi"]:
+            return
+        doc = {k: v for k, v in binding.items() if k != "time"}
+        self._ops.append(self._replace({"ipv4Addr": doc["ipv4Addr"]}, doc, upsert=True))
+        if len(self._ops) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self._ops:
+            self.collection.bulk_write(self._ops, ordered=False)
+            self.written += len(self._ops)
+            self._ops = []
+
+    def close(self):
+        self.flush()
+        self._client.close()
+
+
+def print_report(report, out=sys.stdout):
+    counts = report["counts"]
+    print(f"{counts.get('frames', 0)} frames, {counts.get('ngap_messages', 0)} NGAP messages, "
+          f"{counts.get('nas_messages', 0)} NAS PDUs ({counts.get('nas_undecoded', 0)} not decodable), "
+          f"{counts.get('sctp_retransmissions', 0)} SCTP retransmissions, {counts.get('ue_ips', 0)} UE IPs", file=out)
+    print(f"\n{'procedure':38s} {'count':>7s} {'p50 ms':>9s} {'p90 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}  outcomes",
+          file=out)
+    fmt = lambda v: "-" if v is None else f"{v:.2f}"
+    for name, s in report["procedures"].items():
+        outcomes = ", ".join(f"{k}={v}" for k, v in sorted(s["outcomes"].items()))
+        print(f"{name:38s} {s['count']:7d} {fmt(s['p50_ms']):>9s} {fmt(s['p90_ms']):>9s} "
+              f"{fmt(s['p99_ms']):>9s} {fmt(s['max_ms']):>9s}  {outcomes}", file=out)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="NGAP/NAS procedure latency and UE IP extraction from AMF pcaps")
+    parser.add_argument("pcap", nargs="+", help="pcap file(s), analysed in order")
+    parser.add_argument("--json", help="Also write the report as JSON to this file")
+    parser.add_argument("--ip-map", help="Write UE IP assignments (supi, ipv4Addr, pduSessionId, dnn) as JSON lines")
+    parser.add_argument("--seed-mongo", metavar="URI", help="Upsert UE IP assignments into MongoDB for the NEF")
+    parser.add_argument("--seed-db", default="free5gc")
+    parser.add_argument("--seed-collection", default="pcfBindings",
+                        help="Collection the NEF reads (see SESSION_SOURCES; default pcfBindings:ipv4Addr:supi)")
+    parser.add_argument("--pair-timeout", type=float, default=60.0,
+                        help="Capture seconds after which an unanswered request counts as 'no response'")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ip_file = open(args.ip_map, "w") if args.ip_map else None
+    seeder = MongoSeeder(args.seed_mongo, args.seed_db, args.seed_collection) if args.seed_mongo else None
+
+    def on_ip(binding):
+        if ip_file is not None:
+            ip_file.write(json.dumps(binding) + "\n")
+        if seeder is not None:
+            seeder.add(binding)
+
+    analyzer = Analyzer(pair_timeout=args.pair_timeout, on_ip=on_ip)
+    try:
+        for path in args.pcap:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                for ts, linktype, frame in pcap_records(mm):
+                    analyzer.feed(ts, linktype, frame)
+                    frame.release()
+        analyzer.finish()
+    finally:
+        if ip_file is not None:
+            ip_file.close()
+        if seeder is not None:
+            seeder.close()
+            print(f"Seeded {seeder.written} UE IP bindings into {args.seed_db}.{args.seed_collection}")
+
+    report = analyzer.report()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,23 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
 import pymongo
 import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pymongo import ReplaceOne
 
 # Configuration
 MONGO_URI = "mongodb://db:27017/"
 DB_NAME = "free5gc"
 COLLECTION = "subscriptionData.provisionedData.smData"
+AUTH_COLLECTION = "subscriptionData.authenticationData.authenticationSubscription"
+AM_COLLECTION = "subscriptionData.provisionedData.amData"
+SM_COLLECTION = "subscriptionData.provisionedData.smData"
+DEFAULT_OPC = "981d464c7c52eb6e5036234984ad0bcf"
+DEFAULT_KEY = "8baf473f2f8fd09487cccbd7097c6862"
 
 # We actually need to populate multiple collections for a full subscription:
 # 1. subscriptionData.authenticationData.authenticationSubscription
@@ -119,5 +132,174 @@ def provision():
         
         print(f"[OK] {imsi} inserted into MongoDB.")
 
+# --- Bulk mode ---
+# python provision_db.py --imsi-start 208930000100000 --msisdn-start 2000000000 --count 1000000
+# python provision_db.py --csv subscribers.csv        (columns: imsi,msisdn[,opc,key])
+#
+# Subscribers are written in batches of unordered bulk upserts, one batch per
+# task on a process pool (each worker has its own MongoClient). Completed
+# batches go to a checkpoint file, so a rerun after an interruption skips
+# them; upserts make replaying a half-written batch harmless.
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bulk-provision free5GC subscribers directly into MongoDB")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--count", type=int, help="Generate this many subscribers from --imsi-start/--msisdn-start")
+    source.add_argument("--csv", help="Read subscribers from a CSV file with imsi,msisdn[,opc,key] columns")
+    parser.add_argument("--imsi-start", default="208930000100000", help="First IMSI of a generated range")
+    parser.add_argument("--msisdn-start", default="2000000000", help="First MSISDN of a generated range")
+    parser.add_argument("--opc", default=DEFAULT_OPC, help="OPc for subscribers without one")
+    parser.add_argument("--key", default=DEFAULT_KEY, help="K for subscribers without one")
+    parser.add_argument("--mongo-uri", default=MONGO_URI)
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Subscribers per bulk_write batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Writer processes")
+    parser.add_argument("--checkpoint", default="provision_db.checkpoint.json",
+                        help="Progress file used to resume an interrupted run")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    return parser.parse_args()
+
+def ensure_indexes(db):
+    """Indexes for the UDR's lookups (and for the upserts' filters, which would otherwise scan)."""
+    db[AUTH_COLLECTION].create_index("ueId")
+    db[AM_COLLECTION].create_index([("ueId", 1), ("servingPlmnId", 1)])
+    db[AM_COLLECTION].create_index("gpsis")
+    db[SM_COLLECTION].create_index([("ueId", 1), ("servingPlmnId", 1), ("singleNssai.sst", 1), ("singleNssai.sd", 1)])
+
+def range_batches(args):
+    """(batch_id, task) for a generated IMSI/MSISDN range; workers expand the task."""
+    for batch_id, offset in enumerate(range(0, args.count, args.batch_size)):
+        yield batch_id, ("range", args.imsi_start, args.msisdn_start, offset,
+                         min(args.batch_size, args.count - offset), args.opc, args.key)
+
+def csv_batches(args):
+    """(batch_id, task) for each batch_size rows of the CSV, read as a stream."""
+    with open(args.csv, newline="") as f:
+        reader = csv.reader(f)
+        batch, batch_id = [], 0
+        for row in reader:
+            if not row or not row[0].strip().isdigit():
+                continue  # blank lines and the header
+            imsi, msisdn = row[0].strip(), row[1].strip()
+            opc = row[2].strip() if len(row) > 2 and row[2].strip() else args.opc
+            key = row[3].strip() if len(row) > 3 and row[3].strip() else args.key
+            batch.append((imsi, msisdn, opc, key))
+            if len(batch) == args.batch_size:
+                yield batch_id, ("rows", batch)
+                batch, batch_id = [], batch_id + 1
+        if batch:
+            yield batch_id, ("rows", batch)
+
+def task_rows(task):
+    if task[0] == "rows":
+        return task[1]
+    _, imsi_start, msisdn_start, offset, count, opc, key = task
+    first_imsi, first_msisdn = int(imsi_start) + offset, int(msisdn_start) + offset
+    return [(str(first_imsi + i).zfill(len(imsi_start)), str(first_msisdn + i).zfill(len(msisdn_start)), opc, key)
+            for i in range(count)]
+
+_worker_db = None
+
+def init_worker(mongo_uri, db_name):
+    global _worker_db
+    _worker_db = pymongo.MongoClient(mongo_uri)[db_name]
+
+def write_batch(batch_id, task):
+    """Upsert one batch into the three collections; returns (batch_id, subscribers written)."""
+    auth, am, sm = [], [], []
+    rows = task_rows(task)
+    for imsi, msisdn, opc, key in rows:
+        ue_id = f"imsi-{imsi}"
+        auth.append(ReplaceOne({"ueId": ue_id}, get_auth_subs_data(imsi, opc, key), upsert=True))
+        am.append(ReplaceOne({"ueId": ue_id, "servingPlmnId": "20893"}, get_am_data(imsi, msisdn), upsert=True))
+        sm.append(ReplaceOne({"ueId": ue_id, "servingPlmnId": "20893", "singleNssai.sst": 1, "singleNssai.sd": "010203"},
+                             get_sm_data(imsi), upsert=True))
+    _worker_db[AUTH_COLLECTION].bulk_write(auth, ordered=False)
+    _worker_db[AM_COLLECTION].bulk_write(am, ordered=False)
+    _worker_db[SM_COLLECTION].bulk_write(sm, ordered=False)
+    return batch_id, len(rows)
+
+def job_signature(args):
+    """Identifies the input, so a checkpoint from a different run is not applied."""
+    if args.csv:
+        st = os.stat(args.csv)
+        source = ["csv", os.path.abspath(args.csv), st.st_size, st.st_mtime]
+    else:
+        source = ["range", args.imsi_start, args.msisdn_start, args.count]
+    return hashlib.sha1(json.dumps(source + [args.batch_size, args.db]).encode()).hexdigest()
+
+def load_checkpoint(args, signature):
+    if args.restart or not os.path.exists(args.checkpoint):
+        return set()
+    with open(args.checkpoint) as f:
+        state = json.load(f)
+    if state.get("job") != signature:
+        print(f"[!] {args.checkpoint} belongs to a different run; starting from the beginning")
+        return set()
+    return set(state["done"])
+
+def save_checkpoint(args, signature, done):
+    tmp = args.checkpoint + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"job": signature, "done": sorted(done)}, f)
+    os.replace(tmp, args.checkpoint)
+
+def provision_bulk(args):
+    client = pymongo.MongoClient(args.mongo_uri)
+    ensure_indexes(client[args.db])
+    client.close()
+
+    signature = job_signature(args)
+    done = load_checkpoint(args, signature)
+    if done:
+        print(f"Resuming: {len(done)} batches already written")
+    batches = csv_batches(args) if args.csv else range_batches(args)
+    total = args.count if args.count is not None else None
+
+    written = 0
+    start = last_report = last_save = time.monotonic()
+    inflight = set()
+
+    def collect():
+        nonlocal written, last_report, last_save
+        finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            inflight.discard(future)
+            batch_id, count = future.result()
+            done.add(batch_id)
+            written += count
+        now = time.monotonic()
+        if now - last_save >= 5:
+            save_checkpoint(args, signature, done)
+            last_save = now
+        if now - last_report >= 2:
+            progress = f"/{total}" if total else ""
+            print(f"  {written}{progress} subscribers, {written / (now - start):.0f}/s")
+            last_report = now
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(args.mongo_uri, args.db)) as pool:
+            # Bounded submission: a streamed CSV is never loaded into memory all at once
+            for batch_id, task in batches:
+                if batch_id in done:
+                    continue
+                inflight.add(pool.submit(write_batch, batch_id, task))
+                if len(inflight) >= args.workers * 2:
+                    collect()
+            while inflight:
+                collect()
+    finally:
+        # Also on Ctrl-C or a failed batch: the rerun picks up from here
+        save_checkpoint(args, signature, done)
+
+    elapsed = time.monotonic() - start
+    print(f"[OK] {written} subscribers upserted in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f}/s, "
+          f"{3 * written / elapsed if elapsed else 0:.0f} documents/s)")
+
 if __name__ == "__main__":
-    provision()
+    if len(sys.argv) > 1:
+        provision_bulk(parse_args())
+    else:
+        # No arguments: the two test subscribers, as before
+        provision()
@@ -1,6 +1,14 @@
-import requests
+import argparse
+import csv
 import json
+import sys
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
 
 # Configuration
 WEBUI_URL = "http://localhost:5000"
@@ -8,34 +16,18 @@ API_ROOT = f"{WEBUI_URL}/api"
 
 OP_KEY = "8e27b6af487340f2ac63df" # Default Free5GC
 KEY = "8baf473f2f8fd09487cccbd7097c6862"
+OPC = "981d464c7c52eb6e5036234984ad0bcf"
+PLMN_ID = "20893"
 
 SUBSCRIBERS = [
     {"imsi": "208930000000003", "msisdn": "1234567891", "name": "UE1"},
     {"imsi": "208930000000004", "msisdn": "1234567892", "name": "UE2"}
 ]
 
-def login():
-    session = requests.Session()
-    try:
-        login_resp = session.post(f"{WEBUI_URL}/api/login", json={"username": "admin", "password": "free5gc"})
-        if login_resp.status_code == 200:
-             print("Login successful.")
-             token = login_resp.json().get("token")
-             return session, {"Authorization": f"Bearer {token}"}
-    except Exception:
-        pass
-    print("Login failed or not needed, trying without auth...")
-    return session, {}
-
-def provision_subscriber(session, headers, sub):
-    imsi = sub['imsi']
-    msisdn = sub['msisdn']
-    name = sub['name']
-    
-    print(f"[{name}] Provisioning IMSI {imsi} (MSISDN {msisdn})...")
-
-    ue_data = {
-        "plmnID": "20893",
+def subscriber_data(imsi, msisdn, plmn=PLMN_ID, opc=OPC, key=KEY):
+    """WebUI subscriber document for one UE."""
+    return {
+        "plmnID": plmn,
         "ueId": f"imsi-{imsi}",
         "AuthenticationSubscription": {
             "authenticationManagementField": "8000",
@@ -50,12 +42,12 @@ def provision_subscriber(session, headers, sub):
             "opc": {
                 "encryptionAlgorithm": 0,
                 "encryptionKey": 0,
-                "opValue": "981d464c7c52eb6e5036234984ad0bcf" 
+                "opValue": opc
             },
             "permanentKey": {
                 "encryptionAlgorithm": 0,
                 "encryptionKey": 0,
-                "permanentKeyValue": KEY
+                "permanentKeyValue": key
             },
             "sequenceNumber": "16f3b3f70fc2"
         },
@@ -97,37 +89,161 @@ def provision_subscriber(session, headers, sub):
         ]
     }
 
-    url = f"{WEBUI_URL}/api/subscriber/imsi-{imsi}/20893"
-    
-    try:
-        resp = session.post(url, json=ue_data, headers=headers)
-        if resp.status_code in [200, 201]:
-            print(f"[OK] {name} provisioned successfully!")
-        elif resp.status_code == 401:
-             print(f"[INFO] 401 Unauthorized. Retrying without auth header...")
-             resp = session.post(url, json=ue_data) # Try without headers
-             if resp.status_code in [200, 201]:
-                 print(f"[OK] {name} provisioned (no-auth).")
-             else:
-                 print(f"[FAIL] Retry failed: {resp.status_code} - {resp.text}")
+class WebUIClient:
+    """
+    One pooled, authenticated session to the free5GC WebUI, shared by all
+    worker threads. The token is refreshed (once, however many threads see
+    the 401) when the WebUI rejects it.
+    """
+
+    def __init__(self, base_url, username, password, pool_size=32, timeout=10):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._headers = {}
+        self._generation = 0
+        self.refreshes = 0
+
+    def login(self, quiet=False):
+        try:
+            resp = self.session.post(f"{self.base_url}/api/login", timeout=self.timeout,
+                                     json={"username": self.username, "password": self.password})
+            if resp.status_code == 200:
+                body = resp.json()
+                token = body.get("access_token") or body.get("token")
+                # Newer WebUIs read 'Token', older ones 'Authorization: Bearer'
+                self._headers = {"Token": token, "Authorization": f"Bearer {token}"} if token else {}
+                if not quiet:
+                    print("Login successful.")
+                return True
+            print(f"[INFO] Login returned {resp.status_code}; continuing without auth")
+        except (requests.RequestException, ValueError) as e:
+            print(f"[INFO] Login failed ({e}); continuing without auth")
+        self._headers = {}
+        return False
+
+    def _refresh(self, seen_generation):
+        with self._lock:
+            # Another thread already re-logged in since this request was sent
+            if self._generation == seen_generation:
+                self.login(quiet=True)
+                self._generation += 1
+                self.refreshes += 1
+
+    def put_subscriber(self, imsi, msisdn, plmn=PLMN_ID, retries=2):
+        """
+        Create or replace one subscriber with a single PUT (the WebUI upserts),
+        so reruns are idempotent. Returns the final status code.
+        """
+        url = f"{self.base_url}/api/subscriber/imsi-{imsi}/{plmn}"
+        data = subscriber_data(imsi, msisdn, plmn)
+        attempt = 0
+        while True:
+            generation, headers = self._generation, self._headers
+            try:
+                resp = self.session.put(url, json=data, headers=headers, timeout=self.timeout)
+            except requests.RequestException:
+                if attempt >= retries:
+                    raise
+            else:
+                if resp.status_code == 401 and attempt < retries:
+                    # Token expired: log in again (once across threads) and retry right away
+                    self._refresh(generation)
+                    attempt += 1
+                    continue
+                if resp.status_code < 500 or attempt >= retries:
+                    return resp.status_code
+            attempt += 1
+            time.sleep(0.2 * 2 ** attempt)
+
+def read_subscribers(path):
+    """Stream (imsi, msisdn) pairs from a CSV (imsi,msisdn[,...]) or JSON-lines file."""
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    sub = json.loads(line)
+                    yield str(sub["imsi"]), str(sub["msisdn"])
         else:
-            # If 409 conflict (already exists), we can try PUT or just ignore
-            if resp.status_code == 409 or "exist" in resp.text:
-                 # Try PUT to update
-                 print(f"[INFO] {name} exists. Updating...")
-                 resp = session.put(url, json=ue_data, headers=headers)
-                 if resp.status_code in [200, 204]:
-                     print(f"[OK] {name} updated.")
-                 else:
-                     print(f"[FAIL] Failed to update {name}: {resp.status_code}")
+            for row in csv.reader(f):
+                if row and row[0].strip().isdigit():
+                    yield row[0].strip(), row[1].strip()
+
+def provision_all(client, subscribers, concurrency=32, plmn=PLMN_ID):
+    """PUT every (imsi, msisdn) with at most `concurrency` requests in flight; prints a summary."""
+    ok = 0
+    failures = Counter()
+    examples = []
+    start = last_report = time.monotonic()
+    inflight = {}
+
+    def collect():
+        nonlocal ok, last_report
+        finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+        for future in finished:
+            imsi = inflight.pop(future)
+            try:
+                status = future.result()
+                reason = None if status in (200, 201, 204) else f"HTTP {status}"
+            except requests.RequestException as e:
+                reason = type(e).__name__
+            if reason is None:
+                ok += 1
             else:
-                print(f"[FAIL] Failed to provision {name}: {resp.status_code} - {resp.text}")
+                failures[reason] += 1
+                if len(examples) < 10:
+                    examples.append(f"imsi-{imsi}: {reason}")
+        now = time.monotonic()
+        if now - last_report >= 2:
+            print(f"  {ok} provisioned, {sum(failures.values())} failed, {ok / (now - start):.0f}/s")
+            last_report = now
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Bounded: the input file is streamed, never read into memory
+        for imsi, msisdn in subscribers:
+            inflight[pool.submit(client.put_subscriber, imsi, msisdn, plmn)] = imsi
+            if len(inflight) >= concurrency:
+                collect()
+        while inflight:
+            collect()
+
+    elapsed = time.monotonic() - start
+    failed = sum(failures.values())
+    print(f"\n[{'OK' if not failed else 'DONE'}] {ok} provisioned, {failed} failed in {elapsed:.1f}s "
+          f"({(ok + failed) / elapsed if elapsed else 0:.1f} req/s)")
+    if client.refreshes:
+        print(f"  token refreshed {client.refreshes} time(s)")
+    for reason, count in failures.most_common():
+        print(f"  {reason}: {count}")
+    for example in examples:
+        print(f"  e.g. {example}")
+    return failed == 0
 
-    except Exception as e:
-        print(f"[FAIL] Error connecting to WebUI: {e}")
+def parse_args():
+    parser = argparse.ArgumentParser(description="Provision subscribers through the free5GC WebUI API")
+    parser.add_argument("--file", help="CSV (imsi,msisdn) or .jsonl file to stream subscribers from; "
+                                       "without it the two test UEs are provisioned")
+    parser.add_argument("--webui-url", default=WEBUI_URL)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="free5gc")
+    parser.add_argument("--plmn", default=PLMN_ID, help="Serving PLMN ID")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight")
+    parser.add_argument("--timeout", type=float, default=10, help="Per-request timeout in seconds")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    session, headers = login()
-    for sub in SUBSCRIBERS:
-        provision_subscriber(session, headers, sub)
-        time.sleep(1)
+    args = parse_args()
+    client = WebUIClient(args.webui_url, args.username, args.password,
+                         pool_size=args.concurrency, timeout=args.timeout)
+    client.login()
+    if args.file:
+        subscribers = read_subscribers(args.file)
+    else:
+        subscribers = ((sub["imsi"], sub["msisdn"]) for sub in SUBSCRIBERS)
+    sys.exit(0 if provision_all(client, subscribers, args.concurrency, args.plmn) else 1)
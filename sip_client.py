@@ -2,6 +2,9 @@ import socket
 import sys
 import time
 import argparse
+import itertools
+import random
+import selectors
 import threading
 
 # Configuration
@@ -17,18 +20,37 @@ def parse_args():
     reg_parser.add_argument("--sip-user", required=True, help="SIP URI User (e.g. msisdn)")
     reg_parser.add_argument("--local-ip", required=True, help="Local IP of this UE")
     reg_parser.add_argument("--local-port", type=int, default=5060, help="Local SIP Port")
+    reg_parser.add_argument("--expires", type=int, default=3600, help="Registration lifetime in seconds (0 unregisters)")
 
     # Send Command
     send_parser = subparsers.add_parser("send", help="Send SMS (SIP MESSAGE)")
     send_parser.add_argument("--sip-user", required=True, help="Sender SIP URI User")
     send_parser.add_argument("--to", required=True, help="Recipient SIP URI User")
     send_parser.add_argument("--msg", required=True, help="Message Body")
+    send_parser.add_argument("--local-ip", default="0.0.0.0", help="Local IP advertised in Via")
     send_parser.add_argument("--local-port", type=int, default=5060, help="Local SIP Port")
 
     # Listen Command
     listen_parser = subparsers.add_parser("listen", help="Listen for incoming SIP messages")
     listen_parser.add_argument("--local-ip", required=True, help="Local IP to bind")
     listen_parser.add_argument("--local-port", type=int, default=5060, help="Local SIP Port")
+    listen_parser.add_argument("--quiet", action="store_true", help="Print a count per second instead of every message")
+
+    # Load generator
+    load_parser = subparsers.add_parser("loadgen", help="Simulate many UEs sending REGISTER/MESSAGE traffic")
+    load_parser.add_argument("--local-ip", required=True, help="Local IP to bind (and advertise in Contact/Via)")
+    load_parser.add_argument("--ues", type=int, default=100, help="Number of simulated UEs (one UDP socket each)")
+    load_parser.add_argument("--user-base", type=int, default=1000000000, help="SIP user of the first UE; the others follow")
+    load_parser.add_argument("--base-port", type=int, default=0, help="Local port of the first UE (0: ephemeral ports)")
+    load_parser.add_argument("--server-port", type=int, default=SMSC_PORT, help="SMSC SIP port")
+    load_parser.add_argument("--rate", type=float, default=100, help="Target requests per second")
+    load_parser.add_argument("--arrival", choices=("constant", "poisson"), default="constant",
+                             help="constant: evenly spaced; poisson: open-loop exponential inter-arrivals")
+    load_parser.add_argument("--duration", type=float, default=10, help="Seconds of traffic after the initial REGISTERs")
+    load_parser.add_argument("--register-ratio", type=float, default=0.05,
+                             help="Share of generated requests that are re-REGISTERs (the rest are MESSAGEs)")
+    load_parser.add_argument("--timeout", type=float, default=2, help="Seconds before an unanswered request counts as lost")
+    load_parser.add_argument("--msg", default="load test", help="MESSAGE body")
 
     # Global arg for server IP (hacky insertion but works for verified structure)
     parser.add_argument("--server-ip", default="172.18.4.30", help="SMSC/SIP Server IP")
@@ -55,6 +77,7 @@ def cmd_register(args):
         f"Call-ID: {call_id}\r\n"
         f"CSeq: 1 REGISTER\r\n"
         f"Contact: {contact}\r\n"
+        f"Expires: {args.expires}\r\n"
         f"Content-Length: 0\r\n"
         f"\r\n"
     )
@@ -86,28 +109,224 @@ def cmd_send(args):
         f"Call-ID: {call_id}\r\n"
         f"CSeq: 1 MESSAGE\r\n"
         f"Content-Type: text/plain\r\n"
-        f"Content-Length: {len(body)}\r\n"
+        f"Content-Length: {len(body.encode('utf-8'))}\r\n"
         f"\r\n"
         f"{body}"
     )
     print(f"Sending MESSAGE to {args.to}...")
     udp_send(msg, args.server_ip, SMSC_PORT)
 
+def ok_response(request_text):
+    """200 OK echoing the request's Via, From, To, Call-ID and CSeq."""
+    head = request_text.split("\r\n\r\n", 1)[0].split("\r\n")[1:]
+    echoed = [line for line in head
+              if line.split(":", 1)[0].strip().lower() in ("via", "v", "from", "f", "to", "t", "call-id", "i", "cseq")]
+    return "SIP/2.0 200 OK\r\n" + "".join(line + "\r\n" for line in echoed) + "Content-Length: 0\r\n\r\n"
+
 def cmd_listen(args):
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((args.local_ip, args.local_port))
     print(f"Listening on {args.local_ip}:{args.local_port}...")
     
+    received = 0
+    last_report = time.monotonic()
     while True:
-        data, addr = sock.recvfrom(4096)
+        data, addr = sock.recvfrom(65535)
         text = data.decode('utf-8')
-        print(f"\n[Received from {addr}]:")
-        print(text)
+        if args.quiet:
+            received += 1
+            now = time.monotonic()
+            if now - last_report >= 1:
+                print(f"{received / (now - last_report):.0f} msg/s")
+                received = 0
+                last_report = now
+        else:
+            print(f"\n[Received from {addr}]:")
+            print(text)
         
-        # Simple auto-reply 200 OK for messages to stop retransmissions (simulated)
-        if "MESSAGE" in text.splitlines()[0]:
-             # Extract Call-ID etc to reply? Simplified: Just print for now.
-             pass
+        # Auto-reply 200 OK to MESSAGEs so the SMSC stops retransmitting
+        if text.startswith("MESSAGE "):
+            sock.sendto(ok_response(text).encode('utf-8'), addr)
+
+def header_value(text, *names):
+    """First header among names (long and compact forms) in a SIP message, or None."""
+    for line in text.split("\r\n\r\n", 1)[0].split("\r\n")[1:]:
+        name, sep, value = line.partition(":")
+        if sep and name.strip().lower() in names:
+            return value.strip()
+    return None
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+def sip_request(method, user, to_user, local_ip, local_port, call_id, domain="free5gc.org", body=""):
+    from_uri = f"sip:{user}@{domain}"
+    to_uri = f"sip:{to_user}@{domain}"
+    lines = [
+        f"{method} {'sip:' + domain if method == 'REGISTER' else to_uri} SIP/2.0",
+        f"Via: SIP/2.0/UDP {local_ip}:{local_port};branch=z9hG4bK-{call_id}",
+        f"From: <{from_uri}>;tag={user}",
+        f"To: <{to_uri}>",
+        f"Call-ID: {call_id}",
+        f"CSeq: 1 {method}",
+    ]
+    if method == "REGISTER":
+        lines.append(f"Contact: <sip:{user}@{local_ip}:{local_port}>")
+    else:
+        lines.append("Content-Type: text/plain")
+    lines.append(f"Content-Length: {len(body.encode('utf-8'))}")
+    return ("\r\n".join(lines) + "\r\n\r\n" + body).encode('utf-8')
+
+class LoadStats:
+    """Outstanding requests by Call-ID, and what became of them."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}  # call_id -> (method, sent_at)
+        self.sent = {}
+        self.ok = {}
+        self.failed = {}
+        self.latencies = {}
+        self.delivered = 0
+
+    def on_sent(self, method, call_id, now):
+        with self.lock:
+            self.pending[call_id] = (method, now)
+            self.sent[method] = self.sent.get(method, 0) + 1
+
+    def on_response(self, call_id, ok, now):
+        with self.lock:
+            entry = self.pending.pop(call_id, None)
+            if entry is None:
+                return  # a duplicate, or it already timed out
+            method, sent_at = entry
+            counts = self.ok if ok else self.failed
+            counts[method] = counts.get(method, 0) + 1
+            self.latencies.setdefault(method, []).append(now - sent_at)
+
+    def outstanding(self):
+        with self.lock:
+            return len(self.pending)
+
+def loadgen_receiver(selector, stats, stop):
+    """Match responses to requests by Call-ID; answer MESSAGEs the SMSC forwards to our UEs."""
+    while not stop.is_set():
+        for key, _ in selector.select(timeout=0.2):
+            sock = key.fileobj
+            while True:
+                try:
+                    data, addr = sock.recvfrom(65535)
+                except (BlockingIOError, InterruptedError):
+                    break
+                now = time.monotonic()
+                text = data.decode('utf-8', errors='replace')
+                if text.startswith("SIP/2.0 "):
+                    status = text[8:11]
+                    if status.isdigit() and int(status) >= 200:
+                        stats.on_response(header_value(text, "call-id", "i"), status.startswith("2"), now)
+                elif text.startswith("MESSAGE "):
+                    with stats.lock:
+                        stats.delivered += 1
+                    try:
+                        sock.sendto(ok_response(text).encode('utf-8'), addr)
+                    except BlockingIOError:
+                        pass
+
+def cmd_loadgen(args):
+    server = (args.server_ip, args.server_port)
+    ues = []
+    selector = selectors.DefaultSelector()
+    for i in range(args.ues):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+        sock.bind((args.local_ip, args.base_port + i if args.base_port else 0))
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+        ues.append((str(args.user_base + i), sock, sock.getsockname()[1]))
+
+    stats = LoadStats()
+    stop = threading.Event()
+    receiver = threading.Thread(target=loadgen_receiver, args=(selector, stats, stop), daemon=True)
+    receiver.start()
+    call_ids = itertools.count(1)
+    run_id = f"{int(time.time())}-{random.randrange(1 << 16):04x}"
+
+    def send(method, ue, to_user, now):
+        user, sock, port = ue
+        call_id = f"lg-{run_id}-{next(call_ids)}"
+        body = args.msg if method == "MESSAGE" else ""
+        stats.on_sent(method, call_id, now)
+        try:
+            sock.sendto(sip_request(method, user, to_user, args.local_ip, port, call_id, body=body), server)
+        except BlockingIOError:
+            pass  # counted as lost
+
+    def paced(count, duration, pick):
+        """Send count requests (or until duration elapses) on the chosen arrival schedule."""
+        start = due = time.monotonic()
+        sent = 0
+        while sent < count:
+            now = time.monotonic()
+            if duration is not None and now - start >= duration:
+                break
+            if now < due:
+                time.sleep(due - now)
+                now = time.monotonic()
+            send(*pick(), now)
+            sent += 1
+            due += random.expovariate(args.rate) if args.arrival == "poisson" else 1 / args.rate
+        return sent, time.monotonic() - start
+
+    print(f"Registering {len(ues)} UEs ({ues[0][0]}..{ues[-1][0]}) with {server[0]}:{server[1]}...")
+    unregistered = iter(ues)
+
+    def register_next():
+        ue = next(unregistered)
+        return "REGISTER", ue, ue[0]
+
+    paced(len(ues), None, register_next)
+    deadline = time.monotonic() + args.timeout
+    while stats.outstanding() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    def pick():
+        ue = random.choice(ues)
+        if random.random() < args.register_ratio:
+            return "REGISTER", ue, ue[0]
+        return "MESSAGE", ue, random.choice(ues)[0]
+
+    print(f"Generating {args.rate:g} req/s ({args.arrival} arrivals) for {args.duration:g}s...")
+    with stats.lock:
+        sent_before = sum(stats.sent.values())
+    total, elapsed = paced(float("inf"), args.duration, pick)
+    # Give the last requests their full timeout before calling them lost
+    deadline = time.monotonic() + args.timeout
+    while stats.outstanding() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stop.set()
+    receiver.join()
+
+    with stats.lock:
+        lost = {}
+        for method, _ in stats.pending.values():
+            lost[method] = lost.get(method, 0) + 1
+        answered = sum(stats.ok.values()) + sum(stats.failed.values())
+        print(f"\nSent {total} requests in {elapsed:.1f}s (after {sent_before} initial REGISTERs): "
+              f"{total / elapsed:.1f} req/s offered, ~{(answered - sent_before) / elapsed:.1f} answered/s")
+        for method in sorted(stats.sent):
+            sent = stats.sent[method]
+            latencies = sorted(stats.latencies.get(method, []))
+            quantiles = "  ".join(
+                f"{name}={percentile(latencies, q) * 1000:.1f}ms" if latencies else f"{name}=-"
+                for name, q in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0))
+            )
+            print(f"{method:9s} sent={sent} ok={stats.ok.get(method, 0)} non-2xx={stats.failed.get(method, 0)} "
+                  f"lost={lost.get(method, 0)} ({100.0 * lost.get(method, 0) / sent:.2f}%)  {quantiles}")
+        print(f"MESSAGEs delivered to simulated UEs: {stats.delivered}")
+    for _, sock, _ in ues:
+        sock.close()
 
 if __name__ == "__main__":
     args = parse_args()
@@ -117,3 +336,5 @@ if __name__ == "__main__":
         cmd_send(args)
     elif args.command == "listen":
         cmd_listen(args)
+    elif args.command == "loadgen":
+        cmd_loadgen(args)